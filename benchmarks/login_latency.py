@@ -0,0 +1,95 @@
+"""Замер задержки входа в зависимости от числа пользователей.
+
+Хранилище пользователей наполняется до каждого из размеров по очереди,
+после чего замеряется поиск по имени и проверка пароля (путь login без
+вывода и проверки курсов) для случайных существующих пользователей.
+
+    python benchmarks/login_latency.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import random
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from valutatrade_hub.core.models import User  # noqa: E402
+from valutatrade_hub.core.repositories import (  # noqa: E402
+    UserRepository,
+    _shard_path,
+    _write_json_atomic,
+)
+
+PASSWORD = "password"
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def _username(user_id: int) -> str:
+    return f"user{user_id:07d}"
+
+
+def _populate(repository: UserRepository, root: Path, start: int,
+              stop: int) -> None:
+    """Добавление пользователей с id из [start, stop).
+
+    Записи пишутся тем же форматом, что и UserRepository.add, но без fsync
+    на каждую: иначе наполнение до миллиона пользователей занимает часы.
+    """
+    salt = secrets.token_hex(8)
+    user = User(0, "", "", salt)
+    user.change_password(PASSWORD)
+    template = user.to_dict()
+    for user_id in range(start, stop):
+        username = _username(user_id)
+        _write_json_atomic(_shard_path(root, username),
+                           {**template, "user_id": user_id, "username": username})
+    repository._write_sequence(stop - 1)
+
+
+def _login(repository: UserRepository, username: str) -> None:
+    user = repository.get_by_username(username)
+    if user is None or not user.verify_password(PASSWORD):
+        raise RuntimeError(f"Вход пользователя {username} не удался")
+
+
+def _measure(repository: UserRepository, size: int, logins: int) -> list:
+    latencies = []
+    for _ in range(logins):
+        username = _username(random.randint(1, size))
+        started = time.perf_counter()
+        _login(repository, username)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Задержка входа от числа "
+                                                 "пользователей")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Число пользователей для замеров")
+    parser.add_argument("--logins", type=int, default=2000,
+                        help="Число входов на каждый размер")
+    parser.add_argument("--data-dir", help="Каталог данных (по умолчанию "
+                                           "временный)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repository = UserRepository(args.data_dir or temp_dir)
+        root = repository._root
+        print(f"{'пользователей':>14} {'медиана, мкс':>14} {'p99, мкс':>10}")
+        populated = 1
+        for size in sorted(args.sizes):
+            _populate(repository, root, populated, size + 1)
+            populated = size + 1
+            latencies = sorted(_measure(repository, size, args.logins))
+            median = statistics.median(latencies) * 1e6
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+            print(f"{size:>14} {median:>14.1f} {p99:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Замер опроса API с общей keep-alive сессией и без нее.
+
+CoinGeckoClient опрашивает локальный HTTP сервер-заглушку с ответом в
+формате /simple/price: сначала через сессию с пулом соединений
+(create_http_session), затем через отдельный requests.get на каждый
+запрос, как было до общей сессии. Заглушка считает принятые TCP
+соединения. Замер идет по HTTP без TLS, поэтому выигрыш на реальных
+источниках больше на стоимость рукопожатия TLS.
+
+    python benchmarks/session_pooling.py --fetches 2000 --delay-ms 1
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from valutatrade_hub.parser_service.api_clients import (  # noqa: E402
+    CoinGeckoClient,
+)
+from valutatrade_hub.parser_service.http_session import (  # noqa: E402
+    create_http_session,
+)
+from valutatrade_hub.parser_service.rate_limiter import TokenBucket  # noqa: E402
+
+CRYPTO_ID_MAP = {"BTC": "bitcoin", "ETH": "ethereum", "SOL": "solana"}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Ответ /simple/price с поддержкой keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными сегментами: без TCP_NODELAY
+    # keep-alive ответы ждут отложенного ACK клиента (~40 мс)
+    disable_nagle_algorithm = True
+    delay = 0.0
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with _StubHandler._lock:
+            _StubHandler.connections += 1
+
+    def do_GET(self) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+        body = json.dumps({crypto_id: {"usd": 1.0}
+                           for crypto_id in CRYPTO_ID_MAP.values()}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class _UnpooledSession:
+    """Новое соединение на каждый запрос, как у модульного requests.get"""
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return requests.get(url, **kwargs)
+
+
+def _measure(client: CoinGeckoClient, fetches: int) -> list:
+    latencies = []
+    for _ in range(fetches):
+        started = time.perf_counter()
+        client.fetch_rates()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def _run(name: str, session, base_url: str, fetches: int) -> None:
+    client = CoinGeckoClient(CRYPTO_ID_MAP, session=session, base_url=base_url,
+                             rate_limiter=TokenBucket(rate=1e9, capacity=1e9))
+    _StubHandler.connections = 0
+    started = time.perf_counter()
+    latencies = sorted(_measure(client, fetches))
+    elapsed = time.perf_counter() - started
+    median = statistics.median(latencies) * 1e6
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+    print(f"{name:>12} {median:>14.1f} {p99:>10.1f} {fetches / elapsed:>12.0f} "
+          f"{_StubHandler.connections:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Опрос API с пулом "
+                                                 "соединений и без него")
+    parser.add_argument("--fetches", type=int, default=2000,
+                        help="Число запросов в каждом режиме")
+    parser.add_argument("--delay-ms", type=float, default=0.0,
+                        help="Задержка ответа заглушки, мс")
+    args = parser.parse_args()
+
+    _StubHandler.delay = args.delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        print(f"{'режим':>12} {'медиана, мкс':>14} {'p99, мкс':>10} "
+              f"{'запросов/с':>12} {'соединений':>10}")
+        session = create_http_session()
+        try:
+            _run("пул", session, base_url, args.fetches)
+        finally:
+            session.close()
+        _run("без пула", _UnpooledSession(), base_url, args.fetches)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
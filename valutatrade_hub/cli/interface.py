@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from valutatrade_hub.core.exceptions import (
     ApiRequestError,
     CurrencyNotFoundError,
@@ -90,6 +92,15 @@ def run():
                     
                 case 'rate' | 'курс':
                     try:
+                        at = None
+                        if args and args[0] == '--at':
+                            try:
+                                at = datetime.fromisoformat(" ".join(args[1:]))
+                            except ValueError:
+                                print("Ошибка: --at ожидает дату в формате "
+                                      "ISO 8601, например 2025-01-31T12:00")
+                                continue
+
                         from_curr = input("Из валюты: ").upper()
                         to_curr = input("В валюту: ").upper()
                         
@@ -97,7 +108,7 @@ def run():
                             print("Ошибка: необходимо указать обе валюты")
                             continue
                             
-                        success = get_rate(from_curr, to_curr)
+                        success = get_rate(from_curr, to_curr, at)
                         if not success:
                             print("Курс недоступен")
                     except CurrencyNotFoundError:
@@ -13,7 +13,6 @@ DEFAULT_ENCODING = "utf-8"
 # Финансовые настройки
 DEFAULT_BASE_CURRENCY = "USD"
 INITIAL_BALANCE = 0.0
-RATES_CACHE_TTL_HOURS = 1
 
 # Валидация
 MAX_CURRENCY_CODE_LENGTH = 5
@@ -45,4 +44,34 @@ CURRENCY_CODE_EMPTY_ERROR = "Код валюты не может быть пус
 # Сообщения об ошибках Portfolio
 CURRENCY_NOT_IN_PORTFOLIO = "Кошелек для валюты '{}' не найден"
 CURRENCY_ALREADY_EXISTS = "Кошелек для валюты '{}' уже существует в портфеле"
-EXCHANGE_RATE_NOT_FOUND = "Курс для валюты '{}' не найден"
\ No newline at end of file
+EXCHANGE_RATE_NOT_FOUND = "Курс для валюты '{}' не найден"
+
+# Хранилище пользователей
+LEGACY_USERS_FILENAME = "users.json"
+USERS_DIRNAME = "users"
+USER_SEQUENCE_FILENAME = "sequence"
+USER_SEQUENCE_LOCK_FILENAME = "sequence.lock"
+USER_ID_SEQUENCE = "user_id"
+SQLITE_IMPORT_MIGRATION = "json_users_portfolios"  # перенос JSON хранилища в SQLite
+SQLITE_IMPORT_LOCK_FILENAME = ".sqlite_import.lock"
+SHARD_PREFIX_LENGTH = 2
+
+# Хранилище портфелей
+LEGACY_PORTFOLIOS_FILENAME = "portfolios.json"
+PORTFOLIOS_DIRNAME = "portfolios"
+PORTFOLIOS_MIGRATED_FILENAME = ".migrated"
+PORTFOLIOS_LOCK_FILENAME = ".lock"
+
+
+# Журнал сделок
+JOURNAL_DIRNAME = "journal"
+JOURNAL_ACTIVE_FILENAME = "trades.jsonl"
+JOURNAL_COMPACTING_SUFFIX = ".compacting"
+JOURNAL_STATE_FILENAME = "state.json"
+JOURNAL_LOCK_FILENAME = ".lock"
+JOURNAL_QUARANTINE_FILENAME = "quarantine.jsonl"
+JOURNAL_COMPACTION_LOCK_FILENAME = ".compaction.lock"
+JOURNAL_COMPACTION_INTERVAL = 60       # секунд между фоновыми компакциями
+JOURNAL_COMPACTION_THRESHOLD = 1000    # событий в хвосте до внеочередной компакции
+TRADE_ACTION_BUY = "BUY"
+TRADE_ACTION_SELL = "SELL"
\ No newline at end of file
@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from valutatrade_hub.core.constants import (
+    DEFAULT_ENCODING,
+    JOURNAL_ACTIVE_FILENAME,
+    JOURNAL_COMPACTING_SUFFIX,
+    JOURNAL_COMPACTION_LOCK_FILENAME,
+    JOURNAL_DIRNAME,
+    JOURNAL_LOCK_FILENAME,
+    JOURNAL_QUARANTINE_FILENAME,
+    JOURNAL_STATE_FILENAME,
+    TRADE_ACTION_BUY,
+    TRADE_ACTION_SELL,
+)
+from valutatrade_hub.core.exceptions import InsufficientFundsError, StorageError
+from valutatrade_hub.core.models import Portfolio
+from valutatrade_hub.infra.file_lock import file_lock
+from valutatrade_hub.infra.setting import settings
+
+logger = logging.getLogger(__name__)
+
+
+def apply_trade(portfolio: Portfolio, action: str, currency_code: str,
+                amount: float, rate: float) -> None:
+    """Применение сделки к портфелю (та же логика, что в buy/sell).
+
+    При нехватке средств бросает InsufficientFundsError, не изменяя портфель.
+    """
+    if action == TRADE_ACTION_BUY:
+        if not portfolio.has_currency(currency_code):
+            portfolio.add_currency(currency_code, 0.0)
+        portfolio.get_wallet(currency_code).deposit(amount)
+
+    elif action == TRADE_ACTION_SELL:
+        portfolio.get_wallet(currency_code).withdraw(amount)
+        revenue_usd = amount * rate
+        if revenue_usd > 0:
+            if not portfolio.has_currency("USD"):
+                portfolio.add_currency("USD", 0.0)
+            portfolio.get_wallet("USD").deposit(revenue_usd)
+
+
+def apply_trade_event(portfolio: Portfolio, event: dict) -> None:
+    """Применение события сделки журнала к портфелю"""
+    apply_trade(portfolio, event["action"], event["currency"], event["amount"],
+                event["rate"])
+    portfolio.journal_seq = event["seq"]
+
+
+def replay_trade_events(portfolio: Portfolio, events: List[dict]) -> List[dict]:
+    """Применение событий с seq больше journal_seq портфеля.
+
+    Событие, которое нельзя применить (например, продажа сверх баланса),
+    пропускается; возвращается список пропущенных событий.
+    """
+    rejected = []
+    for event in events:
+        if event["seq"] <= portfolio.journal_seq:
+            continue
+        try:
+            apply_trade_event(portfolio, event)
+        except (InsufficientFundsError, ValueError) as e:
+            logger.error(f"Событие журнала {event['seq']} пользователя "
+                         f"{event['user_id']} пропущено: {e}")
+            rejected.append(event)
+    return rejected
+
+
+class TradeJournal:
+    """Журнал сделок только на дозапись в формате JSON Lines.
+
+    Новые события дописываются в активный файл. При компакции активный
+    файл переименовывается в сегмент, события сегмента переносятся в
+    снимки портфелей, после чего сегмент удаляется. Хвост журнала
+    индексируется в памяти по user_id и дочитывается инкрементально.
+
+    Журнал может писаться несколькими процессами: назначение seq,
+    ротация и запись состояния выполняются под flock каталога журнала,
+    а компакции разных процессов исключают друг друга.
+    """
+
+    def __init__(self, data_dir: str = None):
+        data_dir = data_dir or settings.get("data_directory", "data/")
+        self._root = Path(data_dir) / JOURNAL_DIRNAME
+        self._active_path = self._root / JOURNAL_ACTIVE_FILENAME
+        self._state_path = self._root / JOURNAL_STATE_FILENAME
+        self._lock_path = self._root / JOURNAL_LOCK_FILENAME
+        self._compaction_lock_path = self._root / JOURNAL_COMPACTION_LOCK_FILENAME
+        self._quarantine_path = self._root / JOURNAL_QUARANTINE_FILENAME
+        self._lock = threading.RLock()
+        self._tail: Dict[int, List[dict]] = {}
+        self._tail_size = 0
+        self._offset = 0
+        self._inode = -1
+        self._state_version = -1
+        self._last_seq = 0
+
+    @property
+    def tail_size(self) -> int:
+        """Количество событий, еще не перенесенных в снимки"""
+        with self._lock:
+            return self._tail_size
+
+    def append(self, user_id: int, action: str, currency: str,
+               amount: float, rate: float,
+               check: Callable[[List[dict]], None] = None) -> dict:
+        """Дозапись события сделки в конец журнала.
+
+        check(tail) вызывается под блокировкой журнала с хвостом событий
+        пользователя и может отклонить сделку исключением: проверка и
+        дозапись атомарны относительно других процессов.
+        """
+        with self._lock, file_lock(self._lock_path):
+            # Дочитывание под блокировкой: seq учитывает записи других процессов
+            self._refresh()
+            if check is not None:
+                check(list(self._tail.get(user_id, [])))
+            event = {
+                "seq": self._last_seq + 1,
+                "user_id": user_id,
+                "action": action,
+                "currency": currency,
+                "amount": amount,
+                "rate": rate,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            line = json.dumps(event, ensure_ascii=False) + "\n"
+            try:
+                with open(self._active_path, 'a', encoding=DEFAULT_ENCODING) as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                raise StorageError(f"Ошибка записи {self._active_path}: {e}") from e
+
+            self._refresh()
+            return event
+
+    def tail_for(self, user_id: int) -> List[dict]:
+        """События пользователя, еще не перенесенные в снимок"""
+        with self._lock, file_lock(self._lock_path, shared=True):
+            self._refresh()
+            return list(self._tail.get(user_id, []))
+
+    def compact(self, apply: Callable[[int, List[dict]], None]) -> int:
+        """Перенос хвоста журнала в снимки через функцию apply.
+
+        apply(user_id, events) должна идемпотентно применить события к
+        снимку пользователя: повторный вызов после сбоя пропускает
+        события с seq не больше сохраненного в снимке.
+        """
+        with file_lock(self._compaction_lock_path):
+            return self._compact(apply)
+
+    def _compact(self, apply: Callable[[int, List[dict]], None]) -> int:
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self._active_path.exists() and self._active_path.stat().st_size:
+                segment = self._root / (f"trades-{self._last_seq:012d}"
+                                        f"{JOURNAL_COMPACTING_SUFFIX}.jsonl")
+                self._active_path.replace(segment)
+            segments = self._compacting_segments()
+            if not segments:
+                return 0
+            self._refresh()
+            pending = {user_id: list(events)
+                       for user_id, events in self._tail.items()}
+            last_seq = self._last_seq
+
+        compacted = 0
+        for user_id, events in pending.items():
+            apply(user_id, events)
+            compacted += len(events)
+
+        with self._lock, file_lock(self._lock_path):
+            self._write_state(last_seq)
+            for segment in segments:
+                segment.unlink(missing_ok=True)
+            self._inode = -1
+            self._refresh()
+
+        logger.info(f"Компакция журнала сделок: перенесено {compacted} событий")
+        return compacted
+
+    def quarantine(self, events: List[dict]) -> None:
+        """Сохранение отклоненных при компакции событий для разбора"""
+        lines = "".join(json.dumps(event, ensure_ascii=False) + "\n"
+                        for event in events)
+        try:
+            with self._lock, open(self._quarantine_path, 'a',
+                                  encoding=DEFAULT_ENCODING) as f:
+                f.write(lines)
+        except OSError as e:
+            raise StorageError(f"Ошибка записи {self._quarantine_path}: {e}") from e
+        logger.warning(f"В {self._quarantine_path} отложено {len(events)} "
+                       f"событий журнала")
+
+    def _compacting_segments(self) -> List[Path]:
+        pattern = f"trades-*{JOURNAL_COMPACTING_SUFFIX}.jsonl"
+        return sorted(self._root.glob(pattern))
+
+    def _refresh(self) -> None:
+        """Дочитывание новых событий; переиндексация после ротации"""
+        try:
+            stat = os.stat(self._active_path)
+        except FileNotFoundError:
+            stat = None
+
+        # Компакция в другом процессе меняет состояние; inode нового
+        # активного файла может совпасть со старым
+        try:
+            state_version = os.stat(self._state_path).st_mtime_ns
+        except FileNotFoundError:
+            state_version = None
+
+        inode = stat.st_ino if stat else None
+        if (inode != self._inode or state_version != self._state_version
+                or (stat and stat.st_size < self._offset)):
+            self._tail = {}
+            self._tail_size = 0
+            self._offset = 0
+            self._inode = inode
+            self._state_version = state_version
+            self._last_seq = self._read_state()
+            for segment in self._compacting_segments():
+                self._index_file(segment, 0)
+
+        if stat:
+            self._offset = self._index_file(self._active_path, self._offset)
+
+    def _index_file(self, path: Path, offset: int) -> int:
+        """Индексация событий файла начиная со смещения offset"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for raw_line in f:
+                    # Недописанная строка (сбой во время записи) пропускается
+                    if not raw_line.endswith(b"\n"):
+                        break
+                    offset += len(raw_line)
+                    event = json.loads(raw_line)
+                    self._tail.setdefault(event["user_id"], []).append(event)
+                    self._tail_size += 1
+                    self._last_seq = max(self._last_seq, event["seq"])
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            raise StorageError(f"Ошибка чтения {path}: {e}") from e
+        return offset
+
+    def _read_state(self) -> int:
+        try:
+            with open(self._state_path, 'r', encoding=DEFAULT_ENCODING) as f:
+                return json.load(f).get("last_seq", 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, json.JSONDecodeError) as e:
+            raise StorageError(f"Ошибка чтения {self._state_path}: {e}") from e
+
+    def _write_state(self, last_seq: int) -> None:
+        temp_path = self._state_path.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w', encoding=DEFAULT_ENCODING) as f:
+                json.dump({"last_seq": last_seq}, f)
+            temp_path.replace(self._state_path)
+        except OSError as e:
+            raise StorageError(f"Ошибка записи {self._state_path}: {e}") from e
+
+
+class JournalCompactor:
+    """Фоновая периодическая компакция журнала сделок"""
+
+    def __init__(self, compact: Callable[[], int], interval_seconds: float):
+        self._compact = compact
+        self.interval_seconds = interval_seconds
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Запуск фонового потока компакции"""
+        self._thread.start()
+
+    def trigger(self) -> None:
+        """Внеочередная компакция, например при разросшемся хвосте"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+            try:
+                self._compact()
+            except Exception as e:
+                logger.error(f"Ошибка компакции журнала сделок: {e}")
@@ -1,4 +1,5 @@
 import hashlib
+import logging
 import secrets
 from datetime import datetime
 
@@ -11,6 +12,8 @@ from valutatrade_hub.core.constants import (
 )
 from valutatrade_hub.core.exceptions import InsufficientFundsError
 
+logger = logging.getLogger(__name__)
+
 
 class User:
     """Класс, представляющий пользователя системы."""
@@ -207,14 +210,25 @@ class Wallet:
 class Portfolio:
     """Управление всеми кошельками одного пользователя"""
 
-    def __init__(self, user_id: int, wallets: dict[str, Wallet] = None):
+    def __init__(self, user_id: int, wallets: dict[str, Wallet] = None,
+                 journal_seq: int = 0):
         self._user_id = user_id
         self._wallets = wallets or {}
+        self._journal_seq = journal_seq
         self._default_rates = DEFAULT_EXCHANGE_RATES.copy()
 
     @property
     def user_id(self) -> int:
         return self._user_id
+
+    @property
+    def journal_seq(self) -> int:
+        """Номер последней сделки журнала, учтенной в снимке портфеля"""
+        return self._journal_seq
+
+    @journal_seq.setter
+    def journal_seq(self, value: int) -> None:
+        self._journal_seq = value
     
     @property
     def wallets(self) -> dict[str, Wallet]:
@@ -238,12 +252,17 @@ class Portfolio:
         return currency_code in self._wallets
 
     def get_exchange_rate(self, from_currency: str, to_currency: str,
-                           rates: dict = None) -> float:
+                           rates: dict = None, matrix=None) -> float:
         """Получает курс обмена между валютами с 
         использованием переданных курсов из парсера"""
     
         if from_currency == to_currency:
             return 1.0
+
+        if matrix is not None:
+            rate = matrix.rate(from_currency, to_currency)
+            if rate is not None:
+                return rate
         
         if rates:
             pair_key = f"{from_currency}_{to_currency}"
@@ -290,8 +309,11 @@ class Portfolio:
         return None
     
     def get_total_value(self, base_currency: str = "USD",
-                         rates: dict = None) -> float:
+                         rates: dict = None, matrix=None) -> float:
         """Функция рассчета общий стоимости портфеля"""
+        if matrix is not None and base_currency in matrix.index:
+            return self._get_total_value_by_matrix(base_currency, matrix, rates)
+
         total = 0.0
         
         for currency_code, wallet in self.wallets.items():
@@ -306,12 +328,33 @@ class Portfolio:
         
         return total
 
-    def get_portfolio_summary(self, rates: dict = None) -> dict:
+    def _get_total_value_by_matrix(self, base_currency: str, matrix,
+                                   rates: dict = None) -> float:
+        """Стоимость портфеля одним скалярным произведением по матрице курсов"""
+        balances = {code: wallet.balance for code, wallet in self._wallets.items()}
+        vector, unknown = matrix.vector(balances)
+        total = matrix.dot(vector, matrix.column(base_currency))
+
+        # Валюты вне реестра и с неизвестным (NaN) курсом оцениваются той же
+        # цепочкой, что и в get_portfolio_summary; dot их пропускает
+        for currency_code in balances:
+            if (currency_code not in unknown
+                    and matrix.rate(currency_code, base_currency) is not None):
+                continue
+            rate = self.get_exchange_rate(currency_code, base_currency, rates)
+            if rate is not None:
+                total += balances[currency_code] * rate
+            else:
+                logger.warning(f"Курс для {currency_code} не найден")
+        return total
+
+    def get_portfolio_summary(self, rates: dict = None, matrix=None) -> dict:
         """Функция возвращает сводку портфеля"""
         summary = {"wallets": {}}
         
         for currency_code, wallet in self.wallets.items():
-            rate_to_usd = self.get_exchange_rate(currency_code, "USD", rates)
+            rate_to_usd = self.get_exchange_rate(currency_code, "USD", rates,
+                                                 matrix)
             value_usd = wallet.balance * rate_to_usd if rate_to_usd else 0
             
             summary["wallets"][currency_code] = {
@@ -330,7 +373,8 @@ class Portfolio:
         
         return {
             "user_id": self._user_id,
-            "wallets": wallets_dict
+            "wallets": wallets_dict,
+            "journal_seq": self._journal_seq
         }
 
     @classmethod
@@ -345,7 +389,8 @@ class Portfolio:
         
         return cls(
             user_id=data["user_id"],
-            wallets=wallets
+            wallets=wallets,
+            journal_seq=data.get("journal_seq", 0)
         )
 
     def __str__(self) -> str:
@@ -0,0 +1,399 @@
+import heapq
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Callable, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+from valutatrade_hub.infra.constants import RATES_TRANSPORT_JSON, RATES_TRANSPORT_SHM
+from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.history import (
+    BaseHistoryStore,
+    get_history_store,
+)
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+from valutatrade_hub.parser_service.service import run_configured_update
+from valutatrade_hub.parser_service.snapshot import (
+    BinarySnapshotReader,
+    SharedMemorySnapshotReader,
+)
+from valutatrade_hub.parser_service.storage import BaseStorage, get_rates_storage
+from valutatrade_hub.parser_service.updater import pairs_expire_at
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RatesSnapshot:
+    """Неизменяемый снимок кэша курсов"""
+
+    rates: Mapping[str, float]
+    last_refresh: Optional[str]
+    generation: int
+    refreshed_at: float
+    expires_at: float
+    matrix: RatesMatrix
+
+    @property
+    def is_stale(self) -> bool:
+        """Устарел ли снимок (момент устаревания вычислен при загрузке)"""
+        return not self.rates or time.time() >= self.expires_at
+
+    @property
+    def age_seconds(self) -> float:
+        """Возраст снимка в секундах; бесконечность, если время неизвестно"""
+        if not self.refreshed_at:
+            return float('inf')
+        return time.time() - self.refreshed_at
+
+
+def _parse_refreshed_at(last_refresh: Optional[str]) -> float:
+    """Время обновления снимка в секундах epoch; 0 - неизвестно"""
+    if not last_refresh:
+        return 0.0
+    try:
+        cache_time = datetime.fromisoformat(last_refresh.replace('Z', '+00:00'))
+    except ValueError:
+        return 0.0
+    if cache_time.tzinfo is None:
+        cache_time = cache_time.astimezone()
+    return cache_time.timestamp()
+
+
+class RatesSnapshotCache:
+    """Общий для процесса кэш снимка курсов.
+
+    Хранилище перечитывается только если изменилась его версия
+    (mtime файла или версия базы) либо счетчик поколений, который
+    увеличивается через invalidate() после обновления курсов в процессе.
+    Снимок устаревает, когда истекает срок самой старой пары (время ее
+    подтверждения плюс TTL источника); для снимков без свежести пар
+    используется общий TTL от last_refresh.
+
+    Если заданы бинарные снимки (общая память демона, файл), курсы
+    берутся из самого свежего доступного без разбора JSON, а версией
+    служит его поколение; иначе читается storage.
+    """
+
+    def __init__(self, storage: BaseStorage, ttl_seconds: float,
+                 binary: Sequence[BinarySnapshotReader] = ()):
+        self._storage = storage
+        self._binary = tuple(binary)
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot: Optional[RatesSnapshot] = None
+        self._storage_version: Optional[Hashable] = None
+
+    def get(self) -> RatesSnapshot:
+        """Текущий снимок курсов, перечитывается только при изменениях"""
+        with self._lock:
+            if self._binary:
+                snapshot = self._get_from_binary()
+                if snapshot is not None:
+                    return snapshot
+
+            version = self._storage.get_version()
+            if (self._snapshot is None
+                    or version is None
+                    or version != self._storage_version
+                    or self._snapshot.generation != self._generation):
+                self._snapshot = self._load()
+                self._storage_version = version
+            return self._snapshot
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self._ttl_seconds
+
+    def invalidate(self) -> None:
+        """Принудительное перечитывание при следующем обращении"""
+        with self._lock:
+            self._generation += 1
+
+    def _freshest_binary(self) -> Optional[BinarySnapshotReader]:
+        """Доступный бинарный снимок с самой поздней публикацией"""
+        freshest, freshest_ts = None, None
+        for reader in self._binary:
+            timestamp = reader.timestamp
+            if timestamp is not None and (freshest_ts is None
+                                          or timestamp > freshest_ts):
+                freshest, freshest_ts = reader, timestamp
+        return freshest
+
+    def _get_from_binary(self) -> Optional[RatesSnapshot]:
+        """Снимок из бинарного источника; None, если ни один не доступен"""
+        reader = self._freshest_binary()
+        if reader is None:
+            return None
+        version = (reader.source, reader.generation)
+        if (self._snapshot is not None
+                and version == self._storage_version
+                and self._snapshot.generation == self._generation):
+            return self._snapshot
+
+        loaded = reader.read()
+        if loaded is None:
+            return None
+        generation, refreshed_at, matrix = loaded
+        base = parser_config.BASE_FIAT_CURRENCY
+        rates = {}
+        for code in matrix.currencies:
+            rate = matrix.rate(code, base)
+            if code != base and rate is not None:
+                rates[f"{code}_{base}"] = rate
+
+        self._snapshot = RatesSnapshot(
+            rates=MappingProxyType(rates),
+            last_refresh=(datetime.fromtimestamp(refreshed_at, timezone.utc)
+                          .isoformat() if refreshed_at else None),
+            generation=self._generation,
+            refreshed_at=refreshed_at,
+            expires_at=matrix.expires_at or self._expires_at(refreshed_at),
+            matrix=matrix
+        )
+        self._storage_version = (reader.source, generation)
+        return self._snapshot
+
+    def _load(self) -> RatesSnapshot:
+        try:
+            data = self._storage.load() or {}
+        except Exception:
+            data = {}
+        last_refresh = data.get('meta', {}).get('last_refresh')
+        refreshed_at = _parse_refreshed_at(last_refresh)
+        rates = dict(data.get('rates', {}))
+        return RatesSnapshot(
+            rates=MappingProxyType(rates),
+            last_refresh=last_refresh,
+            generation=self._generation,
+            refreshed_at=refreshed_at,
+            expires_at=(pairs_expire_at(data.get('pairs', {}))
+                        or self._expires_at(refreshed_at)),
+            matrix=RatesMatrix.from_rates(rates)
+        )
+
+    def _expires_at(self, refreshed_at: float) -> float:
+        """Устаревание снимка без свежести пар: общий TTL от обновления"""
+        return refreshed_at + self._ttl_seconds if refreshed_at else 0.0
+
+
+class RatesRefresher:
+    """Обновление курсов по схеме stale-while-revalidate.
+
+    Устаревший снимок отдается сразу, а обновление запускается в одном
+    фоновом потоке; повторные запросы во время обновления его не
+    дублируют. Блокирующее обновление выполняется, только если кэш пуст
+    или снимок старше max_stale_seconds (0 - без ограничения).
+
+    Обновление без изменений курсов не перезаписывает снимок, поэтому
+    время последней успешной проверки хранится отдельно: в пределах TTL
+    после нее повторное обновление не запускается.
+    """
+
+    def __init__(self, cache: RatesSnapshotCache, update: Callable[[], bool],
+                 max_stale_seconds: float = 0):
+        self._cache = cache
+        self._update = update
+        self.max_stale_seconds = max_stale_seconds
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._checked_at = 0.0
+
+    @property
+    def is_refreshing(self) -> bool:
+        """Идет ли фоновое обновление"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def get(self) -> RatesSnapshot:
+        """Снимок курсов; при устаревании запускает обновление"""
+        snapshot = self._cache.get()
+        if not snapshot.is_stale or self._recently_checked(snapshot):
+            return snapshot
+
+        if self._must_block(snapshot):
+            self.refresh_sync()
+            return self._cache.get()
+
+        self.refresh_async()
+        return snapshot
+
+    def refresh_async(self) -> bool:
+        """Запуск фонового обновления; False, если оно уже идет"""
+        with self._lock:
+            if self.is_refreshing:
+                return False
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="rates-refresh")
+            self._thread.start()
+            return True
+
+    def refresh_sync(self) -> None:
+        """Блокирующее обновление; присоединяется к уже идущему"""
+        self.refresh_async()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _recently_checked(self, snapshot: RatesSnapshot) -> bool:
+        """Курсы подтверждены обновлением без изменений в пределах TTL"""
+        return (bool(snapshot.rates)
+                and time.time() - self._checked_at < self._cache.ttl_seconds)
+
+    def _must_block(self, snapshot: RatesSnapshot) -> bool:
+        if not snapshot.rates:
+            return True
+        return (self.max_stale_seconds > 0
+                and snapshot.age_seconds > self.max_stale_seconds)
+
+    def _run(self) -> None:
+        try:
+            if self._update():
+                self._checked_at = time.time()
+            else:
+                logger.warning("Фоновое обновление курсов завершилось с ошибкой")
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления курсов: {e}")
+        finally:
+            self._cache.invalidate()
+
+
+_rates_cache: Optional[RatesSnapshotCache] = None
+_rates_refresher: Optional[RatesRefresher] = None
+
+
+def get_rates_cache() -> RatesSnapshotCache:
+    """Общий для процесса кэш курсов"""
+    global _rates_cache
+    if _rates_cache is None:
+        transport = settings.get("rates_transport")
+        binary = []
+        if transport == RATES_TRANSPORT_SHM:
+            binary.append(SharedMemorySnapshotReader())
+        if transport != RATES_TRANSPORT_JSON:
+            binary.append(BinarySnapshotReader())
+        _rates_cache = RatesSnapshotCache(get_rates_storage(),
+                                          settings.get("rates_ttl_seconds"),
+                                          binary)
+    return _rates_cache
+
+
+def get_rates_refresher() -> RatesRefresher:
+    """Общий для процесса фоновый обновитель курсов"""
+    global _rates_refresher
+    if _rates_refresher is None:
+        _rates_refresher = RatesRefresher(
+            get_rates_cache(),
+            run_configured_update,
+            settings.get("rates_max_stale_seconds")
+        )
+    return _rates_refresher
+
+
+def get_fresh_rates_snapshot() -> RatesSnapshot:
+    """Снимок курсов без ожидания сети: устаревший обновляется в фоне"""
+    return get_rates_refresher().get()
+
+
+def get_rates_snapshot() -> RatesSnapshot:
+    """Текущий снимок курсов из общего кэша"""
+    return get_rates_cache().get()
+
+
+def invalidate_rates_snapshot() -> None:
+    """Сброс общего кэша курсов после обновления"""
+    get_rates_cache().invalidate()
+
+
+def _pair_rate_at(store: BaseHistoryStore, from_currency: str,
+                  to_currency: str, at: datetime) -> Optional[float]:
+    """Курс пары из истории: прямая пара, затем обратная"""
+    direct = store.value_at(f"{from_currency}_{to_currency}", at)
+    if direct is not None:
+        return direct[1]
+    reverse = store.value_at(f"{to_currency}_{from_currency}", at)
+    if reverse is not None and reverse[1]:
+        return 1 / reverse[1]
+    return None
+
+
+def get_rate_at(from_currency: str, to_currency: str, at: datetime,
+                store: BaseHistoryStore = None) -> Optional[float]:
+    """Курс на момент at по истории; None, если истории нет.
+
+    Приоритет как в матрице кросс-курсов: прямая пара, обратная пара,
+    затем пересчет через базовую валюту. Каждая пара ищется бинарным
+    поиском по времени.
+    """
+    if from_currency == to_currency:
+        return 1.0
+    store = store or get_history_store()
+
+    rate = _pair_rate_at(store, from_currency, to_currency, at)
+    if rate is not None:
+        return rate
+
+    base = parser_config.BASE_FIAT_CURRENCY
+    if base in (from_currency, to_currency):
+        return None
+    from_base = _pair_rate_at(store, from_currency, base, at)
+    to_base = _pair_rate_at(store, to_currency, base, at)
+    if from_base is None or not to_base:
+        return None
+    return from_base / to_base
+
+
+def _pair_series(store: BaseHistoryStore, from_currency: str, to_currency: str,
+                 start: datetime, end: datetime,
+                 resolution: Optional[int]) -> List[Tuple[int, float]]:
+    """Ряд пары из истории: прямая пара, затем обратная"""
+    timestamps, values = store.series(f"{from_currency}_{to_currency}",
+                                      start, end, resolution)
+    if values:
+        return list(zip(timestamps, values))
+    timestamps, values = store.series(f"{to_currency}_{from_currency}",
+                                      start, end, resolution)
+    return [(ts, 1 / value) for ts, value in zip(timestamps, values) if value]
+
+
+def get_rates_between(from_currency: str, to_currency: str, start: datetime,
+                      end: datetime, store: BaseHistoryStore = None,
+                      resolution: int = None) -> List[Tuple[datetime, float]]:
+    """Курсы за интервал [start, end] в порядке времени.
+
+    Кросс-курс через базовую валюту строится по каждому обновлению
+    любой из двух пар с последним известным значением другой. При
+    заданном resolution (секунды) используются цены закрытия баров.
+    """
+    store = store or get_history_store()
+    series = _pair_series(store, from_currency, to_currency, start, end,
+                          resolution)
+
+    base = parser_config.BASE_FIAT_CURRENCY
+    if not series and from_currency != to_currency \
+            and base not in (from_currency, to_currency):
+        from_base = _pair_rate_at(store, from_currency, base, start)
+        to_base = _pair_rate_at(store, to_currency, base, start)
+        merged = heapq.merge(
+            ((ts, 0, value) for ts, value in
+             _pair_series(store, from_currency, base, start, end, resolution)),
+            ((ts, 1, value) for ts, value in
+             _pair_series(store, to_currency, base, start, end, resolution))
+        )
+        for ts, side, value in merged:
+            if side == 0:
+                from_base = value
+            else:
+                to_base = value
+            if from_base is None or not to_base:
+                continue
+            # Обе пары одного обновления дают одну точку
+            if series and series[-1][0] == ts:
+                series.pop()
+            series.append((ts, from_base / to_base))
+
+    return [(datetime.fromtimestamp(ts / 1000, timezone.utc), rate)
+            for ts, rate in series]
@@ -0,0 +1,497 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Optional
+
+from valutatrade_hub.core.constants import (
+    DEFAULT_ENCODING,
+    JOURNAL_COMPACTION_INTERVAL,
+    JOURNAL_COMPACTION_THRESHOLD,
+    LEGACY_PORTFOLIOS_FILENAME,
+    LEGACY_USERS_FILENAME,
+    PORTFOLIOS_DIRNAME,
+    PORTFOLIOS_LOCK_FILENAME,
+    PORTFOLIOS_MIGRATED_FILENAME,
+    SHARD_PREFIX_LENGTH,
+    SQLITE_IMPORT_LOCK_FILENAME,
+    SQLITE_IMPORT_MIGRATION,
+    TRADE_ACTION_SELL,
+    USER_ID_SEQUENCE,
+    USER_SEQUENCE_FILENAME,
+    USER_SEQUENCE_LOCK_FILENAME,
+    USERS_DIRNAME,
+)
+from valutatrade_hub.core.exceptions import StorageError
+from valutatrade_hub.core.journal import (
+    JournalCompactor,
+    TradeJournal,
+    apply_trade,
+    replay_trade_events,
+)
+from valutatrade_hub.core.models import Portfolio, User
+from valutatrade_hub.infra.constants import STORAGE_BACKEND_SQLITE
+from valutatrade_hub.infra.file_lock import file_lock
+from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service.storage import SqliteStorage, get_sqlite_storage
+
+logger = logging.getLogger(__name__)
+
+
+def _shard_path(root: Path, key: str) -> Path:
+    """Путь к файлу записи в шардированном по хешу ключа каталоге"""
+    digest = hashlib.sha256(key.encode(DEFAULT_ENCODING)).hexdigest()
+    return root / digest[:SHARD_PREFIX_LENGTH] / f"{digest}.json"
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    """Чтение одной JSON записи, None если файла нет"""
+    try:
+        with open(path, 'r', encoding=DEFAULT_ENCODING) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        raise StorageError(f"Ошибка чтения {path}: {e}") from e
+
+
+def _write_json_atomic(path: Path, data: dict) -> None:
+    """Атомарная запись одной JSON записи через уникальный временный файл"""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    except OSError as e:
+        raise StorageError(f"Ошибка записи {path}: {e}") from e
+
+    try:
+        with os.fdopen(fd, 'w', encoding=DEFAULT_ENCODING) as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_name, path)
+    except OSError as e:
+        Path(temp_name).unlink(missing_ok=True)
+        raise StorageError(f"Ошибка записи {path}: {e}") from e
+
+
+class BaseUserRepository(ABC):
+    """Абстрактное хранилище пользователей"""
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[User]:
+        """Поиск пользователя по имени"""
+        pass
+
+    @abstractmethod
+    def exists(self, username: str) -> bool:
+        """Проверка существования пользователя"""
+        pass
+
+    @abstractmethod
+    def next_id(self) -> int:
+        """Выдача следующего user_id"""
+        pass
+
+    @abstractmethod
+    def add(self, user: User) -> bool:
+        """Добавление пользователя, False если имя уже занято"""
+        pass
+
+
+class BasePortfolioRepository(ABC):
+    """Абстрактное хранилище портфелей"""
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        """Загрузка портфеля одного пользователя"""
+        pass
+
+    @abstractmethod
+    def save(self, portfolio: Portfolio) -> None:
+        """Сохранение портфеля одного пользователя"""
+        pass
+
+    @abstractmethod
+    def iter_all(self) -> Iterator[Portfolio]:
+        """Перебор всех портфелей (для пакетных задач)"""
+        pass
+
+    def record_trade(self, portfolio: Portfolio, action: str, currency: str,
+                     amount: float, rate: float) -> None:
+        """Фиксация сделки; portfolio уже содержит ее результат"""
+        self.save(portfolio)
+
+
+class UserRepository(BaseUserRepository):
+    """Хранилище пользователей с индексом username → запись пользователя.
+
+    Каждый пользователь хранится в отдельном файле, путь к которому
+    вычисляется по хешу имени, поэтому поиск и регистрация не зависят
+    от общего числа пользователей. Идентификаторы выдаются из
+    персистентной последовательности.
+    """
+
+    def __init__(self, data_dir: str = None):
+        self._data_dir = Path(data_dir or settings.get("data_directory", "data/"))
+        self._root = self._data_dir / USERS_DIRNAME
+        self._sequence_path = self._root / USER_SEQUENCE_FILENAME
+        self._sequence_lock_path = self._root / USER_SEQUENCE_LOCK_FILENAME
+        self._lock = threading.Lock()
+        self._migrate_legacy_file()
+
+    def get_by_username(self, username: str) -> Optional[User]:
+        """Поиск пользователя по имени за O(1)"""
+        data = _read_json(_shard_path(self._root, username))
+        return User.from_dict(data) if data else None
+
+    def exists(self, username: str) -> bool:
+        """Проверка существования пользователя"""
+        return _shard_path(self._root, username).exists()
+
+    def next_id(self) -> int:
+        """Выдача следующего user_id из персистентной последовательности"""
+        with self._lock, file_lock(self._sequence_lock_path):
+            new_id = self._read_sequence() + 1
+            self._write_sequence(new_id)
+            return new_id
+
+    def add(self, user: User) -> bool:
+        """Добавление пользователя, False если имя уже занято"""
+        path = _shard_path(self._root, user.username)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+        except OSError as e:
+            raise StorageError(f"Ошибка записи {path}: {e}") from e
+
+        try:
+            with os.fdopen(fd, 'w', encoding=DEFAULT_ENCODING) as f:
+                json.dump(user.to_dict(), f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # link не заменяет существующий файл: проверка уникальности и
+            # появление полностью записанной записи атомарны
+            os.link(temp_name, path)
+        except FileExistsError:
+            return False
+        except OSError as e:
+            raise StorageError(f"Ошибка записи {path}: {e}") from e
+        finally:
+            os.unlink(temp_name)
+        return True
+
+    def iter_all(self) -> Iterator[User]:
+        """Перебор всех пользователей по файлам шардов"""
+        for path in self._root.glob("*/*.json"):
+            data = _read_json(path)
+            if data:
+                yield User.from_dict(data)
+
+    def _read_sequence(self) -> int:
+        try:
+            return int(self._sequence_path.read_text(encoding=DEFAULT_ENCODING))
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            raise StorageError(f"Ошибка чтения {self._sequence_path}: {e}") from e
+
+    def _write_sequence(self, value: int) -> None:
+        self._root.mkdir(parents=True, exist_ok=True)
+        temp_path = self._sequence_path.with_suffix('.tmp')
+        try:
+            temp_path.write_text(str(value), encoding=DEFAULT_ENCODING)
+            temp_path.replace(self._sequence_path)
+        except OSError as e:
+            raise StorageError(f"Ошибка записи {self._sequence_path}: {e}") from e
+
+    def _migrate_legacy_file(self) -> None:
+        """Однократный перенос пользователей из users.json"""
+        legacy_path = self._data_dir / LEGACY_USERS_FILENAME
+        if self._sequence_path.exists() or not legacy_path.exists():
+            return
+
+        with file_lock(self._sequence_lock_path):
+            if self._sequence_path.exists():
+                return
+
+            with open(legacy_path, 'r', encoding=DEFAULT_ENCODING) as f:
+                users_data = json.load(f) or []
+
+            max_id = 0
+            for user_data in users_data:
+                _write_json_atomic(_shard_path(self._root, user_data["username"]),
+                                   user_data)
+                max_id = max(max_id, user_data["user_id"])
+
+            self._write_sequence(max_id)
+        logger.info(f"Перенесено {len(users_data)} пользователей "
+                    f"из {legacy_path} в {self._root}")
+
+
+class PortfolioRepository(BasePortfolioRepository):
+    """Хранилище портфелей, где каждый портфель читается и пишется отдельно.
+
+    Портфель пользователя лежит в собственном файле в шардированном
+    каталоге, поэтому сделка затрагивает только один файл.
+    """
+
+    def __init__(self, data_dir: str = None):
+        self._data_dir = Path(data_dir or settings.get("data_directory", "data/"))
+        self._root = self._data_dir / PORTFOLIOS_DIRNAME
+        self._migrate_legacy_file()
+
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        """Загрузка портфеля одного пользователя"""
+        data = _read_json(_shard_path(self._root, str(user_id)))
+        return Portfolio.from_dict(data) if data else None
+
+    def save(self, portfolio: Portfolio) -> None:
+        """Сохранение портфеля одного пользователя"""
+        _write_json_atomic(_shard_path(self._root, str(portfolio.user_id)),
+                           portfolio.to_dict())
+
+    def record_trade(self, portfolio: Portfolio, action: str, currency: str,
+                     amount: float, rate: float) -> None:
+        """Сделка под flock файла портфеля: чтение, применение и запись.
+
+        Сделка применяется к портфелю, прочитанному под блокировкой, а не
+        к переданному, поэтому параллельные сделки не теряют обновлений.
+        """
+        path = _shard_path(self._root, str(portfolio.user_id))
+        with file_lock(path.with_suffix('.lock')):
+            current = (self.get(portfolio.user_id)
+                       or Portfolio(user_id=portfolio.user_id))
+            apply_trade(current, action, currency, amount, rate)
+            self.save(current)
+
+    def iter_all(self) -> Iterator[Portfolio]:
+        """Перебор всех портфелей по файлам шардов"""
+        for path in self._root.glob("*/*.json"):
+            data = _read_json(path)
+            if data:
+                yield Portfolio.from_dict(data)
+
+    def _migrate_legacy_file(self) -> None:
+        """Однократный перенос портфелей из portfolios.json.
+
+        Признак завершения пишется последним, поэтому прерванный перенос
+        повторяется. Уже существующие файлы портфелей не перезаписываются:
+        они перенесены ранее или изменены после переноса.
+        """
+        legacy_path = self._data_dir / LEGACY_PORTFOLIOS_FILENAME
+        marker_path = self._root / PORTFOLIOS_MIGRATED_FILENAME
+        if marker_path.exists() or not legacy_path.exists():
+            return
+
+        with file_lock(self._root / PORTFOLIOS_LOCK_FILENAME):
+            if marker_path.exists():
+                return
+
+            with open(legacy_path, 'r', encoding=DEFAULT_ENCODING) as f:
+                portfolios_data = json.load(f) or []
+
+            for portfolio_data in portfolios_data:
+                path = _shard_path(self._root, str(portfolio_data["user_id"]))
+                if not path.exists():
+                    _write_json_atomic(path, portfolio_data)
+
+            try:
+                marker_path.touch()
+            except OSError as e:
+                raise StorageError(f"Ошибка записи {marker_path}: {e}") from e
+        logger.info(f"Перенесено {len(portfolios_data)} портфелей "
+                    f"из {legacy_path} в {self._root}")
+
+
+class SqliteUserRepository(BaseUserRepository):
+    """Хранилище пользователей поверх SqliteStorage"""
+
+    def __init__(self, storage: SqliteStorage):
+        self._storage = storage
+
+    def get_by_username(self, username: str) -> Optional[User]:
+        data = self._storage.get_user(username)
+        return User.from_dict(data) if data else None
+
+    def exists(self, username: str) -> bool:
+        return self._storage.get_user(username) is not None
+
+    def next_id(self) -> int:
+        return self._storage.next_sequence_value(USER_ID_SEQUENCE)
+
+    def add(self, user: User) -> bool:
+        return self._storage.add_user(user.to_dict())
+
+
+class SqlitePortfolioRepository(BasePortfolioRepository):
+    """Хранилище портфелей поверх SqliteStorage"""
+
+    def __init__(self, storage: SqliteStorage):
+        self._storage = storage
+
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        data = self._storage.get_portfolio(user_id)
+        return Portfolio.from_dict(data) if data else None
+
+    def save(self, portfolio: Portfolio) -> None:
+        self._storage.save_portfolio(portfolio.to_dict())
+
+    def iter_all(self) -> Iterator[Portfolio]:
+        for data in self._storage.iter_portfolios():
+            yield Portfolio.from_dict(data)
+
+    def record_trade(self, portfolio: Portfolio, action: str, currency: str,
+                     amount: float, rate: float) -> None:
+        """Сделка как дельты кошельков; баланс проверяется в базе"""
+        if action == TRADE_ACTION_SELL:
+            revenue_usd = amount * rate
+            self._storage.apply_trade(
+                portfolio.user_id, (currency, amount),
+                [("USD", revenue_usd)] if revenue_usd > 0 else []
+            )
+        else:
+            self._storage.apply_trade(portfolio.user_id, None, [(currency, amount)])
+
+
+class JournaledPortfolioRepository(BasePortfolioRepository):
+    """Портфели как снимок плюс хвост журнала сделок.
+
+    Сделка записывается одной дозаписью в журнал, а снимки в базовом
+    хранилище обновляются фоновой компакцией. Портфель при чтении
+    собирается из снимка и событий журнала с seq больше journal_seq
+    снимка, поэтому после сбоя состояние восстанавливается повтором.
+    Событие, которое нельзя применить, пропускается при чтении и
+    откладывается в карантин при компакции.
+    """
+
+    def __init__(self, base: BasePortfolioRepository, journal: TradeJournal):
+        self._base = base
+        self._journal = journal
+        self._compactor = JournalCompactor(self.compact, JOURNAL_COMPACTION_INTERVAL)
+        self._compactor.start()
+        # Восстановление в фоне: чтение не зависит от компакции
+        self._compactor.trigger()
+
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        # Хвост читается до снимка: событие, перенесенное компакцией
+        # между двумя чтениями, будет отсеяно по journal_seq снимка
+        tail = self._journal.tail_for(user_id)
+        portfolio = self._base.get(user_id)
+        if portfolio is None:
+            return None
+        replay_trade_events(portfolio, tail)
+        return portfolio
+
+    def save(self, portfolio: Portfolio) -> None:
+        self._base.save(portfolio)
+
+    def iter_all(self) -> Iterator[Portfolio]:
+        for portfolio in self._base.iter_all():
+            replay_trade_events(portfolio,
+                                self._journal.tail_for(portfolio.user_id))
+            yield portfolio
+
+    def record_trade(self, portfolio: Portfolio, action: str, currency: str,
+                     amount: float, rate: float) -> None:
+        user_id = portfolio.user_id
+
+        def check(tail: list) -> None:
+            # Баланс проверяется по снимку и хвосту под блокировкой журнала,
+            # а не по портфелю, прочитанному до сделки
+            current = self._base.get(user_id) or Portfolio(user_id=user_id)
+            replay_trade_events(current, tail)
+            apply_trade(current, action, currency, amount, rate)
+
+        self._journal.append(user_id, action, currency, amount, rate, check=check)
+        if self._journal.tail_size >= JOURNAL_COMPACTION_THRESHOLD:
+            self._compactor.trigger()
+
+    def compact(self) -> int:
+        """Перенос хвоста журнала в снимки портфелей"""
+        return self._journal.compact(self._apply_to_snapshot)
+
+    def _apply_to_snapshot(self, user_id: int, events: list) -> None:
+        portfolio = self._base.get(user_id) or Portfolio(user_id=user_id)
+        journal_seq = portfolio.journal_seq
+        rejected = replay_trade_events(portfolio, events)
+        if rejected:
+            self._journal.quarantine(rejected)
+        if portfolio.journal_seq != journal_seq:
+            self._base.save(portfolio)
+
+
+_user_repository: Optional[BaseUserRepository] = None
+_portfolio_repository: Optional[BasePortfolioRepository] = None
+
+
+def _use_sqlite() -> bool:
+    return settings.get("storage_backend") == STORAGE_BACKEND_SQLITE
+
+
+def _import_json_data(storage: SqliteStorage) -> None:
+    """Однократный перенос пользователей и портфелей из JSON хранилища.
+
+    Уже существующие в базе записи не перезаписываются, а признак
+    завершения пишется последним, поэтому прерванный перенос повторяется.
+    """
+    data_dir = Path(settings.get("data_directory", "data/"))
+    with file_lock(data_dir / SQLITE_IMPORT_LOCK_FILENAME):
+        if storage.is_migrated(SQLITE_IMPORT_MIGRATION):
+            return
+
+        users = UserRepository(str(data_dir))
+        users_count = 0
+        for user in users.iter_all():
+            users_count += storage.add_user(user.to_dict())
+        storage.raise_sequence(USER_ID_SEQUENCE, users._read_sequence())
+
+        # Хвост журнала сделок, еще не перенесенный в снимки
+        journal = TradeJournal(str(data_dir))
+        portfolios_count = 0
+        for portfolio in PortfolioRepository(str(data_dir)).iter_all():
+            if storage.get_portfolio(portfolio.user_id) is None:
+                replay_trade_events(portfolio, journal.tail_for(portfolio.user_id))
+                storage.save_portfolio(portfolio.to_dict())
+                portfolios_count += 1
+
+        storage.mark_migrated(SQLITE_IMPORT_MIGRATION)
+    if users_count or portfolios_count:
+        logger.info(f"Перенесено в SQLite {users_count} пользователей и "
+                    f"{portfolios_count} портфелей из {data_dir}")
+
+
+def _get_sqlite_storage() -> SqliteStorage:
+    """SqliteStorage с перенесенными данными JSON хранилища"""
+    storage = get_sqlite_storage()
+    if not storage.is_migrated(SQLITE_IMPORT_MIGRATION):
+        _import_json_data(storage)
+    return storage
+
+
+def get_user_repository() -> BaseUserRepository:
+    """Общий для процесса экземпляр хранилища пользователей"""
+    global _user_repository
+    if _user_repository is None:
+        if _use_sqlite():
+            _user_repository = SqliteUserRepository(_get_sqlite_storage())
+        else:
+            _user_repository = UserRepository()
+    return _user_repository
+
+
+def get_portfolio_repository() -> BasePortfolioRepository:
+    """Общий для процесса экземпляр хранилища портфелей"""
+    global _portfolio_repository
+    if _portfolio_repository is None:
+        if _use_sqlite():
+            repository = SqlitePortfolioRepository(_get_sqlite_storage())
+        else:
+            repository = PortfolioRepository()
+        # SQLite сам обеспечивает атомарную запись портфеля, а журнал в
+        # файлах обходил бы его транзакции
+        if settings.get("trade_journal") and not _use_sqlite():
+            repository = JournaledPortfolioRepository(repository, TradeJournal())
+        _portfolio_repository = repository
+    return _portfolio_repository
@@ -1,10 +1,12 @@
-import json
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional, Tuple
 
 from valutatrade_hub.core.constants import (
     MIN_PASSWORD_LENGTH,
-    RATES_CACHE_TTL_HOURS,
+    TRADE_ACTION_BUY,
+    TRADE_ACTION_SELL,
 )
 from valutatrade_hub.core.currencies import get_currency
 from valutatrade_hub.core.exceptions import (
@@ -12,11 +14,23 @@ from valutatrade_hub.core.exceptions import (
     InsufficientFundsError,
 )
 from valutatrade_hub.core.models import Portfolio, User
+from valutatrade_hub.core.rates import (
+    get_fresh_rates_snapshot,
+    get_rate_at,
+    get_rates_snapshot,
+    invalidate_rates_snapshot,
+)
+from valutatrade_hub.core.repositories import (
+    get_portfolio_repository,
+    get_user_repository,
+)
 from valutatrade_hub.core.session import get_current_user_id, set_current_user_id
 from valutatrade_hub.decorators import log_action
 from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service import service as rates_service
 from valutatrade_hub.parser_service.config import parser_config
-from valutatrade_hub.parser_service.storage import JsonFileStorage
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+from valutatrade_hub.parser_service.rates_server import get_rates_client
 
 
 def require_auth() -> bool:
@@ -26,122 +40,64 @@ def require_auth() -> bool:
         return False
     return True
 
-def load_json_data(filepath: str) -> list:
-    """Функция загрузки данных из JSON файла, возвращает список"""
-    data_dir = settings.get("data_directory", "data/")
-    full_path = Path(data_dir) / filepath
-    
-    if full_path.exists():
-        with open(full_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data if data else []
-    return []
-
-def save_json_data(filepath: str, data: list) -> bool:
-    """Функция сохранения данных в JSON файл"""
-    try:
-        data_dir = settings.get("data_directory", "data/")
-        full_path = Path(data_dir) / filepath
-        
-        Path(data_dir).mkdir(exist_ok=True)
-        
-        with open(full_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"Ошибка при сохранении данных в {filepath}: {e}")
-        return False
-
-def get_next_user_id(users_objects) -> int:
-    """Функция присвоения следующего user_id из объектов User"""
-    if not users_objects:
-        return 1
-    
-    existing_ids = [user.user_id for user in users_objects]
-    
-    if existing_ids:
-        return max(existing_ids) + 1
-    else:
-        return 1
-    
-
 def is_rates_cache_stale() -> bool:
     """Функция проверки, устарел ли кэш курсов"""
-    try:
-        storage = JsonFileStorage(parser_config.RATES_FILE_PATH)
-        data = storage.load()
-        
-        if not data or not data.get('rates'):
-            return True
-            
-        last_refresh = data.get('meta', {}).get('last_refresh')
-        if not last_refresh:
-            return True
-
-        from datetime import datetime
-        cache_time = datetime.fromisoformat(last_refresh.replace('Z', '+00:00'))
-        current_time = datetime.now().astimezone()
-
-        time_diff = (current_time - cache_time).total_seconds() / 3600
-        return time_diff > RATES_CACHE_TTL_HOURS
-    except Exception:
-        return True
-
-def _get_current_rates() -> dict:
-    """Функция получения актуальных курсов из кэша парсера"""
-    try:
-        storage = JsonFileStorage(parser_config.RATES_FILE_PATH)
-        data = storage.load()
-        return data.get('rates', {}) if data else {}
-    except Exception:
-        return {}
+    return get_rates_snapshot().is_stale
+
+def _get_rate_quote(from_currency: str,
+                    to_currency: str) -> Tuple[Optional[float], Optional[str], bool]:
+    """Курс, время обновления и признак устаревания: сервер курсов, затем кэш"""
+    answer = get_rates_client().get_rate(from_currency, to_currency)
+    if answer is not None:
+        rate, refreshed_at, expires_at = answer
+        last_refresh = (datetime.fromtimestamp(refreshed_at, timezone.utc).isoformat()
+                        if refreshed_at else None)
+        # Свежесть по сроку самой старой пары, как у снимка курсов
+        if not expires_at:
+            expires_at = refreshed_at + settings.get("rates_ttl_seconds")
+        return rate, last_refresh, time.time() >= expires_at
+
+    rates_snapshot = get_fresh_rates_snapshot()
+    rate = _get_exchange_rate(from_currency, to_currency, rates_snapshot.matrix)
+    return rate, rates_snapshot.last_refresh, rates_snapshot.is_stale
 
 def _get_exchange_rate(from_currency: str, to_currency: str,
-                        rates: dict = None) -> float:
-    """Функция получения курса между двумя валютами"""
-    if not rates:
-        rates = _get_current_rates()
-    
+                        matrix: RatesMatrix = None) -> float:
+    """Функция получения курса между двумя валютами по матрице кросс-курсов"""
     if from_currency == to_currency:
         return 1.0
-    
-    # Прямой курс
-    pair_key = f"{from_currency}_{to_currency}"
-    if pair_key in rates:
-        return rates[pair_key]
-    
-    # Обратный курс
-    reverse_pair_key = f"{to_currency}_{from_currency}"
-    if reverse_pair_key in rates:
-        return 1 / rates[reverse_pair_key]
-    
-    # Конвертация через USD
-    from_to_usd = _get_exchange_rate(from_currency, "USD", rates)
-    usd_to_to = _get_exchange_rate("USD", to_currency, rates)
-    
-    if from_to_usd and usd_to_to:
-        return from_to_usd * usd_to_to
-    
-    return None
-
-def _get_user_portfolio(user_id: int) -> tuple[Portfolio, int, list]:
-    """Функция получения портфеля пользователя, его индекса и списка всех портфелей"""
-    existing_portfolios_data = load_json_data("portfolios.json")
-    existing_portfolios = [
-        Portfolio.from_dict(portfolio_data) 
-        for portfolio_data in existing_portfolios_data
-    ]
-    
-    for i, portfolio in enumerate(existing_portfolios):
-        if portfolio.user_id == user_id:
-            return portfolio, i, existing_portfolios
-    
-    return None, -1, existing_portfolios
 
-def _save_all_portfolios(portfolios: list) -> bool:
-    """Функция сохранения всех портфелей"""
-    all_portfolios_dicts = [portfolio.to_dict() for portfolio in portfolios]
-    return save_json_data("portfolios.json", all_portfolios_dicts)
+    if matrix is None:
+        matrix = get_rates_snapshot().matrix
+
+    return matrix.rate(from_currency, to_currency)
+
+def _get_user_portfolio(user_id: int) -> Portfolio:
+    """Функция получения портфеля пользователя"""
+    return get_portfolio_repository().get(user_id)
+
+def _save_portfolio(portfolio: Portfolio) -> bool:
+    """Функция сохранения портфеля одного пользователя"""
+    try:
+        get_portfolio_repository().save(portfolio)
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении портфеля: {e}")
+        return False
+
+def _record_trade(portfolio: Portfolio, action: str, currency_code: str,
+                  amount: float, rate: float) -> bool:
+    """Функция фиксации сделки в хранилище портфелей"""
+    try:
+        get_portfolio_repository().record_trade(
+            portfolio, action, currency_code, amount, rate
+        )
+        return True
+    except InsufficientFundsError:
+        raise
+    except Exception as e:
+        print(f"Ошибка при сохранении портфеля: {e}")
+        return False
 
 # =============================================================================
 # PARSER SERVICE INTEGRATION
@@ -149,16 +105,30 @@ def _save_all_portfolios(portfolios: list) -> bool:
 
 def update_rates(source: str = None) -> bool:
     """Запустить обновление курсов через Parser Service"""
-    import subprocess
-    import sys
-    
+    if settings.get("rates_update_isolation"):
+        return _update_rates_subprocess(source)
+
     try:
-        cmd = [sys.executable, '-m', 'valutatrade_hub.parser_service.main', 'update']
-        if source:
-            cmd.extend(['--source', source])
-            
         print("Запуск обновления курсов...")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        success = rates_service.run_update(source, force=True)
+    except Exception as e:
+        print(f"Ошибка запуска парсера: {e}")
+        return False
+    finally:
+        invalidate_rates_snapshot()
+
+    if success:
+        print("Курсы успешно обновлены")
+    else:
+        print("Ошибка при обновлении курсов")
+    return success
+
+
+def _update_rates_subprocess(source: str = None) -> bool:
+    """Обновление курсов в отдельном процессе (режим изоляции)"""
+    try:
+        print("Запуск обновления курсов...")
+        result = rates_service.run_update_subprocess(source, force=True)
         
         if result.returncode == 0:
             print("Курсы успешно обновлены")
@@ -180,16 +150,14 @@ def update_rates(source: str = None) -> bool:
 def show_cached_rates(currency: str = None, top: int = None, base: str = "USD") -> bool:
     """Функция показа кэшированных курсов валют"""
     try:
-       
-        storage = JsonFileStorage(parser_config.RATES_FILE_PATH)
-        data = storage.load()
+        snapshot = get_rates_snapshot()
         
-        if not data or not data.get('rates'):
+        if not snapshot.rates:
             print("Кэш курсов пуст. Используйте: update-rates")
             return False
         
-        rates = data.get('rates', {})
-        last_refresh = data.get('meta', {}).get('last_refresh', 'неизвестно')
+        rates = dict(snapshot.rates)
+        last_refresh = snapshot.last_refresh or 'неизвестно'
         
         if currency:
             currency = currency.upper()
@@ -238,23 +206,19 @@ def register(username: str, password: str) -> bool:
 
         Path(data_dir).mkdir(exist_ok=True)
 
-        existing_users_data = load_json_data("users.json")  
-        existing_users = [
-            User.from_dict(user_data) for user_data in existing_users_data
-        ]
-        
+        users = get_user_repository()
+
         # Проверка существующего пользователя
-        for user in existing_users:
-            if user.username == username:
-                print(f"Ошибка: пользователь '{username}' уже существует")
-                return False
+        if users.exists(username):
+            print(f"Ошибка: пользователь '{username}' уже существует")
+            return False
         
         if len(password) < MIN_PASSWORD_LENGTH:
             print(f"Пароль должен быть не короче"
                   f" {MIN_PASSWORD_LENGTH} символов")
             return False
         
-        new_id = get_next_user_id(existing_users)
+        new_id = users.next_id()
         new_user = User(
             user_id=new_id,
             username=username,
@@ -265,27 +229,13 @@ def register(username: str, password: str) -> bool:
         
         new_user.change_password(password)
 
-        all_users_objects = existing_users + [new_user]
-        all_users_dicts = [user.to_dict() for user in all_users_objects]
-        
-        if not save_json_data("users.json", all_users_dicts):  
-            print("Ошибка при сохранении пользователей")
+        if not users.add(new_user):
+            print(f"Ошибка: пользователь '{username}' уже существует")
             return False
 
-        existing_portfolios_data = load_json_data("portfolios.json")  
-        existing_portfolios = [
-            Portfolio.from_dict(portfolio_data) 
-            for portfolio_data in existing_portfolios_data
-        ]
-        
         new_portfolio = Portfolio(user_id=new_id, wallets={})
         
-        all_portfolios_objects = existing_portfolios + [new_portfolio]
-        all_portfolios_dicts = [
-            portfolio.to_dict() for portfolio in all_portfolios_objects
-        ]
-        
-        if not save_json_data("portfolios.json", all_portfolios_dicts):  
+        if not _save_portfolio(new_portfolio):
             print("Ошибка при сохранении портфелей")
             return False
 
@@ -301,16 +251,7 @@ def register(username: str, password: str) -> bool:
 def login(username: str, password: str):
     """Функция входа и фиксации текущей сессии"""
     try:
-        existing_users_data = load_json_data("users.json")
-        existing_users = [
-            User.from_dict(user_data) for user_data in existing_users_data
-        ]
-
-        user_found = None
-        for user in existing_users:
-            if user.username == username:
-                user_found = user
-                break
+        user_found = get_user_repository().get_by_username(username)
             
         if not user_found:
             print(f"Пользователь '{username}' не найден")
@@ -321,12 +262,8 @@ def login(username: str, password: str):
             print(f"Успешный вход для пользователя '{username}'")
             
 
-            if is_rates_cache_stale():
-                print("Обновление курсов валют...")
-                if update_rates():
-                    print("Курсы успешно обновлены")
-                else:
-                    print("Предупреждение: не удалось обновить курсы")
+            if get_fresh_rates_snapshot().is_stale:
+                print("Курсы устарели, обновление запущено в фоне")
             else:
                 print("Курсы актуальны")
             
@@ -355,7 +292,7 @@ def show_portfolio(base: str = 'USD') -> bool:
             print(f"Ошибка: базовая валюта '{base}' не найдена")
             return False
 
-        user_portfolio, _, _ = _get_user_portfolio(current_user_id)
+        user_portfolio = _get_user_portfolio(current_user_id)
         if not user_portfolio:
             print("Портфель не найден")
             return False
@@ -364,14 +301,19 @@ def show_portfolio(base: str = 'USD') -> bool:
             print("Портфель пуст")
             return True
 
-        current_rates = _get_current_rates()
+        rates_snapshot = get_fresh_rates_snapshot()
+        current_rates = rates_snapshot.rates
         
-        total_value = user_portfolio.get_total_value(base_code, current_rates)
+        total_value = user_portfolio.get_total_value(
+            base_code, current_rates, rates_snapshot.matrix
+        )
         
         print(f"\n Портфель пользователя (ID: {current_user_id}) в {base_code}:")
         print("=" * 60)
         
-        portfolio_summary = user_portfolio.get_portfolio_summary(current_rates)
+        portfolio_summary = user_portfolio.get_portfolio_summary(
+            current_rates, rates_snapshot.matrix
+        )
         
         for currency_code, wallet_info in portfolio_summary["wallets"].items():
             balance = wallet_info["balance"]
@@ -386,7 +328,7 @@ def show_portfolio(base: str = 'USD') -> bool:
         print("=" * 60)
         print(f"Общая стоимость: {total_value:.2f} {base_code}")
 
-        if is_rates_cache_stale():
+        if rates_snapshot.is_stale:
             print("\n Курсы могут быть устаревшими. Рекомендуется: update-rates")
         
         return True
@@ -415,20 +357,19 @@ def buy(currency: str, amount: float) -> bool:
         
         current_user_id = get_current_user_id()
 
-        user_portfolio, portfolio_index,all_portfolios = _get_user_portfolio(
-            current_user_id
-            )
+        user_portfolio = _get_user_portfolio(current_user_id)
         if not user_portfolio:
             print("Ошибка: портфель пользователя не найден")
             return False
         
-        current_rates = _get_current_rates()
+        rates_snapshot = get_fresh_rates_snapshot()
         
-        exchange_rate = _get_exchange_rate(currency_code, "USD", current_rates)
+        exchange_rate = _get_exchange_rate(currency_code, "USD",
+                                           rates_snapshot.matrix)
         if not exchange_rate:
             try:
                 exchange_rate = user_portfolio.get_exchange_rate(
-                    currency_code, current_rates
+                    currency_code, "USD", rates_snapshot.rates
                     )
             except ValueError as e:
                 print(f"Ошибка: не удалось получить курс для {currency_code}: {e}")
@@ -445,12 +386,8 @@ def buy(currency: str, amount: float) -> bool:
 
         purchase_cost_usd = amount * exchange_rate
         
-        if portfolio_index >= 0:
-            all_portfolios[portfolio_index] = user_portfolio
-        else:
-            all_portfolios.append(user_portfolio)
-            
-        if not _save_all_portfolios(all_portfolios):
+        if not _record_trade(user_portfolio, TRADE_ACTION_BUY, currency_code,
+                             amount, exchange_rate):
             print("Ошибка при сохранении портфеля")
             return False
 
@@ -489,9 +426,7 @@ def sell(currency: str, amount: float):
         
         current_user_id = get_current_user_id()
         
-        user_portfolio, portfolio_index, all_portfolios = _get_user_portfolio(
-            current_user_id
-            )
+        user_portfolio = _get_user_portfolio(current_user_id)
         if not user_portfolio:
             print("Ошибка: портфель пользователя не найден")
             return False
@@ -502,14 +437,15 @@ def sell(currency: str, amount: float):
             return False
         
         # Получение актуальных курсов из парсера
-        current_rates = _get_current_rates()
+        rates_snapshot = get_fresh_rates_snapshot()
         
         # Расчет курса через парсер
-        exchange_rate = _get_exchange_rate(currency_code, "USD", current_rates)
+        exchange_rate = _get_exchange_rate(currency_code, "USD",
+                                           rates_snapshot.matrix)
         if not exchange_rate:
             try:
                 exchange_rate = user_portfolio.get_exchange_rate(
-                    currency_code, current_rates
+                    currency_code, "USD", rates_snapshot.rates
                     )
             except ValueError as e:
                 print(f"Ошибка: не удалось получить курс для {currency_code}: {e}")
@@ -538,12 +474,8 @@ def sell(currency: str, amount: float):
             usd_wallet.deposit(revenue_usd)
         
         # Сохранение изменений
-        if portfolio_index >= 0:
-            all_portfolios[portfolio_index] = user_portfolio
-        else:
-            all_portfolios.append(user_portfolio)
-            
-        if not _save_all_portfolios(all_portfolios):
+        if not _record_trade(user_portfolio, TRADE_ACTION_SELL, currency_code,
+                             amount, exchange_rate):
             print("Ошибка при сохранении портфеля")
             return False
 
@@ -565,25 +497,25 @@ def sell(currency: str, amount: float):
         print(f"Ошибка при продаже: {e}")
         return False
         
-def get_rate(from_currency: str, to_currency: str) -> bool:
-    """Функция получения текущего курса из кэша парсера"""
+def get_rate(from_currency: str, to_currency: str, at: datetime = None) -> bool:
+    """Функция получения текущего курса из кэша парсера или курса на момент at"""
     try:
         from_currency_obj = get_currency(from_currency)
         to_currency_obj = get_currency(to_currency)
         from_currency_code = from_currency_obj.code
         to_currency_code = to_currency_obj.code
+
+        if at is not None:
+            return _show_rate_at(from_currency_code, to_currency_code, at)
         
-        current_rates = _get_current_rates()
-        rate = _get_exchange_rate(from_currency_code, to_currency_code, current_rates)
+        rate, last_refresh, is_stale = _get_rate_quote(from_currency_code,
+                                                       to_currency_code)
         
         if rate is not None:
             print(f" Курс: 1 {from_currency_code} ="
                   f" {rate:.6f} {to_currency_code}")
             
-            storage = JsonFileStorage(parser_config.RATES_FILE_PATH)
-            data = storage.load()
-            last_refresh = data.get('meta', {}).get('last_refresh', 'неизвестно')
-            print(f" Обновлено: {last_refresh}")
+            print(f" Обновлено: {last_refresh or 'неизвестно'}")
             
             if rate > 0:
                 reverse_rate = 1 / rate
@@ -591,7 +523,7 @@ def get_rate(from_currency: str, to_currency: str) -> bool:
                       f" = {reverse_rate:.6f} {from_currency_code}")
             
             # Предупреждение об устаревших курсах
-            if is_rates_cache_stale():
+            if is_stale:
                 print("\nКурсы могут быть устаревшими. Рекомендуется: update-rates")
             
             return True
@@ -607,6 +539,22 @@ def get_rate(from_currency: str, to_currency: str) -> bool:
         print(f" Ошибка при получении курса: {e}")
         return False
 
+def _show_rate_at(from_currency_code: str, to_currency_code: str,
+                  at: datetime) -> bool:
+    """Вывод курса на момент at из истории курсов"""
+    if at.tzinfo is None:
+        at = at.astimezone()
+
+    rate = get_rate_at(from_currency_code, to_currency_code, at)
+    if rate is None:
+        print(f" Курс {from_currency_code} → {to_currency_code} "
+              f"на {at.isoformat()} не найден в истории")
+        return False
+
+    print(f" Курс на {at.isoformat()}: 1 {from_currency_code} ="
+          f" {rate:.6f} {to_currency_code}")
+    return True
+
 def show_simple_help():
     """Показывает справку по командам"""
     print("\nДоступные команды:")
@@ -616,6 +564,7 @@ def show_simple_help():
     print("  buy (b)            - купить валюту")
     print("  sell (s)           - продать валюту")
     print("  rate               - получить курс валют")
+    print("  rate --at <дата>   - курс на момент в прошлом (ISO 8601)")
     print("  update-rates       - обновить курсы валют")
     print("  show-rates         - показать кэшированные курсы")
     print("  logout (out)       - выход из системы")
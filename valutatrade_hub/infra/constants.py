@@ -5,14 +5,32 @@
 # Настройки по умолчанию для SettingsLoader
 DEFAULT_DATA_DIR = "data/"
 DEFAULT_RATES_TTL = 300
+DEFAULT_RATES_MAX_STALE = 0  # 0 - никогда не ждать обновления, если кэш не пуст
 DEFAULT_BASE_CURRENCY = "USD"
 DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_STORAGE_BACKEND = "json"
+DEFAULT_SQLITE_PATH = "data/valutatrade.db"
+DEFAULT_TRADE_JOURNAL = False
+DEFAULT_BATCH_VALUATION = False
+DEFAULT_RATES_UPDATE_ISOLATION = False
+DEFAULT_VALUATION_CURRENCY = "EUR"
+DEFAULT_RATES_TRANSPORT = "json"
+DEFAULT_RATES_CHANGE_EPSILON = 0.0  # допуск относительного изменения курса
 
 # Настройки файлов
 PYPROJECT_PATH = "pyproject.toml"
 CONFIG_SECTION = "valutatrade"
 DEFAULT_ENCODING = "utf-8"
 
+# Бэкенды хранилища
+STORAGE_BACKEND_JSON = "json"
+STORAGE_BACKEND_SQLITE = "sqlite"
+
+# Способы получения курсов процессами приложения
+RATES_TRANSPORT_JSON = "json"
+RATES_TRANSPORT_MMAP = "mmap"
+RATES_TRANSPORT_SHM = "shm"  # общая память демона schedule, затем mmap
+
 # Настройки логирования
 DEFAULT_LOG_FILE = "logs/valutatrade.log"
 LOG_FORMAT = '%(levelname)s %(asctime)s %(message)s'
@@ -0,0 +1,23 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """Межпроцессная блокировка flock на файле блокировки path.
+
+    Каждый вход открывает свой дескриптор, поэтому блокировка исключает
+    и потоки одного процесса. Снимается при закрытии дескриптора, в том
+    числе при аварийном завершении процесса.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
@@ -6,9 +6,18 @@ import tomli
 from valutatrade_hub.infra.constants import (
     CONFIG_SECTION,
     DEFAULT_BASE_CURRENCY,
+    DEFAULT_BATCH_VALUATION,
     DEFAULT_DATA_DIR,
     DEFAULT_LOG_LEVEL,
+    DEFAULT_RATES_CHANGE_EPSILON,
+    DEFAULT_RATES_MAX_STALE,
+    DEFAULT_RATES_TRANSPORT,
     DEFAULT_RATES_TTL,
+    DEFAULT_RATES_UPDATE_ISOLATION,
+    DEFAULT_SQLITE_PATH,
+    DEFAULT_STORAGE_BACKEND,
+    DEFAULT_TRADE_JOURNAL,
+    DEFAULT_VALUATION_CURRENCY,
     PYPROJECT_PATH,
 )
 
@@ -26,8 +35,19 @@ class SettingsLoader:
         self._config = {
             "data_directory": DEFAULT_DATA_DIR,
             "rates_ttl_seconds": DEFAULT_RATES_TTL,
+            "rates_max_stale_seconds": DEFAULT_RATES_MAX_STALE,
             "default_base_currency": DEFAULT_BASE_CURRENCY,
-            "log_level": DEFAULT_LOG_LEVEL
+            "log_level": DEFAULT_LOG_LEVEL,
+            "storage_backend": DEFAULT_STORAGE_BACKEND,
+            "sqlite_path": DEFAULT_SQLITE_PATH,
+            "trade_journal": DEFAULT_TRADE_JOURNAL,
+            "batch_valuation": DEFAULT_BATCH_VALUATION,
+            "valuation_currency": DEFAULT_VALUATION_CURRENCY,
+            "rates_update_isolation": DEFAULT_RATES_UPDATE_ISOLATION,
+            "rates_transport": DEFAULT_RATES_TRANSPORT,
+            "rates_change_epsilon": DEFAULT_RATES_CHANGE_EPSILON,
+            "rates_change_epsilon_pairs": {},
+            "rates_source_ttl_seconds": {}
         }
         
         pyproject_path = Path(PYPROJECT_PATH)
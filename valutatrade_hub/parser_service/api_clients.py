@@ -1,53 +1,241 @@
+import asyncio
+import logging
 from abc import ABC, abstractmethod
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, Hashable, List, Mapping, Optional
 
 import requests
 
 from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.parser_service.async_http import AsyncHttpError, AsyncHttpSession
 from valutatrade_hub.parser_service.config import parser_config
-from valutatrade_hub.parser_service.constants import DEFAULT_REQUEST_TIMEOUT
+from valutatrade_hub.parser_service.constants import (
+    DEFAULT_REQUEST_TIMEOUT,
+    MAX_PARALLEL_REQUESTS,
+    MAX_RATES_PER_REQUEST,
+    SOURCE_COINGECKO,
+    SOURCE_EXCHANGERATE,
+)
+from valutatrade_hub.parser_service.http_session import get_shared_session
+from valutatrade_hub.parser_service.rate_limiter import TokenBucket, get_rate_limiter
+from valutatrade_hub.parser_service.response_cache import (
+    CachedResponse,
+    ResponseCache,
+    expires_from_headers,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(url: str, params: Dict[str, str] = None) -> Hashable:
+    return (url, tuple(sorted((params or {}).items())))
+
+
+def _cache_entry(data: dict, headers: Mapping[str, str],
+                 expires_at: Callable[[dict], Optional[float]] = None
+                 ) -> CachedResponse:
+    """Запись кэша по телу ответа и его заголовкам"""
+    return CachedResponse(
+        data=data,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        expires_at=((expires_at and expires_at(data))
+                    or expires_from_headers(headers))
+    )
+
+
+def _revalidated_entry(cached: CachedResponse, headers: Mapping[str, str],
+                       expires_at: Callable[[dict], Optional[float]] = None
+                       ) -> CachedResponse:
+    """Запись кэша после ответа 304: те же данные с новым сроком.
+
+    Срок - больший из заявленного заголовками 304 и извлеченного из тела,
+    чтобы 304 без Cache-Control не обнулял срок из time_next_update_unix.
+    """
+    return replace(
+        cached,
+        etag=headers.get("ETag") or cached.etag,
+        last_modified=headers.get("Last-Modified") or cached.last_modified,
+        expires_at=max(expires_from_headers(headers),
+                       (expires_at and expires_at(cached.data)) or 0.0)
+    )
+
+
+def _chunks(codes: List[str], size: int) -> List[List[str]]:
+    return [codes[i:i + size] for i in range(0, len(codes), size)]
+
+
+def _merge_chunks(results: List[Dict[str, float]], errors: List[Exception],
+                  total: int) -> Dict[str, float]:
+    """Курсы из удачных частей; ошибка, только если не удалась ни одна"""
+    if errors and not results:
+        raise errors[0]
+    if errors:
+        logger.warning(f"CoinGecko: не получено {len(errors)} из "
+                       f"{total} частей: {errors[0]}")
+    rates = {}
+    for chunk_rates in results:
+        rates.update(chunk_rates)
+    return rates
+
+
+def _coingecko_rates(crypto_id_map: Dict[str, str], codes: List[str],
+                     data: dict) -> Dict[str, float]:
+    """Пары "CODE_USD" из ответа /simple/price"""
+    rates = {}
+    for crypto_code in codes:
+        crypto_id = crypto_id_map[crypto_code]
+        if crypto_id in data and 'usd' in data[crypto_id]:
+            rates[f"{crypto_code}_USD"] = data[crypto_id]['usd']
+    return rates
+
+
+def _exchangerate_rates(data: dict, base_currency: str) -> Dict[str, float]:
+    """Пары "CODE_BASE" отслеживаемых фиатных валют из ответа /latest"""
+    if data.get("result") != "success":
+        error_type = data.get("error-type", "unknown_error")
+        raise ApiRequestError(f"ExchangeRate-API error: {error_type}")
+
+    target_currencies = parser_config.FIAT_CURRENCIES
+    return {
+        f"{currency_code}_{base_currency}": rate
+        for currency_code, rate in data.get("conversion_rates", {}).items()
+        if currency_code != base_currency and currency_code in target_currencies
+    }
+
+
+def _exchangerate_error(status_code: Optional[int], default: str) -> str:
+    """Сообщение об ошибке ExchangeRate-API по коду ответа"""
+    return {
+        401: "Неверный API ключ для ExchangeRate-API",
+        429: "Превышен лимит запросов к ExchangeRate-API",
+        403: "Доступ к ExchangeRate-API запрещен",
+    }.get(status_code, default)
+
+
+def _next_update_time(data: dict) -> Optional[float]:
+    """Время следующего обновления курсов ExchangeRate-API (epoch)"""
+    if data.get("result") != "success":
+        return None
+    return data.get("time_next_update_unix")
 
 
 class BaseApiClient(ABC):
-    """Абстрактный базовый класс для API клиентов."""
+    """Абстрактный базовый класс для API клиентов.
+
+    Наследники задают session, timeout, rate_limiter и response_cache
+    и получают данные через _get_json.
+    """
+
+    source: Optional[str] = None
+    session: requests.Session
+    timeout: float
+    rate_limiter: TokenBucket
+    response_cache: ResponseCache
     
     @abstractmethod
     def fetch_rates(self) -> Dict[str, float]:
         """Получение курсов валют от внешнего API."""
         pass
 
+    def close(self) -> None:
+        """Освобождение ресурсов клиента."""
+        pass
+
+    def _acquire(self, rate_limiter: TokenBucket, timeout: float) -> None:
+        """Ожидание разрешения ограничителя перед запросом."""
+        if not rate_limiter.acquire(timeout):
+            raise ApiRequestError(f"{self.__class__.__name__}: превышен лимит "
+                                  f"запросов, ожидание дольше {timeout} с")
+
+    def _get_json(self, url: str, params: Dict[str, str] = None,
+                  expires_at: Callable[[dict], Optional[float]] = None) -> dict:
+        """GET запрос JSON через кэш ответов.
+
+        В пределах заявленного срока годности сеть не используется;
+        после него отправляется условный запрос с ETag/Last-Modified, и
+        ответ 304 продлевает кэшированные данные. expires_at извлекает
+        срок годности из тела ответа (epoch), если его объявляет API.
+        """
+        key = _cache_key(url, params)
+        cached = self.response_cache.get(key)
+        if cached is not None and cached.is_fresh:
+            self.response_cache.record_hit()
+            return cached.data
+
+        self._acquire(self.rate_limiter, self.timeout)
+        headers = cached.validators() if cached is not None else {}
+        response = self.session.get(url, params=params, headers=headers,
+                                    timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            self.response_cache.revalidate(
+                key, cached, _revalidated_entry(cached, response.headers,
+                                                expires_at))
+            return cached.data
+
+        response.raise_for_status()
+        data = response.json()
+        self.response_cache.record_miss()
+        self.response_cache.store(key, _cache_entry(data, response.headers,
+                                                    expires_at))
+        return data
+
 
 class CoinGeckoClient(BaseApiClient):
-    """Клиент для работы с CoinGecko API."""
+    """Клиент для работы с CoinGecko API.
+
+    Список id делится на части не больше MAX_RATES_PER_REQUEST, которые
+    запрашиваются параллельно под общим ограничителем частоты.
+    """
+
+    source = SOURCE_COINGECKO
     
     def __init__(self, crypto_id_map: Dict[str, str], 
-                 timeout: int = DEFAULT_REQUEST_TIMEOUT):
+                 timeout: int = DEFAULT_REQUEST_TIMEOUT,
+                 session: requests.Session = None,
+                 base_url: str = parser_config.COINGECKO_BASE_URL,
+                 rate_limiter: TokenBucket = None,
+                 chunk_size: int = MAX_RATES_PER_REQUEST,
+                 response_cache: ResponseCache = None):
         self.crypto_id_map = crypto_id_map
         self.timeout = timeout
-        self.base_url = "https://api.coingecko.com/api/v3/simple/price"
+        self.session = session or get_shared_session()
+        self.base_url = f"{base_url}/simple/price"
+        self.rate_limiter = rate_limiter or get_rate_limiter(SOURCE_COINGECKO)
+        self.chunk_size = chunk_size
+        self.response_cache = response_cache or ResponseCache()
     
     def fetch_rates(self) -> Dict[str, float]:
         """Получение курсов криптовалют от CoinGecko."""
+        codes = list(self.crypto_id_map)
+        chunks = _chunks(codes, self.chunk_size)
+        if len(chunks) <= 1:
+            return self._fetch_chunk(codes)
+
+        results = []
+        errors = []
+        workers = min(MAX_PARALLEL_REQUESTS, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix="coingecko") as executor:
+            futures = [executor.submit(self._fetch_chunk, chunk) for chunk in chunks]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except ApiRequestError as e:
+                    errors.append(e)
+        return _merge_chunks(results, errors, len(chunks))
+
+    def _fetch_chunk(self, codes: List[str]) -> Dict[str, float]:
+        """Запрос курсов одной части списка криптовалют."""
         try:
-            crypto_ids = ",".join(self.crypto_id_map.values())
             params = {
-                'ids': crypto_ids,
+                'ids': ",".join(self.crypto_id_map[code] for code in codes),
                 'vs_currencies': 'usd'
             }
             
-            response = requests.get(self.base_url, params=params, timeout=self.timeout)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            rates = {}
-            for crypto_code, crypto_id in self.crypto_id_map.items():
-                if crypto_id in data and 'usd' in data[crypto_id]:
-                    rate = data[crypto_id]['usd']
-                    pair_key = f"{crypto_code}_USD"
-                    rates[pair_key] = rate
-            
-            return rates
+            data = self._get_json(self.base_url, params)
+            return _coingecko_rates(self.crypto_id_map, codes, data)
             
         except requests.exceptions.RequestException as e:
             error_msg = f"CoinGecko API error: {e}"
@@ -58,47 +246,190 @@ class CoinGeckoClient(BaseApiClient):
 
 class ExchangeRateApiClient(BaseApiClient):
     """Клиент для работы с ExchangeRate-API."""
+
+    source = SOURCE_EXCHANGERATE
     
     def __init__(self, api_key: str, base_currency: str = "USD", 
-                 timeout: int = DEFAULT_REQUEST_TIMEOUT):
+                 timeout: int = DEFAULT_REQUEST_TIMEOUT,
+                 session: requests.Session = None,
+                 base_url: str = parser_config.EXCHANGERATE_API_BASE_URL,
+                 rate_limiter: TokenBucket = None,
+                 response_cache: ResponseCache = None):
         self.api_key = api_key
         self.base_currency = base_currency
         self.timeout = timeout
-        self.base_url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/{base_currency}"
+        self.session = session or get_shared_session()
+        self.base_url = f"{base_url}/{api_key}/latest/{base_currency}"
+        self.rate_limiter = rate_limiter or get_rate_limiter(SOURCE_EXCHANGERATE)
+        self.response_cache = response_cache or ResponseCache()
     
     def fetch_rates(self) -> Dict[str, float]:
         """Получение курсов фиатных валют от ExchangeRate-API."""
         try:
-            response = requests.get(self.base_url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            data = response.json()
+            # Курсы обновляются провайдером реже, чем мы их опрашиваем
+            data = self._get_json(self.base_url, expires_at=_next_update_time)
             
             if data.get("result") != "success":
-                error_type = data.get("error-type", "unknown_error")
-                raise ApiRequestError(f"ExchangeRate-API error: {error_type}")
-
-            base_rates = data.get("conversion_rates", {})
-            
-            target_currencies = parser_config.FIAT_CURRENCIES
-            
-            rates = {}
-            for currency_code, rate in base_rates.items():
-                if (currency_code != self.base_currency and 
-                    currency_code in target_currencies):
-                    pair_key = f"{currency_code}_{self.base_currency}"
-                    rates[pair_key] = rate
-            
-            return rates
+                self.response_cache.clear()
+            return _exchangerate_rates(data, self.base_currency)
             
         except requests.exceptions.RequestException as e:
             error_msg = f"ExchangeRate-API error: {e}"
             if hasattr(e, 'response') and e.response is not None:
-                status_code = e.response.status_code
-                if status_code == 401:
-                    error_msg = "Неверный API ключ для ExchangeRate-API"
-                elif status_code == 429:
-                    error_msg = "Превышен лимит запросов к ExchangeRate-API"
-                elif status_code == 403:
-                    error_msg = "Доступ к ExchangeRate-API запрещен"
-            raise ApiRequestError(error_msg)
\ No newline at end of file
+                error_msg = _exchangerate_error(e.response.status_code, error_msg)
+            raise ApiRequestError(error_msg)
+
+
+class AsyncBaseApiClient(ABC):
+    """Асинхронный вариант BaseApiClient.
+
+    Наследники задают session (AsyncHttpSession), timeout, rate_limiter
+    и response_cache; запросы выполняются в цикле событий без потоков.
+    """
+
+    source: Optional[str] = None
+    session: AsyncHttpSession
+    timeout: float
+    rate_limiter: TokenBucket
+    response_cache: ResponseCache
+
+    @abstractmethod
+    async def fetch_rates(self) -> Dict[str, float]:
+        """Получение курсов валют от внешнего API."""
+        pass
+
+    async def close(self) -> None:
+        """Освобождение ресурсов клиента."""
+        pass
+
+    async def _acquire(self, rate_limiter: TokenBucket, timeout: float) -> None:
+        """Ожидание разрешения ограничителя перед запросом."""
+        if not await rate_limiter.acquire_async(timeout):
+            raise ApiRequestError(f"{self.__class__.__name__}: превышен лимит "
+                                  f"запросов, ожидание дольше {timeout} с")
+
+    async def _get_json(self, url: str, params: Dict[str, str] = None,
+                        expires_at: Callable[[dict], Optional[float]] = None
+                        ) -> dict:
+        """GET запрос JSON через кэш ответов (см. BaseApiClient._get_json)."""
+        key = _cache_key(url, params)
+        cached = self.response_cache.get(key)
+        if cached is not None and cached.is_fresh:
+            self.response_cache.record_hit()
+            return cached.data
+
+        await self._acquire(self.rate_limiter, self.timeout)
+        headers = cached.validators() if cached is not None else {}
+        response = await self.session.get(url, params=params, headers=headers,
+                                          timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            self.response_cache.revalidate(
+                key, cached, _revalidated_entry(cached, response.headers,
+                                                expires_at))
+            return cached.data
+
+        response.raise_for_status()
+        data = response.json()
+        self.response_cache.record_miss()
+        self.response_cache.store(key, _cache_entry(data, response.headers,
+                                                    expires_at))
+        return data
+
+
+class AsyncCoinGeckoClient(AsyncBaseApiClient):
+    """Асинхронный клиент CoinGecko API.
+
+    Части списка id запрашиваются конкурентно, не больше
+    MAX_PARALLEL_REQUESTS одновременно.
+    """
+
+    source = SOURCE_COINGECKO
+
+    def __init__(self, crypto_id_map: Dict[str, str], session: AsyncHttpSession,
+                 timeout: int = DEFAULT_REQUEST_TIMEOUT,
+                 base_url: str = parser_config.COINGECKO_BASE_URL,
+                 rate_limiter: TokenBucket = None,
+                 chunk_size: int = MAX_RATES_PER_REQUEST,
+                 response_cache: ResponseCache = None):
+        self.crypto_id_map = crypto_id_map
+        self.session = session
+        self.timeout = timeout
+        self.base_url = f"{base_url}/simple/price"
+        self.rate_limiter = rate_limiter or get_rate_limiter(SOURCE_COINGECKO)
+        self.chunk_size = chunk_size
+        self.response_cache = response_cache or ResponseCache()
+
+    async def fetch_rates(self) -> Dict[str, float]:
+        """Получение курсов криптовалют от CoinGecko."""
+        codes = list(self.crypto_id_map)
+        chunks = _chunks(codes, self.chunk_size)
+        if len(chunks) <= 1:
+            return await self._fetch_chunk(codes)
+
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_REQUESTS)
+
+        async def fetch(chunk: List[str]) -> Dict[str, float]:
+            async with semaphore:
+                return await self._fetch_chunk(chunk)
+
+        results = []
+        errors = []
+        for result in await asyncio.gather(*map(fetch, chunks),
+                                           return_exceptions=True):
+            if isinstance(result, ApiRequestError):
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                results.append(result)
+        return _merge_chunks(results, errors, len(chunks))
+
+    async def _fetch_chunk(self, codes: List[str]) -> Dict[str, float]:
+        """Запрос курсов одной части списка криптовалют."""
+        try:
+            params = {
+                'ids': ",".join(self.crypto_id_map[code] for code in codes),
+                'vs_currencies': 'usd'
+            }
+            data = await self._get_json(self.base_url, params)
+            return _coingecko_rates(self.crypto_id_map, codes, data)
+
+        except (AsyncHttpError, OSError, ValueError) as e:
+            error_msg = f"CoinGecko API error: {e}"
+            if getattr(e, 'status_code', None) is not None:
+                error_msg += f" (Status: {e.status_code})"
+            raise ApiRequestError(error_msg)
+
+
+class AsyncExchangeRateApiClient(AsyncBaseApiClient):
+    """Асинхронный клиент ExchangeRate-API."""
+
+    source = SOURCE_EXCHANGERATE
+
+    def __init__(self, api_key: str, session: AsyncHttpSession,
+                 base_currency: str = "USD",
+                 timeout: int = DEFAULT_REQUEST_TIMEOUT,
+                 base_url: str = parser_config.EXCHANGERATE_API_BASE_URL,
+                 rate_limiter: TokenBucket = None,
+                 response_cache: ResponseCache = None):
+        self.api_key = api_key
+        self.session = session
+        self.base_currency = base_currency
+        self.timeout = timeout
+        self.base_url = f"{base_url}/{api_key}/latest/{base_currency}"
+        self.rate_limiter = rate_limiter or get_rate_limiter(SOURCE_EXCHANGERATE)
+        self.response_cache = response_cache or ResponseCache()
+
+    async def fetch_rates(self) -> Dict[str, float]:
+        """Получение курсов фиатных валют от ExchangeRate-API."""
+        try:
+            data = await self._get_json(self.base_url,
+                                        expires_at=_next_update_time)
+            if data.get("result") != "success":
+                self.response_cache.clear()
+            return _exchangerate_rates(data, self.base_currency)
+
+        except (AsyncHttpError, OSError, ValueError) as e:
+            raise ApiRequestError(_exchangerate_error(
+                getattr(e, 'status_code', None), f"ExchangeRate-API error: {e}"
+            ))
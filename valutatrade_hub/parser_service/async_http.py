@@ -0,0 +1,223 @@
+import asyncio
+import gzip
+import http.client
+import io
+import json
+import logging
+import ssl
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from valutatrade_hub.parser_service.constants import (
+    DEFAULT_REQUEST_TIMEOUT,
+    HTTP_DEFAULT_HEADERS,
+    HTTP_POOL_MAXSIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+_NO_BODY_STATUSES = (204, 304)
+
+
+class AsyncHttpError(Exception):
+    """Ошибка протокола или ответ HTTP с кодом ошибки"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class AsyncHttpResponse:
+    """Ответ HTTP с прочитанным и распакованным телом"""
+
+    status_code: int
+    reason: str
+    headers: http.client.HTTPMessage
+    content: bytes
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise AsyncHttpError(f"{self.status_code} {self.reason}",
+                                 self.status_code)
+
+
+class AsyncHttpSession:
+    """Минимальный асинхронный HTTP/1.1 клиент поверх asyncio.open_connection.
+
+    Поддерживает только GET запросы к JSON API: keep-alive соединения
+    переиспользуются (до pool_maxsize свободных на хост), тело читается
+    по Content-Length, chunked или до закрытия соединения и распаковывается
+    из gzip/deflate. Сессия привязана к циклу событий, в котором открыты
+    ее соединения.
+    """
+
+    def __init__(self, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 headers: Dict[str, str] = None):
+        self.pool_maxsize = pool_maxsize
+        self.headers = dict(HTTP_DEFAULT_HEADERS if headers is None else headers)
+        self._idle: Dict[Tuple[str, str, int], List[_Connection]] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    async def get(self, url: str, params: Dict[str, str] = None,
+                  headers: Dict[str, str] = None,
+                  timeout: float = DEFAULT_REQUEST_TIMEOUT) -> AsyncHttpResponse:
+        """GET запрос с общим таймаутом на соединение и чтение ответа"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Неподдерживаемый URL: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+
+        target = parts.path or "/"
+        query = "&".join(filter(None, [parts.query, urlencode(params or {})]))
+        if query:
+            target += f"?{query}"
+        request_headers = {"Host": parts.netloc, **self.headers, **(headers or {})}
+        request = (f"GET {target} HTTP/1.1\r\n"
+                   + "".join(f"{name}: {value}\r\n"
+                             for name, value in request_headers.items())
+                   + "\r\n").encode("latin-1")
+
+        async with asyncio.timeout(timeout):
+            # Свободное соединение могло быть закрыто сервером: один повтор
+            # на новом соединении
+            while True:
+                connection, reused = await self._connect(key)
+                try:
+                    return await self._exchange(key, connection, request)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    self._discard(connection)
+                    if not reused:
+                        raise ConnectionError(f"Соединение с {parts.hostname} "
+                                              f"прервано: {e}") from e
+                except BaseException:
+                    self._discard(connection)
+                    raise
+
+    async def close(self) -> None:
+        """Закрытие свободных соединений"""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (OSError, ssl.SSLError):
+                    pass
+
+    async def _connect(self, key: Tuple[str, str, int]) -> Tuple[_Connection, bool]:
+        connections = self._idle.get(key, [])
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        connection = await asyncio.open_connection(host, port, ssl=ssl_context)
+        logger.debug(f"Открыто соединение с {host}:{port}")
+        return connection, False
+
+    def _release(self, key: Tuple[str, str, int], connection: _Connection) -> None:
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self.pool_maxsize:
+            connections.append(connection)
+        else:
+            self._discard(connection)
+
+    @staticmethod
+    def _discard(connection: _Connection) -> None:
+        connection[1].close()
+
+    async def _exchange(self, key: Tuple[str, str, int], connection: _Connection,
+                        request: bytes) -> AsyncHttpResponse:
+        """Отправка запроса и чтение ответа по одному соединению"""
+        reader, writer = connection
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("сервер закрыл соединение")
+        try:
+            version, status, *reason = status_line.decode("latin-1").split(None, 2)
+            status_code = int(status)
+        except ValueError:
+            raise AsyncHttpError(f"Некорректная строка статуса: {status_line!r}")
+
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            header_lines.append(line)
+        headers = http.client.parse_headers(io.BytesIO(b"".join(header_lines)
+                                                       + b"\r\n"))
+
+        keep_alive = (version == "HTTP/1.1"
+                      and headers.get("Connection", "").lower() != "close")
+        if status_code in _NO_BODY_STATUSES or 100 <= status_code < 200:
+            body = b""
+        elif headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif headers.get("Content-Length") is not None:
+            body = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        if keep_alive:
+            self._release(key, connection)
+        else:
+            self._discard(connection)
+
+        return AsyncHttpResponse(
+            status_code=status_code,
+            reason=reason[0].strip() if reason else "",
+            headers=headers,
+            content=self._decode(body, headers.get("Content-Encoding", ""))
+        )
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b";")[0], 16)
+            except ValueError:
+                raise AsyncHttpError(f"Некорректный размер части: {size_line!r}")
+            if size == 0:
+                # Завершающие заголовки (trailer) до пустой строки
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    @staticmethod
+    def _decode(body: bytes, encoding: str) -> bytes:
+        encoding = encoding.lower()
+        try:
+            if encoding == "gzip":
+                return gzip.decompress(body)
+            if encoding == "deflate":
+                try:
+                    return zlib.decompress(body)
+                except zlib.error:
+                    return zlib.decompress(body, -zlib.MAX_WBITS)
+        except (OSError, EOFError, zlib.error) as e:
+            raise AsyncHttpError(f"Не удалось распаковать ответ ({encoding}): {e}")
+        return body
@@ -1,17 +1,28 @@
 import os
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
 from valutatrade_hub.core.exceptions import ConfigError
+from valutatrade_hub.infra.setting import settings
 from valutatrade_hub.parser_service.constants import (
     API_KEY_MISSING_MSG,
+    COINGECKO_JITTER_SECONDS,
+    COINGECKO_TTL_SECONDS,
     CONFIG_VALIDATION_FAILED,
     DEFAULT_REQUEST_TIMEOUT,
     DEFAULT_UPDATE_INTERVAL,
+    EXCHANGERATE_JITTER_SECONDS,
+    EXCHANGERATE_TTL_SECONDS,
+    HISTORY_DIRNAME,
     HISTORY_FILENAME,
+    RATES_BINARY_FILENAME,
     RATES_FILENAME,
+    RATES_SOCKET_FILENAME,
+    SOURCE_COINGECKO,
+    SOURCE_EXCHANGERATE,
+    VALUATIONS_FILENAME,
 )
 
 load_dotenv()
@@ -41,10 +52,16 @@ class ParserConfig:
     # Таймауты и интервалы
     REQUEST_TIMEOUT: int = DEFAULT_REQUEST_TIMEOUT
     UPDATE_INTERVAL: int = DEFAULT_UPDATE_INTERVAL
+    SOURCE_TTL_SECONDS: Dict[str, int] = None
+    SOURCE_JITTER_SECONDS: Dict[str, int] = None
     
     # Пути к файлам
     RATES_FILE_PATH: str = f"data/{RATES_FILENAME}"
+    RATES_BINARY_FILE_PATH: str = f"data/{RATES_BINARY_FILENAME}"
+    RATES_SOCKET_PATH: str = f"data/{RATES_SOCKET_FILENAME}"
     HISTORY_FILE_PATH: str = f"data/{HISTORY_FILENAME}"
+    HISTORY_DIR_PATH: str = f"data/{HISTORY_DIRNAME}"
+    VALUATIONS_FILE_PATH: str = f"data/{VALUATIONS_FILENAME}"
     
     def __post_init__(self):
         """Инициализация вычисляемых полей после создания объекта."""
@@ -57,6 +74,26 @@ class ParserConfig:
                 "DOT": "polkadot",
                 "DOGE": "dogecoin"
             })
+        if self.SOURCE_TTL_SECONDS is None:
+            # Сроки из [tool.valutatrade] заменяют значения по умолчанию
+            object.__setattr__(self, 'SOURCE_TTL_SECONDS', {
+                SOURCE_COINGECKO: COINGECKO_TTL_SECONDS,
+                SOURCE_EXCHANGERATE: EXCHANGERATE_TTL_SECONDS,
+                **settings.get("rates_source_ttl_seconds", {})
+            })
+        if self.SOURCE_JITTER_SECONDS is None:
+            object.__setattr__(self, 'SOURCE_JITTER_SECONDS', {
+                SOURCE_COINGECKO: COINGECKO_JITTER_SECONDS,
+                SOURCE_EXCHANGERATE: EXCHANGERATE_JITTER_SECONDS
+            })
+    
+    def source_ttl_seconds(self, source: Optional[str]) -> int:
+        """Срок свежести курсов источника; для неизвестного - интервал обновления"""
+        return self.SOURCE_TTL_SECONDS.get(source, self.UPDATE_INTERVAL)
+    
+    def source_jitter_seconds(self, source: Optional[str]) -> int:
+        """Предел случайной задержки запланированного опроса источника"""
+        return self.SOURCE_JITTER_SECONDS.get(source, 0)
     
     @property
     def exchangerate_api_url(self) -> str:
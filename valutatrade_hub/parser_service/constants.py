@@ -5,24 +5,90 @@
 # Настройки запросов
 DEFAULT_REQUEST_TIMEOUT = 10
 MAX_REQUEST_TIMEOUT = 30
-RETRY_ATTEMPTS = 3
+RETRY_ATTEMPTS = 3             # попыток запроса к источнику за обновление
+RETRY_BASE_DELAY = 0.5         # секунд перед первым повтором
+RETRY_MAX_DELAY = 4.0          # предел паузы между повторами
+UPDATE_DEADLINE = 15           # секунд на опрос всех клиентов за обновление
+MAX_FETCH_WORKERS = 4          # потоков для параллельного опроса клиентов
+
+# Предохранитель источников
+CIRCUIT_FAILURE_THRESHOLD = 3  # неудачных обновлений подряд до отключения
+CIRCUIT_RESET_TIMEOUT = 600    # секунд до пробного запроса
+CIRCUIT_PROBE_TIMEOUT = 30     # секунд на исход пробного запроса
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Пул HTTP соединений
+HTTP_POOL_CONNECTIONS = 4      # число хостов с отдельным пулом
+HTTP_POOL_MAXSIZE = 10         # keep-alive соединений на хост
+HTTP_DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+}
 
 # Настройки планировщика
 DEFAULT_UPDATE_INTERVAL = 300  # 5 минут
+COINGECKO_TTL_SECONDS = 60     # срок свежести курсов криптовалют
+EXCHANGERATE_TTL_SECONDS = 3600  # срок свежести фиатных курсов
+COINGECKO_JITTER_SECONDS = 5   # случайная задержка опроса внутри тика
+EXCHANGERATE_JITTER_SECONDS = 60
 MIN_UPDATE_INTERVAL = 60       # 1 минута
 SHUTDOWN_TIMEOUT = 5           # секунд на завершение потока
-POLLING_INTERVAL = 1           # секунда между проверками остановки
 
 # Настройки файлов
 RATES_FILENAME = "rates.json"
-HISTORY_FILENAME = "exchange_rates.json"
+RATES_FILE_MODE = 0o644  # права файлов курсов, создаваемых через mkstemp
+HISTORY_FILENAME = "exchange_rates.json"   # устаревший формат истории
+HISTORY_DIRNAME = "history"
+HISTORY_SEGMENT_PREFIX = "rates-"    # устаревшие JSONL сегменты истории
+HISTORY_TIMESTAMPS_FILENAME = "timestamps.i64"
+HISTORY_COLUMN_SUFFIX = ".f64"
+HISTORY_LOCK_FILENAME = ".lock"        # блокировка записи сегмента дня
+HISTORY_INDEX_DIRNAME = "index"       # дни, в которых писалась пара
+HISTORY_INDEX_SUFFIX = ".days"
+HISTORY_INDEX_COMPLETE_FILENAME = ".complete"
+HISTORY_MIGRATED_FILENAME = ".migrated"  # перенос устаревших форматов завершен
+HISTORY_BARS_DIRNAME = "ohlc"
+HISTORY_BARS_SUFFIX = ".ohlc"
+HISTORY_BARS_STATE_FILENAME = "state.json"
+
+# История курсов
+HISTORY_BAR_HOURLY = 3600            # секунд в часовом баре
+HISTORY_BAR_DAILY = 86400            # секунд в дневном баре
+HISTORY_BAR_RESOLUTIONS = (HISTORY_BAR_HOURLY, HISTORY_BAR_DAILY)
+HISTORY_RAW_RETENTION_DAYS = 7       # срок хранения сырых тиков
+HISTORY_HOURLY_RETENTION_DAYS = 180  # срок хранения часовых баров
+HISTORY_COMPACTION_MAX_BUCKETS = 48  # периодов каждого уровня за одно сжатие
+VALUATIONS_FILENAME = "valuations.json"
+RATES_BINARY_FILENAME = "rates.bin"
+RATES_SOCKET_FILENAME = "rates.sock"
+
+# Бинарный снимок курсов
+SNAPSHOT_MAGIC = b"VTRB"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_CODE_SIZE = 8               # байт на код валюты в заголовке
+SNAPSHOT_RETIRED = 2 ** 64 - 1       # поколение замененного файла
+SNAPSHOT_READ_RETRIES = 1000         # попыток согласованного чтения
+SNAPSHOT_SHM_PREFIX = "valutatrade_rates_"  # имя блока общей памяти демона
+
+# Сервер запросов курсов (Unix socket)
+QUERY_GET_RATE = "get_rate"
+QUERY_CONVERT = "convert"
+QUERY_CONVERT_MANY = "convert_many"
+QUERY_CLIENT_TIMEOUT = 1.0           # секунд на ответ сервера
+QUERY_MAX_REQUEST_BYTES = 1024 * 1024  # предел длины строки запроса
 
 # Логирование
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
 # API лимиты
 COINGECKO_RATE_LIMIT_DELAY = 1.0  # секунда между запросами
-MAX_RATES_PER_REQUEST = 100
+COINGECKO_RATE_LIMIT_BURST = 3    # запросов подряд без ожидания
+EXCHANGERATE_RATE_LIMIT_DELAY = 1.0
+EXCHANGERATE_RATE_LIMIT_BURST = 1
+MAX_RATES_PER_REQUEST = 100       # id криптовалют в одном запросе CoinGecko
+MAX_PARALLEL_REQUESTS = 4         # одновременных запросов частей к одному API
 
 # Сообщения об ошибках
 API_KEY_MISSING_MSG = "API ключ не установлен для {}"
@@ -31,5 +97,6 @@ CONFIG_VALIDATION_FAILED = "Ошибка валидации конфигурац
 # Команды CLI
 COMMAND_UPDATE = "update"
 COMMAND_SCHEDULE = "schedule"
+COMMAND_SERVE = "serve"
 SOURCE_COINGECKO = "coingecko"
 SOURCE_EXCHANGERATE = "exchangerate"
\ No newline at end of file
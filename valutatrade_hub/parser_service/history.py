@@ -0,0 +1,823 @@
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from valutatrade_hub.core.exceptions import StorageError
+from valutatrade_hub.infra.constants import STORAGE_BACKEND_SQLITE
+from valutatrade_hub.infra.file_lock import file_lock
+from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import (
+    HISTORY_BAR_DAILY,
+    HISTORY_BAR_HOURLY,
+    HISTORY_BAR_RESOLUTIONS,
+    HISTORY_BARS_DIRNAME,
+    HISTORY_BARS_STATE_FILENAME,
+    HISTORY_BARS_SUFFIX,
+    HISTORY_COLUMN_SUFFIX,
+    HISTORY_COMPACTION_MAX_BUCKETS,
+    HISTORY_HOURLY_RETENTION_DAYS,
+    HISTORY_INDEX_COMPLETE_FILENAME,
+    HISTORY_INDEX_DIRNAME,
+    HISTORY_INDEX_SUFFIX,
+    HISTORY_LOCK_FILENAME,
+    HISTORY_MIGRATED_FILENAME,
+    HISTORY_RAW_RETENTION_DAYS,
+    HISTORY_SEGMENT_PREFIX,
+    HISTORY_TIMESTAMPS_FILENAME,
+)
+from valutatrade_hub.parser_service.storage import (
+    JsonFileStorage,
+    SqliteStorage,
+    get_sqlite_storage,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# OHLC бар: (начало периода в мс epoch, open, high, low, close)
+Bar = Tuple[int, float, float, float, float]
+
+DAY_MS = 86400 * 1000
+
+
+def _merge_bars(bars: Iterable[Bar], resolution_ms: int) -> List[Bar]:
+    """Сворачивание упорядоченных по времени баров (или тиков) в более крупные"""
+    result: List[Bar] = []
+    for start, open_, high, low, close in bars:
+        bucket = start - start % resolution_ms
+        if result and result[-1][0] == bucket:
+            _, first_open, max_high, min_low, _ = result[-1]
+            result[-1] = (bucket, first_open, max(max_high, high),
+                          min(min_low, low), close)
+        else:
+            result.append((bucket, open_, high, low, close))
+    return result
+
+
+class BaseHistoryStore(ABC):
+    """Абстрактное хранилище истории курсов с уровнями детализации.
+
+    Сырые тики хранятся raw_retention_days дней, часовые OHLC бары -
+    hourly_retention_days дней, дневные бары - без ограничения. Запросы
+    за пределами сырых тиков дочитывают цены закрытия баров.
+    """
+
+    def __init__(self, raw_retention_days: float = HISTORY_RAW_RETENTION_DAYS,
+                 hourly_retention_days: float = HISTORY_HOURLY_RETENTION_DAYS):
+        self.raw_retention_days = raw_retention_days
+        self.hourly_retention_days = hourly_retention_days
+
+    @abstractmethod
+    def append(self, timestamp: datetime, rates: Dict[str, float]) -> None:
+        """Добавление одной записи истории"""
+        pass
+
+    @abstractmethod
+    def iter_entries(self, since: datetime = None,
+                     until: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Сырые записи {"timestamp", "rates"} в порядке времени"""
+        pass
+
+    def series(self, pair: str, since: datetime = None, until: datetime = None,
+               resolution: int = None) -> Tuple[array, array]:
+        """Временной ряд пары: (мс epoch как array('q'), курсы как array('d')).
+
+        Без resolution возвращаются сырые тики, а более ранняя часть
+        интервала дополняется ценами закрытия часовых и дневных баров.
+        С resolution (секунды) - только цены закрытия баров этого уровня.
+        """
+        since_ms = _to_epoch_ms(since) if since else None
+        until_ms = _to_epoch_ms(until) if until else None
+        if resolution is not None:
+            bars = self.bars(pair, resolution, since, until)
+        else:
+            timestamps, values = self._raw_series(pair, since, until)
+            raw_start = self._raw_start()
+            if raw_start is not None and (since_ms is None or since_ms >= raw_start):
+                return timestamps, values
+            if raw_start is not None:
+                until_ms = min(until_ms if until_ms is not None else raw_start,
+                               raw_start - 1)
+            bars = self._older_bars(pair, since_ms, until_ms)
+            older = (array('q', (bar[0] for bar in bars)),
+                     array('d', (bar[4] for bar in bars)))
+            return older[0] + timestamps, older[1] + values
+        return (array('q', (bar[0] for bar in bars)),
+                array('d', (bar[4] for bar in bars)))
+
+    def value_at(self, pair: str, at: datetime) -> Optional[Tuple[int, float]]:
+        """Последнее значение пары не позже момента at: (мс epoch, курс)"""
+        found = self._raw_value_at(pair, at)
+        if found is not None:
+            return found
+        at_ms = _to_epoch_ms(at)
+        for resolution in HISTORY_BAR_RESOLUTIONS:
+            bar = self._last_bar(resolution, pair, at_ms)
+            if bar is not None:
+                return bar[0], bar[4]
+        return None
+
+    def bars(self, pair: str, resolution: int, since: datetime = None,
+             until: datetime = None) -> List[Bar]:
+        """OHLC бары пары уровня resolution (секунды) за интервал"""
+        return self._read_bars(
+            resolution, pair,
+            _to_epoch_ms(since) if since else None,
+            _to_epoch_ms(until) if until else None
+        ).get(pair, [])
+
+    def compact(self, now: datetime = None) -> int:
+        """Инкрементальное сжатие истории; число записанных баров.
+
+        Завершенные часы сырых тиков сворачиваются в часовые бары,
+        завершенные дни часовых баров - в дневные, не более
+        HISTORY_COMPACTION_MAX_BUCKETS периодов каждого уровня за вызов.
+        Затем удаляются данные старше срока хранения, уже свернутые
+        в следующий уровень.
+        """
+        now_ms = _to_epoch_ms(now or datetime.now(timezone.utc))
+        watermarks = self._load_watermarks()
+        if HISTORY_BAR_HOURLY not in watermarks:
+            raw_start = self._raw_start()
+            if raw_start is None:
+                return 0
+            for resolution in HISTORY_BAR_RESOLUTIONS:
+                watermarks[resolution] = raw_start - raw_start % (resolution * 1000)
+                self._save_watermark(resolution, watermarks[resolution])
+
+        written = 0
+        source_until = now_ms
+        for resolution in HISTORY_BAR_RESOLUTIONS:
+            resolution_ms = resolution * 1000
+            start = watermarks[resolution]
+            end = min(source_until - source_until % resolution_ms,
+                      start + HISTORY_COMPACTION_MAX_BUCKETS * resolution_ms)
+            if end > start:
+                if resolution == HISTORY_BAR_HOURLY:
+                    source = self._raw_ticks(start, end - 1)
+                else:
+                    source = self._read_bars(HISTORY_BAR_HOURLY, None, start, end - 1)
+                bars = {pair: _merge_bars(pair_bars, resolution_ms)
+                        for pair, pair_bars in source.items() if pair_bars}
+                self._write_bars(resolution, bars)
+                self._save_watermark(resolution, end)
+                watermarks[resolution] = end
+                written += sum(len(pair_bars) for pair_bars in bars.values())
+            source_until = watermarks[resolution]
+
+        self._drop_raw_before(min(now_ms - self.raw_retention_days * DAY_MS,
+                                  watermarks[HISTORY_BAR_HOURLY]))
+        self._drop_bars_before(HISTORY_BAR_HOURLY,
+                               min(now_ms - self.hourly_retention_days * DAY_MS,
+                                   watermarks[HISTORY_BAR_DAILY]))
+        if written:
+            logger.info(f"Сжатие истории курсов: записано {written} баров")
+        return written
+
+    def _raw_ticks(self, since_ms: int, until_ms: int) -> Dict[str, List[Bar]]:
+        """Сырые тики интервала как вырожденные бары по парам"""
+        ticks: Dict[str, List[Bar]] = {}
+        for entry in self.iter_entries(_from_epoch_ms(since_ms),
+                                       _from_epoch_ms(until_ms)):
+            ts = _to_epoch_ms(datetime.fromisoformat(entry["timestamp"]))
+            for pair, value in entry["rates"].items():
+                ticks.setdefault(pair, []).append((ts, value, value, value, value))
+        return ticks
+
+    def _older_bars(self, pair: str, since_ms: Optional[int],
+                    until_ms: Optional[int]) -> List[Bar]:
+        """Бары пары: часовые, а до их начала - дневные"""
+        hourly = self._read_bars(HISTORY_BAR_HOURLY, pair,
+                                 since_ms, until_ms).get(pair, [])
+        daily_until = hourly[0][0] - 1 if hourly else until_ms
+        daily = self._read_bars(HISTORY_BAR_DAILY, pair,
+                                since_ms, daily_until).get(pair, [])
+        return daily + hourly
+
+    @abstractmethod
+    def _raw_series(self, pair: str, since: Optional[datetime],
+                    until: Optional[datetime]) -> Tuple[array, array]:
+        """Сырые тики пары за интервал"""
+        pass
+
+    @abstractmethod
+    def _raw_value_at(self, pair: str,
+                      at: datetime) -> Optional[Tuple[int, float]]:
+        """Последний сырой тик пары не позже момента at"""
+        pass
+
+    @abstractmethod
+    def _raw_start(self) -> Optional[int]:
+        """Время самого раннего сырого тика в мс epoch"""
+        pass
+
+    @abstractmethod
+    def _drop_raw_before(self, until_ms: int) -> None:
+        """Удаление сырых тиков старше until_ms (допустимо с запасом)"""
+        pass
+
+    @abstractmethod
+    def _read_bars(self, resolution: int, pair: Optional[str],
+                   since_ms: Optional[int],
+                   until_ms: Optional[int]) -> Dict[str, List[Bar]]:
+        """Бары уровня по парам (pair=None - все пары) с началом в интервале"""
+        pass
+
+    @abstractmethod
+    def _last_bar(self, resolution: int, pair: str, at_ms: int) -> Optional[Bar]:
+        """Последний бар пары с началом не позже at_ms"""
+        pass
+
+    @abstractmethod
+    def _write_bars(self, resolution: int, bars: Dict[str, List[Bar]]) -> None:
+        """Идемпотентная запись баров (повтор после сбоя не дублирует их)"""
+        pass
+
+    @abstractmethod
+    def _drop_bars_before(self, resolution: int, until_ms: int) -> None:
+        """Удаление баров уровня старше until_ms (допустимо с запасом)"""
+        pass
+
+    @abstractmethod
+    def _load_watermarks(self) -> Dict[int, int]:
+        """Границы сжатия по уровням: до какого момента построены бары"""
+        pass
+
+    @abstractmethod
+    def _save_watermark(self, resolution: int, until_ms: int) -> None:
+        pass
+
+
+def _to_epoch_ms(timestamp: datetime) -> int:
+    """Время в миллисекундах epoch (наивное время считается UTC)"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+
+def _from_epoch_ms(epoch_ms: int) -> datetime:
+    return datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+
+
+def _utc_isoformat(timestamp: Optional[datetime]) -> Optional[str]:
+    """ISO время в UTC (наивное время считается UTC).
+
+    Время в SQLite хранится и сравнивается строками, поэтому все метки
+    и границы запросов приводятся к одному смещению +00:00.
+    """
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).isoformat()
+
+
+@contextmanager
+def _mapped(path: Path, typecode: str) -> Iterator[memoryview]:
+    """Отображение файла колонки в память как типизированный memoryview"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        yield memoryview(b"").cast(typecode)
+        return
+    except OSError as e:
+        raise StorageError(f"Ошибка чтения {path}: {e}") from e
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        itemsize = array(typecode).itemsize
+        if size < itemsize:
+            yield memoryview(b"").cast(typecode)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as raw:
+                with raw[:size - size % itemsize].cast(typecode) as view:
+                    yield view
+
+
+def _replace_file(path: Path, values: array) -> None:
+    """Атомарная замена файла колонки: читатели видят старое или новое"""
+    fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(values.tobytes())
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+def _bar_at(view: memoryview, index: int) -> Bar:
+    """Бар с номером index из файла баров (записи по пять float64)"""
+    offset = index * 5
+    return (int(view[offset]), view[offset + 1], view[offset + 2],
+            view[offset + 3], view[offset + 4])
+
+
+class ColumnarHistoryStore(BaseHistoryStore):
+    """Колоночная история курсов, разбитая на сегменты по дням (UTC).
+
+    Сегмент дня - каталог с колонкой времени timestamps.i64 (int64, мс
+    epoch) и колонкой <PAIR>.f64 (float64, NaN - нет курса) на каждую
+    пару, в порядке байтов платформы. Обновление дописывает по 8 байт в
+    каждую колонку; колонка времени пишется последней и задает число
+    зафиксированных строк. Чтение отображает в память только нужные
+    колонки нужных дней и находит диапазон бинарным поиском.
+
+    Бары уровня хранятся в ohlc/<resolution>/<период>/<PAIR>.ohlc
+    записями по пять float64 (начало, open, high, low, close); период -
+    месяц для часовых баров и год для дневных.
+
+    В историю пишутся только изменившиеся пары, поэтому редко меняющейся
+    пары может не быть в последних днях. Индекс index/<PAIR>.days хранит
+    отсортированные начала дней (int64, мс epoch), в которых писалась
+    пара: курс на момент находится бинарным поиском по индексу, а не
+    перебором каталогов дней.
+    """
+
+    def __init__(self, root: str = None,
+                 raw_retention_days: float = HISTORY_RAW_RETENTION_DAYS,
+                 hourly_retention_days: float = HISTORY_HOURLY_RETENTION_DAYS):
+        super().__init__(raw_retention_days, hourly_retention_days)
+        self._root = Path(root or parser_config.HISTORY_DIR_PATH)
+        self._bars_root = self._root / HISTORY_BARS_DIRNAME
+        self._index_root = self._root / HISTORY_INDEX_DIRNAME
+        self._bars_state = JsonFileStorage(
+            self._bars_root / HISTORY_BARS_STATE_FILENAME
+        )
+        self._lock = threading.Lock()
+        self._migrate_legacy_files()
+        self._build_index()
+
+    def append(self, timestamp: datetime, rates: Dict[str, float]) -> None:
+        """Дозапись строки: по одному значению в колонку каждой пары.
+
+        Историю дописывают и демон, и обновление в процессе приложения,
+        поэтому строка пишется под межпроцессной блокировкой сегмента дня,
+        а число строк и набор пар берутся из размеров файлов колонок.
+        Строка не позже последней строки дня отбрасывается: колонка
+        времени должна оставаться отсортированной для бинарного поиска.
+        """
+        if not self._append_row(timestamp, rates):
+            logger.warning(f"Запись истории за {timestamp.isoformat()} "
+                           f"отброшена: в сегменте дня уже есть более поздняя")
+
+    def _append_row(self, timestamp: datetime, rates: Dict[str, float]) -> bool:
+        """Дозапись строки; False - строка не позже последней строки дня"""
+        epoch_ms = _to_epoch_ms(timestamp)
+        day_dir = self._root / _from_epoch_ms(epoch_ms).date().isoformat()
+        try:
+            day_dir.mkdir(parents=True, exist_ok=True)
+            with file_lock(day_dir / HISTORY_LOCK_FILENAME):
+                rows, pairs = self._align_day(day_dir)
+                if rows and epoch_ms <= self._last_timestamp(day_dir, rows):
+                    return False
+                new_pairs = set(rates) - pairs
+                if new_pairs:
+                    self._index_day(new_pairs, epoch_ms - epoch_ms % DAY_MS)
+                for pair in pairs.union(rates):
+                    values = array('d', [rates.get(pair, math.nan)])
+                    if pair not in pairs:
+                        # Новая пара: строки до ее появления заполняются NaN
+                        values = array('d', [math.nan]) * rows + values
+                    with open(day_dir / f"{pair}{HISTORY_COLUMN_SUFFIX}", 'ab') as f:
+                        f.write(values.tobytes())
+                with open(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'ab') as f:
+                    f.write(array('q', [epoch_ms]).tobytes())
+        except OSError as e:
+            raise StorageError(f"Ошибка записи истории в {day_dir}: {e}") from e
+        return True
+
+    @staticmethod
+    def _last_timestamp(day_dir: Path, rows: int) -> int:
+        with open(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'rb') as f:
+            f.seek((rows - 1) * 8)
+            return array('q', f.read(8))[0]
+
+    def _raw_series(self, pair: str, since: Optional[datetime],
+                    until: Optional[datetime]) -> Tuple[array, array]:
+        """Читаются только колонка времени и колонка самой пары"""
+        timestamps, values = array('q'), array('d')
+        for day_dir in self._day_dirs(since, until):
+            with _mapped(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'q') as ts, \
+                    _mapped(day_dir / f"{pair}{HISTORY_COLUMN_SUFFIX}", 'd') as col:
+                lo, hi = self._row_range(ts, min(len(ts), len(col)), since, until)
+                for i in range(lo, hi):
+                    if not math.isnan(col[i]):
+                        timestamps.append(ts[i])
+                        values.append(col[i])
+        return timestamps, values
+
+    def _raw_value_at(self, pair: str,
+                      at: datetime) -> Optional[Tuple[int, float]]:
+        """Бинарный поиск дня по индексу пары, затем по колонке времени дня.
+
+        Предыдущий день индекса читается, только если в найденном дне до
+        момента at у пары нет значений.
+        """
+        at_ms = _to_epoch_ms(at)
+        with _mapped(self._index_path(pair), 'q') as days:
+            day = bisect_right(days, at_ms)
+            while day > 0:
+                day -= 1
+                found = self._day_value_at(days[day], pair, at_ms)
+                if found is not None:
+                    return found
+        return None
+
+    def _day_value_at(self, day_ms: int, pair: str,
+                      at_ms: int) -> Optional[Tuple[int, float]]:
+        day_dir = self._root / _from_epoch_ms(day_ms).date().isoformat()
+        with _mapped(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'q') as ts, \
+                _mapped(day_dir / f"{pair}{HISTORY_COLUMN_SUFFIX}", 'd') as col:
+            i = bisect_right(ts, at_ms, 0, min(len(ts), len(col)))
+            while i > 0:
+                i -= 1
+                if not math.isnan(col[i]):
+                    return ts[i], col[i]
+        return None
+
+    def _index_path(self, pair: str) -> Path:
+        return self._index_root / f"{pair}{HISTORY_INDEX_SUFFIX}"
+
+    def _index_day(self, pairs: Iterable[str], day_ms: int) -> None:
+        """Добавление дня в индексы пар с сохранением сортировки"""
+        with file_lock(self._index_root / HISTORY_LOCK_FILENAME):
+            for pair in pairs:
+                path = self._index_path(pair)
+                days = array('q')
+                if path.exists():
+                    days.frombytes(path.read_bytes())
+                if days and days[-1] >= day_ms:
+                    if day_ms in days:
+                        continue
+                    # День раньше последнего (перенос, запись задним числом)
+                    _replace_file(path, array('q', sorted([*days, day_ms])))
+                    continue
+                with open(path, 'ab') as f:
+                    f.write(array('q', [day_ms]).tobytes())
+
+    def _build_index(self) -> None:
+        """Однократное построение индекса дней по существующим сегментам"""
+        complete_path = self._index_root / HISTORY_INDEX_COMPLETE_FILENAME
+        if complete_path.exists():
+            return
+        try:
+            with file_lock(self._index_root / HISTORY_LOCK_FILENAME):
+                if complete_path.exists():
+                    return
+                index: Dict[str, List[int]] = {}
+                for day_dir in self._day_dirs(None, None):
+                    day_ms = _to_epoch_ms(datetime.fromisoformat(day_dir.name)
+                                          .replace(tzinfo=timezone.utc))
+                    for path in day_dir.glob(f"*{HISTORY_COLUMN_SUFFIX}"):
+                        insort(index.setdefault(path.stem, []), day_ms)
+                for pair, days in index.items():
+                    _replace_file(self._index_path(pair), array('q', days))
+                complete_path.touch()
+        except OSError as e:
+            raise StorageError(f"Ошибка построения индекса истории "
+                               f"{self._index_root}: {e}") from e
+
+    def iter_entries(self, since: datetime = None,
+                     until: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Сборка строк {"timestamp", "rates"} из колонок всех пар"""
+        for day_dir in self._day_dirs(since, until):
+            for entry in self._read_day(day_dir, since, until):
+                yield entry
+
+    def _day_dirs(self, since: Optional[datetime],
+                  until: Optional[datetime]) -> List[Path]:
+        """Каталоги дней, пересекающихся с интервалом [since, until]"""
+        first = _from_epoch_ms(_to_epoch_ms(since)).date().isoformat() if since else ""
+        last = _from_epoch_ms(_to_epoch_ms(until)).date().isoformat() if until else "~"
+        if not self._root.exists():
+            return []
+        return sorted(path for path in self._root.iterdir()
+                      if path.is_dir() and path.name[:1].isdigit()
+                      and first <= path.name <= last)
+
+    @staticmethod
+    def _row_range(ts: memoryview, rows: int, since: Optional[datetime],
+                   until: Optional[datetime]) -> Tuple[int, int]:
+        lo = bisect_left(ts, _to_epoch_ms(since), 0, rows) if since else 0
+        hi = bisect_right(ts, _to_epoch_ms(until), 0, rows) if until else rows
+        return lo, max(lo, hi)
+
+    def _read_day(self, day_dir: Path, since: Optional[datetime],
+                  until: Optional[datetime]) -> List[Dict[str, Any]]:
+        with ExitStack() as stack:
+            ts = stack.enter_context(
+                _mapped(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'q')
+            )
+            columns = {
+                path.stem: stack.enter_context(_mapped(path, 'd'))
+                for path in day_dir.glob(f"*{HISTORY_COLUMN_SUFFIX}")
+            }
+            lo, hi = self._row_range(ts, len(ts), since, until)
+            return [
+                {
+                    "timestamp": _from_epoch_ms(ts[i]).isoformat(),
+                    "rates": {pair: col[i] for pair, col in columns.items()
+                              if i < len(col) and not math.isnan(col[i])}
+                }
+                for i in range(lo, hi)
+            ]
+
+    @staticmethod
+    def _align_day(day_dir: Path) -> Tuple[int, Set[str]]:
+        """Число зафиксированных строк и пары сегмента дня.
+
+        Колонки выравниваются по колонке времени: хвост прерванной
+        записи отбрасывается, недописанные значения заполняются NaN.
+        Вызывается под блокировкой сегмента.
+        """
+        timestamps_path = day_dir / HISTORY_TIMESTAMPS_FILENAME
+        timestamps_path.touch()
+        rows = timestamps_path.stat().st_size // 8
+        os.truncate(timestamps_path, rows * 8)
+        pairs = set()
+        for path in day_dir.glob(f"*{HISTORY_COLUMN_SUFFIX}"):
+            size = path.stat().st_size
+            if size > rows * 8:
+                os.truncate(path, rows * 8)
+            elif size < rows * 8:
+                with open(path, 'ab') as f:
+                    f.write((array('d', [math.nan]) * (rows - size // 8))
+                            .tobytes())
+            pairs.add(path.stem)
+        return rows, pairs
+
+    def _raw_start(self) -> Optional[int]:
+        for day_dir in self._day_dirs(None, None):
+            with _mapped(day_dir / HISTORY_TIMESTAMPS_FILENAME, 'q') as ts:
+                if len(ts):
+                    return ts[0]
+        return None
+
+    def _drop_raw_before(self, until_ms: int) -> None:
+        """Удаление сегментов дней, целиком старше until_ms"""
+        cutoff = _from_epoch_ms(until_ms).date().isoformat()
+        with self._lock:
+            for day_dir in self._day_dirs(None, None):
+                if day_dir.name >= cutoff:
+                    break
+                shutil.rmtree(day_dir, ignore_errors=True)
+                logger.debug(f"Удален сегмент истории {day_dir}")
+            self._drop_index_before(until_ms - until_ms % DAY_MS)
+
+    def _drop_index_before(self, day_ms: int) -> None:
+        """Удаление из индексов дней, сегменты которых удалены"""
+        with file_lock(self._index_root / HISTORY_LOCK_FILENAME):
+            for path in self._index_root.glob(f"*{HISTORY_INDEX_SUFFIX}"):
+                days = array('q', path.read_bytes())
+                keep = bisect_left(days, day_ms)
+                if keep:
+                    _replace_file(path, days[keep:])
+
+    # --- Бары ---
+
+    @staticmethod
+    def _bar_period(resolution: int, epoch_ms: int) -> str:
+        """Каталог периода бара: месяц для часовых, год для дневных"""
+        period_format = "%Y" if resolution >= HISTORY_BAR_DAILY else "%Y-%m"
+        return _from_epoch_ms(epoch_ms).strftime(period_format)
+
+    def _bar_periods(self, resolution: int, since_ms: Optional[int],
+                     until_ms: Optional[int]) -> List[Path]:
+        tier_root = self._bars_root / str(resolution)
+        if not tier_root.exists():
+            return []
+        first = self._bar_period(resolution, since_ms) if since_ms is not None else ""
+        last = self._bar_period(resolution, until_ms) if until_ms is not None else "~"
+        return sorted(path for path in tier_root.iterdir()
+                      if path.is_dir() and first <= path.name <= last)
+
+    def _read_bars(self, resolution: int, pair: Optional[str],
+                   since_ms: Optional[int],
+                   until_ms: Optional[int]) -> Dict[str, List[Bar]]:
+        result: Dict[str, List[Bar]] = {}
+        for period_dir in self._bar_periods(resolution, since_ms, until_ms):
+            paths = ([period_dir / f"{pair}{HISTORY_BARS_SUFFIX}"] if pair
+                     else sorted(period_dir.glob(f"*{HISTORY_BARS_SUFFIX}")))
+            for path in paths:
+                with _mapped(path, 'd') as view:
+                    count = len(view) // 5
+                    with view[0:count * 5:5] as starts:
+                        lo = (bisect_left(starts, since_ms)
+                              if since_ms is not None else 0)
+                        hi = (bisect_right(starts, until_ms)
+                              if until_ms is not None else count)
+                    if hi > lo:
+                        result.setdefault(path.stem, []).extend(
+                            _bar_at(view, i) for i in range(lo, hi)
+                        )
+        return result
+
+    def _last_bar(self, resolution: int, pair: str, at_ms: int) -> Optional[Bar]:
+        for period_dir in reversed(self._bar_periods(resolution, None, at_ms)):
+            with _mapped(period_dir / f"{pair}{HISTORY_BARS_SUFFIX}", 'd') as view:
+                count = len(view) // 5
+                with view[0:count * 5:5] as starts:
+                    i = bisect_right(starts, at_ms)
+                if i:
+                    return _bar_at(view, i - 1)
+        return None
+
+    def _write_bars(self, resolution: int, bars: Dict[str, List[Bar]]) -> None:
+        """Дозапись баров новее последнего записанного в файле периода"""
+        tier_root = self._bars_root / str(resolution)
+        for pair, pair_bars in bars.items():
+            by_period: Dict[str, List[Bar]] = {}
+            for bar in pair_bars:
+                by_period.setdefault(self._bar_period(resolution, bar[0]),
+                                     []).append(bar)
+            for period, period_bars in by_period.items():
+                path = tier_root / period / f"{pair}{HISTORY_BARS_SUFFIX}"
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.touch()
+                    record_size = 5 * 8
+                    size = path.stat().st_size
+                    # Недописанная после сбоя запись отбрасывается
+                    os.truncate(path, size - size % record_size)
+                    last_start = None
+                    with _mapped(path, 'd') as view:
+                        if len(view):
+                            last_start = view[len(view) - 5]
+                    values = array('d')
+                    for bar in period_bars:
+                        if last_start is None or bar[0] > last_start:
+                            values.extend(bar)
+                    with open(path, 'ab') as f:
+                        f.write(values.tobytes())
+                except OSError as e:
+                    raise StorageError(f"Ошибка записи баров в {path}: {e}") from e
+
+    def _drop_bars_before(self, resolution: int, until_ms: int) -> None:
+        """Удаление каталогов периодов, целиком старше until_ms"""
+        cutoff = self._bar_period(resolution, until_ms)
+        for period_dir in self._bar_periods(resolution, None, None):
+            if period_dir.name >= cutoff:
+                break
+            shutil.rmtree(period_dir, ignore_errors=True)
+            logger.debug(f"Удалены бары истории {period_dir}")
+
+    def _load_watermarks(self) -> Dict[int, int]:
+        if not self._bars_state.exists():
+            return {}
+        state = self._bars_state.load()
+        return {int(resolution): until_ms for resolution, until_ms in state.items()}
+
+    def _save_watermark(self, resolution: int, until_ms: int) -> None:
+        state = self._bars_state.load() if self._bars_state.exists() else {}
+        state[str(resolution)] = until_ms
+        self._bars_state.save(state)
+
+    def _migrate_legacy_files(self) -> None:
+        """Однократный перенос истории из exchange_rates.json и JSONL сегментов.
+
+        Признак завершения пишется последним. Прерванный перенос
+        повторяется: уже перенесенные строки не позже последней строки дня
+        отбрасываются при дозаписи.
+        """
+        migrated_path = self._root / HISTORY_MIGRATED_FILENAME
+        if migrated_path.exists():
+            return
+
+        with file_lock(self._root / HISTORY_LOCK_FILENAME):
+            if migrated_path.exists():
+                return
+            legacy_storage = JsonFileStorage(parser_config.HISTORY_FILE_PATH)
+            segments = sorted(self._root.glob(f"{HISTORY_SEGMENT_PREFIX}*.jsonl"))
+            entries = []
+            if not segments and legacy_storage.exists():
+                entries = legacy_storage.load().get("history", [])
+            for segment in segments:
+                try:
+                    with open(segment, 'rb') as f:
+                        entries.extend(json.loads(line) for line in f
+                                       if line.endswith(b"\n"))
+                except (OSError, json.JSONDecodeError) as e:
+                    raise StorageError(f"Ошибка чтения {segment}: {e}") from e
+
+            entries.sort(key=lambda entry: _to_epoch_ms(
+                datetime.fromisoformat(entry["timestamp"])))
+            migrated = sum(
+                self._append_row(datetime.fromisoformat(entry["timestamp"]),
+                                 entry["rates"])
+                for entry in entries
+            )
+            try:
+                migrated_path.touch()
+            except OSError as e:
+                raise StorageError(f"Ошибка записи {migrated_path}: {e}") from e
+            for segment in segments:
+                segment.unlink()
+        if entries:
+            logger.info(f"Перенесено {migrated} записей истории в {self._root}")
+
+
+class SqliteHistoryStore(BaseHistoryStore):
+    """История курсов в таблицах rate_history и rate_bars базы SQLite"""
+
+    def __init__(self, storage: SqliteStorage,
+                 raw_retention_days: float = HISTORY_RAW_RETENTION_DAYS,
+                 hourly_retention_days: float = HISTORY_HOURLY_RETENTION_DAYS):
+        super().__init__(raw_retention_days, hourly_retention_days)
+        self._storage = storage
+
+    def append(self, timestamp: datetime, rates: Dict[str, float]) -> None:
+        """Вставка строк записи"""
+        self._storage.append_history(_utc_isoformat(timestamp), rates)
+
+    def iter_entries(self, since: datetime = None,
+                     until: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Записи истории по индексу timestamp"""
+        return self._storage.iter_history(_utc_isoformat(since),
+                                          _utc_isoformat(until))
+
+    def _raw_series(self, pair: str, since: Optional[datetime],
+                    until: Optional[datetime]) -> Tuple[array, array]:
+        """Временной ряд пары по индексу (pair, timestamp)"""
+        rows = self._storage.get_history_series(pair, _utc_isoformat(since),
+                                                _utc_isoformat(until))
+        timestamps = array('q', (_to_epoch_ms(datetime.fromisoformat(timestamp))
+                                 for timestamp, _ in rows))
+        return timestamps, array('d', (rate for _, rate in rows))
+
+    def _raw_value_at(self, pair: str,
+                      at: datetime) -> Optional[Tuple[int, float]]:
+        """Последнее значение пары по индексу (pair, timestamp)"""
+        row = self._storage.get_history_value_at(pair, _utc_isoformat(at))
+        if row is None:
+            return None
+        timestamp, rate = row
+        return _to_epoch_ms(datetime.fromisoformat(timestamp)), rate
+
+    def _raw_start(self) -> Optional[int]:
+        timestamp = self._storage.get_history_start()
+        if timestamp is None:
+            return None
+        return _to_epoch_ms(datetime.fromisoformat(timestamp))
+
+    def _drop_raw_before(self, until_ms: int) -> None:
+        self._storage.delete_history_before(
+            _utc_isoformat(_from_epoch_ms(until_ms))
+        )
+
+    def _read_bars(self, resolution: int, pair: Optional[str],
+                   since_ms: Optional[int],
+                   until_ms: Optional[int]) -> Dict[str, List[Bar]]:
+        result: Dict[str, List[Bar]] = {}
+        for row in self._storage.get_bars(resolution, pair, since_ms, until_ms):
+            result.setdefault(row[0], []).append(tuple(row[1:]))
+        return result
+
+    def _last_bar(self, resolution: int, pair: str, at_ms: int) -> Optional[Bar]:
+        row = self._storage.get_last_bar(resolution, pair, at_ms)
+        return tuple(row) if row else None
+
+    def _write_bars(self, resolution: int, bars: Dict[str, List[Bar]]) -> None:
+        self._storage.save_bars(resolution, (
+            (pair, *bar) for pair, pair_bars in bars.items() for bar in pair_bars
+        ))
+
+    def _drop_bars_before(self, resolution: int, until_ms: int) -> None:
+        self._storage.delete_bars_before(resolution, until_ms)
+
+    def _load_watermarks(self) -> Dict[int, int]:
+        return self._storage.get_history_watermarks()
+
+    def _save_watermark(self, resolution: int, until_ms: int) -> None:
+        self._storage.set_history_watermark(resolution, until_ms)
+
+
+def create_history_store() -> BaseHistoryStore:
+    """Хранилище истории курсов согласно storage_backend из настроек"""
+    if settings.get("storage_backend") == STORAGE_BACKEND_SQLITE:
+        return SqliteHistoryStore(get_sqlite_storage())
+    return ColumnarHistoryStore()
+
+
+_history_store: Optional[BaseHistoryStore] = None
+
+
+def get_history_store() -> BaseHistoryStore:
+    """Общее для процесса хранилище истории курсов"""
+    global _history_store
+    if _history_store is None:
+        _history_store = create_history_store()
+    return _history_store
@@ -0,0 +1,51 @@
+import logging
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from valutatrade_hub.parser_service.constants import (
+    HTTP_DEFAULT_HEADERS,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_session(pool_connections: int = HTTP_POOL_CONNECTIONS,
+                        pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    """Сессия requests с пулом keep-alive соединений и сжатием ответов."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HTTP_DEFAULT_HEADERS)
+    logger.debug(f"Создана HTTP сессия: pool_connections={pool_connections}, "
+                 f"pool_maxsize={pool_maxsize}")
+    return session
+
+
+_shared_session: Optional[requests.Session] = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """Общая для всех API клиентов процесса HTTP сессия"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_http_session()
+        return _shared_session
+
+
+def close_shared_session() -> None:
+    """Закрытие общей сессии и всех ее соединений"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is not None:
+            _shared_session.close()
+            _shared_session = None
+            logger.debug("Общая HTTP сессия закрыта")
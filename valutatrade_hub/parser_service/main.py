@@ -1,55 +1,86 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
 import sys
 
-from valutatrade_hub.parser_service.api_clients import (
-    CoinGeckoClient,
-    ExchangeRateApiClient,
-)
-from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.core.exceptions import ConfigError
+from valutatrade_hub.infra.constants import RATES_TRANSPORT_SHM
+from valutatrade_hub.infra.setting import settings
 from valutatrade_hub.parser_service.constants import (
     COMMAND_SCHEDULE,
+    COMMAND_SERVE,
     COMMAND_UPDATE,
     SOURCE_COINGECKO,
     SOURCE_EXCHANGERATE,
 )
-from valutatrade_hub.parser_service.scheduler import Scheduler
-from valutatrade_hub.parser_service.storage import JsonFileStorage
-from valutatrade_hub.parser_service.updater import RatesUpdater
+from valutatrade_hub.parser_service.rates_server import RatesQueryServer
+from valutatrade_hub.parser_service.scheduler import AsyncScheduler
+from valutatrade_hub.parser_service.service import (
+    create_async_updater,
+    create_updater,
+)
+from valutatrade_hub.parser_service.snapshot import SharedMemorySnapshotWriter
+
+
+async def run_daemon(scheduler: AsyncScheduler,
+                     server: RatesQueryServer = None) -> None:
+    """Планировщик и, если задан, сервер курсов в одном цикле событий"""
+    scheduler.start()
+    try:
+        if server is not None:
+            await server.serve_forever()
+        else:
+            await scheduler.wait()
+    finally:
+        await scheduler.stop()
 
 
 def main():
     parser = argparse.ArgumentParser(description='ValutaTrade Parser Service')
-    parser.add_argument('command', choices=[COMMAND_UPDATE, COMMAND_SCHEDULE], 
-                       help='update - single update, schedule - run scheduler')
+    parser.add_argument('command',
+                       choices=[COMMAND_UPDATE, COMMAND_SCHEDULE, COMMAND_SERVE],
+                       help='update - single update, schedule - run scheduler, '
+                            'serve - run scheduler and rates query server')
     parser.add_argument('--source', choices=[SOURCE_COINGECKO, SOURCE_EXCHANGERATE],
                        help='Update from specific source only')
+    parser.add_argument('--force', action='store_true',
+                       help='Update all sources even if their rates are fresh')
     
     args = parser.parse_args()
     
-    clients = []
-    
-    clients.append(CoinGeckoClient(parser_config.CRYPTO_ID_MAP))
-    
-    if parser_config.EXCHANGERATE_API_KEY:
-        clients.append(ExchangeRateApiClient(parser_config.EXCHANGERATE_API_KEY))
-    
-    storage = JsonFileStorage(parser_config.RATES_FILE_PATH)
-    updater = RatesUpdater(clients, storage)
-    
     if args.command == COMMAND_UPDATE:
-        success = updater.run_update()
+        updater = create_updater(args.source)
+        success = updater.run_update(args.force)
+        updater.compact_history()
         sys.exit(0 if success else 1)
         
-    elif args.command == COMMAND_SCHEDULE:
-        scheduler = Scheduler(updater, parser_config.UPDATE_INTERVAL)
-        scheduler.start()
-        
+    elif args.command in (COMMAND_SCHEDULE, COMMAND_SERVE):
+        # Демон опрашивает источники конкурентно в одном цикле событий
+        updater = create_async_updater(args.source)
+
+        # Демон публикует курсы в общую память для процессов приложения
+        shm_writer = None
+        if settings.get("rates_transport") == RATES_TRANSPORT_SHM:
+            shm_writer = SharedMemorySnapshotWriter()
+            updater.post_update_stages.append(shm_writer.publish)
+
+        server = None
+        if args.command == COMMAND_SERVE:
+            server = RatesQueryServer()
+            server.load(updater.storage)
+            updater.post_update_stages.append(server.publish)
+
+        # Каждый источник опрашивается по своему сроку свежести с джиттером
         try:
-            while True:
-                scheduler._stop_event.wait(1)
+            asyncio.run(run_daemon(AsyncScheduler(updater), server))
         except KeyboardInterrupt:
-            scheduler.stop()
+            pass
+        except ConfigError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if shm_writer is not None:
+                shm_writer.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from valutatrade_hub.parser_service.constants import (
+    COINGECKO_RATE_LIMIT_BURST,
+    COINGECKO_RATE_LIMIT_DELAY,
+    EXCHANGERATE_RATE_LIMIT_BURST,
+    EXCHANGERATE_RATE_LIMIT_DELAY,
+    SOURCE_COINGECKO,
+    SOURCE_EXCHANGERATE,
+)
+
+# Интервал между запросами и допустимая серия для каждого источника
+_SOURCE_LIMITS = {
+    SOURCE_COINGECKO: (COINGECKO_RATE_LIMIT_DELAY, COINGECKO_RATE_LIMIT_BURST),
+    SOURCE_EXCHANGERATE: (EXCHANGERATE_RATE_LIMIT_DELAY,
+                          EXCHANGERATE_RATE_LIMIT_BURST),
+}
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов "корзина токенов".
+
+    Токены пополняются со скоростью rate в секунду до capacity. Каждый
+    запрос резервирует токен под блокировкой и ждет своей очереди вне
+    ее, поэтому параллельные потоки получают токены по порядку.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout: float = None) -> Optional[float]:
+        """Резервирование токена; секунд до очереди запроса или None, если
+        ждать пришлось бы дольше timeout"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Ожидание токена; False, если ждать пришлось бы дольше timeout"""
+        wait = self.reserve(timeout)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, timeout: float = None) -> bool:
+        """Ожидание токена без блокировки цикла событий"""
+        wait = self.reserve(timeout)
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+_rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(source: str) -> TokenBucket:
+    """Общий для процесса ограничитель запросов к источнику"""
+    with _rate_limiters_lock:
+        if source not in _rate_limiters:
+            delay, burst = _SOURCE_LIMITS[source]
+            _rate_limiters[source] = TokenBucket(1 / delay, burst)
+        return _rate_limiters[source]
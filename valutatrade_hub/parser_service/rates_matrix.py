@@ -0,0 +1,114 @@
+import math
+import operator
+from array import array
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from valutatrade_hub.parser_service.config import parser_config
+
+
+def default_currencies() -> Tuple[str, ...]:
+    """Реестр валют матрицы: базовая валюта, фиат, затем криптовалюты"""
+    return ((parser_config.BASE_FIAT_CURRENCY,)
+            + parser_config.FIAT_CURRENCIES
+            + parser_config.CRYPTO_CURRENCIES)
+
+
+class RatesMatrix:
+    """Плотная матрица кросс-курсов N×N, индексируемая порядковым номером валюты.
+
+    Элемент [i][j] - сколько единиц валюты j дают за одну единицу валюты i
+    (та же семантика, что у пары "I_J" в rates.json). Неизвестный курс
+    хранится как NaN. expires_at - момент (epoch), когда устареет самая
+    старая пара; 0 - неизвестно.
+    """
+
+    def __init__(self, currencies: Sequence[str], values: array,
+                 expires_at: float = 0.0):
+        self.currencies = tuple(currencies)
+        self.index: Dict[str, int] = {
+            code: i for i, code in enumerate(self.currencies)
+        }
+        self.size = len(self.currencies)
+        self.values = values
+        self.expires_at = expires_at
+        self._columns: Dict[int, array] = {}
+
+    @classmethod
+    def from_rates(cls, rates: Mapping[str, float],
+                   currencies: Sequence[str] = None) -> 'RatesMatrix':
+        """Построение матрицы из словаря пар "FROM_TO" → курс.
+
+        Приоритет как в _get_exchange_rate: прямая пара, обратная пара,
+        затем пересчет через базовую валюту.
+        """
+        currencies = tuple(currencies or default_currencies())
+        base = parser_config.BASE_FIAT_CURRENCY
+        size = len(currencies)
+
+        to_base = array('d', [math.nan]) * size
+        for i, code in enumerate(currencies):
+            if code == base:
+                to_base[i] = 1.0
+            elif f"{code}_{base}" in rates:
+                to_base[i] = rates[f"{code}_{base}"]
+            elif rates.get(f"{base}_{code}"):
+                to_base[i] = 1 / rates[f"{base}_{code}"]
+
+        values = array('d', [math.nan]) * (size * size)
+        for i, from_code in enumerate(currencies):
+            row = i * size
+            for j, to_code in enumerate(currencies):
+                if i == j:
+                    values[row + j] = 1.0
+                elif f"{from_code}_{to_code}" in rates:
+                    values[row + j] = rates[f"{from_code}_{to_code}"]
+                elif rates.get(f"{to_code}_{from_code}"):
+                    values[row + j] = 1 / rates[f"{to_code}_{from_code}"]
+                elif to_base[j] != 0.0:
+                    values[row + j] = to_base[i] / to_base[j]
+
+        return cls(currencies, values)
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """Курс за O(1); None если валюта или курс неизвестны"""
+        i = self.index.get(from_currency)
+        j = self.index.get(to_currency)
+        if i is None or j is None:
+            return None
+        value = self.values[i * self.size + j]
+        return None if math.isnan(value) else value
+
+    def column(self, to_currency: str) -> array:
+        """Вектор курсов всех валют реестра к валюте to_currency"""
+        j = self.index[to_currency]
+        if j not in self._columns:
+            self._columns[j] = self.values[j::self.size]
+        return self._columns[j]
+
+    def vector(self, amounts: Mapping[str, float]) -> Tuple[array, List[str]]:
+        """Вектор сумм в порядке реестра и список валют вне реестра"""
+        result = array('d', bytes(8 * self.size))
+        unknown = []
+        for code, amount in amounts.items():
+            i = self.index.get(code)
+            if i is None:
+                unknown.append(code)
+            else:
+                result[i] = amount
+        return result, unknown
+
+    def value(self, amounts: Mapping[str, float], base_currency: str) -> float:
+        """Стоимость набора сумм в базовой валюте одним скалярным произведением.
+
+        Валюты без известного курса к base_currency не учитываются.
+        """
+        vector, _ = self.vector(amounts)
+        return self.dot(vector, self.column(base_currency))
+
+    @staticmethod
+    def dot(vector: Iterable[float], column: Iterable[float]) -> float:
+        """Скалярное произведение с пропуском неизвестных (NaN) курсов"""
+        return math.fsum(
+            product for product in map(operator.mul, vector, column)
+            if not math.isnan(product)
+        )
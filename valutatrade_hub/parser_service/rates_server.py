@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from valutatrade_hub.core.exceptions import ConfigError
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import (
+    QUERY_CLIENT_TIMEOUT,
+    QUERY_CONVERT,
+    QUERY_CONVERT_MANY,
+    QUERY_GET_RATE,
+    QUERY_MAX_REQUEST_BYTES,
+)
+from valutatrade_hub.parser_service.rates_matrix import (
+    RatesMatrix,
+)
+from valutatrade_hub.parser_service.storage import BaseStorage
+from valutatrade_hub.parser_service.updater import pairs_expire_at
+
+logger = logging.getLogger(__name__)
+
+# Протокол: одна строка компактного JSON на запрос и на ответ. Запросы
+# одного соединения обрабатываются по порядку, поэтому их можно слать
+# пачкой, не дожидаясь ответов.
+_SEPARATORS = (',', ':')
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=_SEPARATORS).encode('utf-8') + b"\n"
+
+
+class RatesQueryServer:
+    """Сервер запросов курсов демона парсера поверх Unix socket.
+
+    Курсы хранятся в памяти процесса как матрица кросс-курсов и
+    подменяются целиком через publish() (этап после обновления), поэтому
+    обработчики asyncio читают их без блокировок и без обращения к файлам.
+    """
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = Path(socket_path or parser_config.RATES_SOCKET_PATH)
+        self._state: Tuple[Optional[RatesMatrix], float] = (None, 0.0)
+        self._handlers = {
+            QUERY_GET_RATE: self._get_rate,
+            QUERY_CONVERT: self._convert,
+            QUERY_CONVERT_MANY: self._convert_many,
+        }
+
+    def publish(self, matrix: RatesMatrix, timestamp: float = None) -> None:
+        """Подмена матрицы курсов после обновления"""
+        self._state = (matrix, time.time() if timestamp is None else timestamp)
+
+    def load(self, storage: BaseStorage) -> None:
+        """Начальные курсы из хранилища до первого обновления"""
+        try:
+            data = storage.load() or {}
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать опубликованные курсы: {e}")
+            return
+        rates = data.get('rates') or {}
+        if not rates:
+            return
+
+        refreshed_at = 0.0
+        last_refresh = data.get('meta', {}).get('last_refresh')
+        if last_refresh:
+            try:
+                refreshed_at = datetime.fromisoformat(
+                    last_refresh.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                pass
+        matrix = RatesMatrix.from_rates(rates)
+        matrix.expires_at = pairs_expire_at(data.get('pairs') or {})
+        self.publish(matrix, refreshed_at)
+
+    async def serve_forever(self) -> None:
+        """Прием соединений до отмены задачи"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_socket()
+        server = await asyncio.start_unix_server(
+            self._handle, path=str(self.socket_path),
+            limit=QUERY_MAX_REQUEST_BYTES
+        )
+        logger.info(f"Сервер курсов слушает {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.socket_path.unlink(missing_ok=True)
+            logger.info("Сервер курсов остановлен")
+
+    def _remove_stale_socket(self) -> None:
+        """Удаление сокета, оставшегося после аварийного завершения демона.
+
+        Если по сокету отвечает работающий сервер, запуск отклоняется.
+        """
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.settimeout(QUERY_CLIENT_TIMEOUT)
+        try:
+            probe.connect(str(self.socket_path))
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            self.socket_path.unlink(missing_ok=True)
+            return
+        except TimeoutError:
+            # Очередь соединений занята: сервер жив, но перегружен
+            pass
+        finally:
+            probe.close()
+        raise ConfigError(f"сервер курсов уже запущен на {self.socket_path}")
+
+    def answer(self, line: bytes) -> dict:
+        """Ответ на одну строку запроса"""
+        try:
+            request = json.loads(line)
+            handler = self._handlers.get(request.get('op'))
+            if handler is None:
+                return {"ok": False,
+                        "error": f"Неизвестный запрос: {request.get('op')}"}
+            matrix, refreshed_at = self._state
+            if matrix is None:
+                return {"ok": False, "error": "Курсы еще не загружены"}
+            response = handler(matrix, request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return {"ok": False, "error": f"Некорректный запрос: {e}"}
+        response["updated_at"] = refreshed_at
+        response["expires_at"] = matrix.expires_at
+        return response
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(_encode(self.answer(line)))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"Соединение с клиентом курсов прервано: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _get_rate(matrix: RatesMatrix, request: dict) -> dict:
+        rate = matrix.rate(request['from'], request['to'])
+        if rate is None:
+            return {"ok": False, "error": "Курс не найден"}
+        return {"ok": True, "rate": rate}
+
+    @staticmethod
+    def _convert(matrix: RatesMatrix, request: dict) -> dict:
+        rate = matrix.rate(request['from'], request['to'])
+        if rate is None:
+            return {"ok": False, "error": "Курс не найден"}
+        return {"ok": True, "rate": rate, "amount": rate * float(request['amount'])}
+
+    @staticmethod
+    def _convert_many(matrix: RatesMatrix, request: dict) -> dict:
+        results = []
+        for from_currency, to_currency, amount in request['items']:
+            rate = matrix.rate(from_currency, to_currency)
+            results.append(None if rate is None else rate * float(amount))
+        return {"ok": True, "results": results}
+
+
+class RatesQueryClient:
+    """Синхронный клиент сервера курсов.
+
+    Соединение открывается при первом запросе и переиспользуется. Если
+    демон не запущен или не ответил, методы возвращают None, и вызывающий
+    код читает курсы из кэша.
+    """
+
+    def __init__(self, socket_path: str = None,
+                 timeout: float = QUERY_CLIENT_TIMEOUT):
+        self.socket_path = Path(socket_path or parser_config.RATES_SOCKET_PATH)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def get_rate(self, from_currency: str,
+                 to_currency: str) -> Optional[Tuple[float, float, float]]:
+        """Курс пары, время обновления курсов и момент устаревания самой
+        старой пары (epoch; 0 - неизвестно)"""
+        response = self._request({"op": QUERY_GET_RATE, "from": from_currency,
+                                  "to": to_currency})
+        if response is None:
+            return None
+        return response["rate"], response["updated_at"], response["expires_at"]
+
+    def convert(self, from_currency: str, to_currency: str,
+                amount: float) -> Optional[float]:
+        """Сумма amount в валюте to_currency"""
+        response = self._request({"op": QUERY_CONVERT, "from": from_currency,
+                                  "to": to_currency, "amount": amount})
+        return None if response is None else response["amount"]
+
+    def convert_many(self, items: Iterable[Tuple[str, str, float]]
+                     ) -> Optional[Tuple[List[Optional[float]], float]]:
+        """Пакетная конвертация (from, to, amount) одним запросом"""
+        response = self._request({"op": QUERY_CONVERT_MANY,
+                                  "items": [list(item) for item in items]})
+        if response is None:
+            return None
+        return response["results"], response["updated_at"]
+
+    def close(self) -> None:
+        """Закрытие соединения с сервером"""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _connect(self) -> bool:
+        if self._sock is not None:
+            return True
+        if not self.socket_path.exists():
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError:
+            sock.close()
+            return False
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+        return True
+
+    def _request(self, message: dict) -> Optional[dict]:
+        """Запрос с одной повторной попыткой после разрыва соединения"""
+        with self._lock:
+            for _ in range(2):
+                if not self._connect():
+                    return None
+                try:
+                    self._sock.sendall(_encode(message))
+                    line = self._reader.readline()
+                    if not line:
+                        raise ConnectionError("сервер закрыл соединение")
+                    response = json.loads(line)
+                    break
+                except TimeoutError:
+                    logger.debug("Сервер курсов не ответил вовремя")
+                    self.close()
+                    return None
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Ошибка запроса к серверу курсов: {e}")
+                    self.close()
+            else:
+                return None
+
+        if not response.get("ok"):
+            logger.debug(f"Сервер курсов: {response.get('error')}")
+            return None
+        return response
+
+
+_rates_client: Optional[RatesQueryClient] = None
+
+
+def get_rates_client() -> RatesQueryClient:
+    """Общий для процесса клиент сервера курсов"""
+    global _rates_client
+    if _rates_client is None:
+        _rates_client = RatesQueryClient()
+    return _rates_client
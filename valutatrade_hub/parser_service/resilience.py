@@ -0,0 +1,97 @@
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from valutatrade_hub.parser_service.constants import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CIRCUIT_PROBE_TIMEOUT,
+    CIRCUIT_RESET_TIMEOUT,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY,
+                  max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Пауза перед повтором: экспоненциальный рост с полным джиттером"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Предохранитель источника курсов.
+
+    После failure_threshold неудач подряд источник не опрашивается
+    reset_timeout секунд (open), затем пропускается один пробный запрос
+    (half-open): успех замыкает цепь, неудача снова размыкает ее. Пробный
+    запрос без исхода дольше probe_timeout секунд считается неудачным.
+    """
+
+    def __init__(self, name: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+                 probe_timeout: float = CIRCUIT_PROBE_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._expire_probe()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Можно ли опросить источник; в half-open - только один запрос"""
+        with self._lock:
+            self._expire_probe()
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if self._state == CIRCUIT_HALF_OPEN:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._state = CIRCUIT_HALF_OPEN
+            self._probe_started = time.monotonic()
+            logger.info(f"Пробный запрос к {self.name} после паузы")
+            return True
+
+    def _expire_probe(self) -> None:
+        """Зависший пробный запрос снова размыкает цепь"""
+        if (self._state == CIRCUIT_HALF_OPEN
+                and time.monotonic() - self._probe_started >= self.probe_timeout):
+            self._state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+            logger.warning(f"Пробный запрос к {self.name} не завершился за "
+                           f"{self.probe_timeout} секунд")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CIRCUIT_CLOSED:
+                logger.info(f"Источник {self.name} снова доступен")
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (self._state == CIRCUIT_HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                logger.warning(f"Источник {self.name} отключен на "
+                               f"{self.reset_timeout} секунд после "
+                               f"{self._failures} неудач подряд")
@@ -0,0 +1,98 @@
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Hashable, Mapping, Optional
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class CachedResponse:
+    """Разобранный ответ API с валидаторами и сроком годности"""
+
+    data: dict
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """Заголовки условного запроса"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def expires_from_headers(headers: Mapping[str, str]) -> float:
+    """Срок годности ответа по Cache-Control max-age или Expires; 0 - нет"""
+    match = _MAX_AGE.search(headers.get("Cache-Control", ""))
+    if match:
+        return time.time() + int(match.group(1))
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return 0.0
+
+
+class ResponseCache:
+    """Кэш ответов API клиента с учетом заявленного срока годности.
+
+    Свежий ответ отдается без обращения к сети (hit), устаревший
+    перепроверяется условным запросом (revalidated при 304), остальное -
+    полная загрузка (miss).
+    """
+
+    def __init__(self):
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def store(self, key: Hashable, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def revalidate(self, key: Hashable, cached: CachedResponse,
+                   entry: CachedResponse) -> None:
+        """Замена перепроверенной (304) записи cached на entry.
+
+        Запись, уже замененная другим запросом, не перезаписывается.
+        """
+        with self._lock:
+            self.revalidated += 1
+            if self._entries.get(key) is cached:
+                self._entries[key] = entry
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики обращений: без сети, 304 и полные загрузки"""
+        with self._lock:
+            return {"hits": self.hits, "revalidated": self.revalidated,
+                    "misses": self.misses}
@@ -1,30 +1,178 @@
+import asyncio
+import inspect
 import logging
+import random
 import threading
 import time
-from typing import Optional
+from typing import Dict, List, Optional
 
-from valutatrade_hub.parser_service.constants import POLLING_INTERVAL, SHUTDOWN_TIMEOUT
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import SHUTDOWN_TIMEOUT
+from valutatrade_hub.parser_service.updater import client_source
 
 logger = logging.getLogger(__name__)
 
 
-class Scheduler:
-    """Планировщик для периодического выполнения обновления курсов валют."""
-    
-    def __init__(self, updater, interval_seconds: int):
+class ScheduledJob:
+    """Периодический опрос одного клиента.
+
+    Тики отсчитываются от абсолютных моментов time.monotonic(), а не от
+    конца предыдущего опроса, поэтому длительность опроса не накапливается.
+    Джиттер сдвигает запуск внутри тика, не смещая саму сетку.
+    """
+
+    def __init__(self, client: BaseApiClient, interval: float,
+                 jitter: float = 0.0):
+        self.client = client
+        self.interval = interval
+        self.jitter = jitter
+        self.deadline = 0.0
+        self.next_run = 0.0
+        self.skipped = 0
+
+    @property
+    def name(self) -> str:
+        return self.client.__class__.__name__
+
+    def start(self, now: float) -> None:
+        """Первый опрос сразу после запуска"""
+        self.deadline = now
+        self.next_run = now
+
+    def advance(self, now: float) -> int:
+        """Переход к следующему тику; пропущенные тики не наверстываются.
+
+        Возвращает число пропущенных тиков.
+        """
+        self.deadline += self.interval
+        missed = 0
+        if self.deadline <= now:
+            missed = int((now - self.deadline) // self.interval) + 1
+            self.deadline += missed * self.interval
+            self.skipped += missed
+        self.next_run = self.deadline + random.uniform(0, self.jitter)
+        return missed
+
+
+class BaseScheduler:
+    """Общая логика планировщиков: расписание клиентов и запуск обновлений.
+
+    Интервал и джиттер задаются по источнику клиента; по умолчанию
+    интервал - срок свежести источника, а interval_seconds задает общий
+    интервал для всех клиентов.
+    """
+
+    def __init__(self, updater, interval_seconds: int = None,
+                 source_intervals: Dict[str, float] = None,
+                 source_jitter: Dict[str, float] = None):
         self.updater = updater
         self.interval_seconds = interval_seconds
+        source_intervals = source_intervals or {}
+        source_jitter = source_jitter or {}
+        self.jobs: List[ScheduledJob] = []
+        for client in updater.api_clients:
+            source = client_source(client)
+            interval = source_intervals.get(
+                source, interval_seconds or parser_config.source_ttl_seconds(source)
+            )
+            jitter = source_jitter.get(
+                source, parser_config.source_jitter_seconds(source)
+            )
+            self.jobs.append(ScheduledJob(client, interval, jitter))
+            logger.info(f"Клиент {self.jobs[-1].name}: интервал {interval} "
+                        f"секунд, джиттер до {jitter} секунд")
+
+    def run_once(self) -> bool:
+        """Выполнение единоразового обновления курсов."""
+        logger.info("Запуск единоразового обновления")
+        try:
+            return self.updater.run_update()
+        except Exception as e:
+            logger.error(f"Ошибка при единоразовом обновлении: {e}")
+            return False
+
+    def _start_jobs(self) -> None:
+        now = time.monotonic()
+        for job in self.jobs:
+            job.start(now)
+
+    def _due_jobs(self) -> List[ScheduledJob]:
+        now = time.monotonic()
+        return [job for job in self.jobs if job.next_run <= now]
+
+    def _next_timeout(self) -> Optional[float]:
+        """Секунд до ближайшего тика; None - клиентов нет"""
+        if not self.jobs:
+            return None
+        return max(0.0, min(job.next_run for job in self.jobs) - time.monotonic())
+
+    def _run_jobs(self, jobs: List[ScheduledJob]) -> bool:
+        """Обновление курсов клиентов, чей тик наступил.
+
+        Опрос принудительный: расписание клиента и есть его срок свежести.
+        """
+        self._log_run_start(jobs)
+        try:
+            success = self.updater.run_update(
+                force=True, clients=[job.client for job in jobs]
+            )
+            self._log_run_result(success)
+
+            if hasattr(self.updater, 'compact_history'):
+                self.updater.compact_history()
+            return success
+        except Exception as e:
+            logger.error(f"Критическая ошибка в планировщике: {e}")
+            return False
+
+    @staticmethod
+    def _log_run_start(jobs: List[ScheduledJob]) -> None:
+        names = ", ".join(job.name for job in jobs)
+        logger.info(f"Запуск запланированного обновления: {names}")
+
+    @staticmethod
+    def _log_run_result(success: bool) -> None:
+        if success:
+            logger.info("Запланированное обновление завершено успешно")
+        else:
+            logger.error("Запланированное обновление завершено с ошибками")
+
+    def _advance_jobs(self, jobs: List[ScheduledJob]) -> None:
+        now = time.monotonic()
+        for job in jobs:
+            missed = job.advance(now)
+            if missed:
+                logger.warning(f"Клиент {job.name}: пропущено {missed} тиков, "
+                               f"опрос длился дольше интервала")
+
+    def _close_updater(self):
+        if hasattr(self.updater, 'close'):
+            return self.updater.close()
+        return None
+
+
+class Scheduler(BaseScheduler):
+    """Планировщик для периодического выполнения обновления курсов валют.
+
+    Работает в отдельном потоке и между тиками спит в Event.wait до
+    ближайшего дедлайна, поэтому остановка не ждет конца интервала.
+    """
+
+    def __init__(self, updater, interval_seconds: int = None,
+                 source_intervals: Dict[str, float] = None,
+                 source_jitter: Dict[str, float] = None):
+        super().__init__(updater, interval_seconds, source_intervals,
+                         source_jitter)
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
-        logger.info(f"Планировщик инициализирован с интервалом "
-                   f"{self.interval_seconds} секунд")
 
     def start(self) -> None:
         """Запуск планировщика в отдельном потоке."""
         if self._thread and self._thread.is_alive():
             logger.warning("Планировщик уже запущен")
             return
-        
+
         self._stop_event.clear()
         self._thread = threading.Thread(target=self._run, daemon=True)
         self._thread.start()
@@ -35,43 +183,125 @@ class Scheduler:
         self._stop_event.set()
         if self._thread:
             self._thread.join(timeout=SHUTDOWN_TIMEOUT)
+        self._close_updater()
         logger.info("Планировщик остановлен")
 
+    def join(self) -> None:
+        """Ожидание завершения потока планировщика."""
+        if self._thread:
+            self._thread.join()
+
     def _run(self) -> None:
         """Основной цикл выполнения планировщика."""
         logger.info("Цикл планировщика начат")
-        
+        self._start_jobs()
+
         while not self._stop_event.is_set():
-            try:
-                logger.info("Запуск запланированного обновления курсов")
-                success = self.updater.run_update()
-                
-                if success:
-                    logger.info("Запланированное обновление завершено успешно")
-                else:
-                    logger.error("Запланированное обновление завершено с ошибками")
-                    
-            except Exception as e:
-                logger.error(f"Критическая ошибка в планировщике: {e}")
-            
-            wait_time = 0
-            while (wait_time < self.interval_seconds and 
-                   not self._stop_event.is_set()):
-                time.sleep(POLLING_INTERVAL)
-                wait_time += POLLING_INTERVAL
+            due = self._due_jobs()
+            if due:
+                self._run_jobs(due)
+                self._advance_jobs(due)
+                continue
+            self._stop_event.wait(self._next_timeout())
 
         logger.info("Цикл планировщика завершен")
 
-    def run_once(self) -> bool:
-        """Выполнение единоразового обновления курсов."""
-        logger.info("Запуск единоразового обновления")
+    @property
+    def is_running(self) -> bool:
+        """Проверка, работает ли планировщик."""
+        return self._thread is not None and self._thread.is_alive()
+
+
+class AsyncScheduler(BaseScheduler):
+    """Планировщик как задача asyncio в цикле событий вызывающего кода.
+
+    Позволяет запускать обновления в одном цикле с сервером запросов
+    курсов. AsyncRatesUpdater работает прямо в цикле, блокирующий
+    RatesUpdater - в пуле потоков цикла.
+    """
+
+    def __init__(self, updater, interval_seconds: int = None,
+                 source_intervals: Dict[str, float] = None,
+                 source_jitter: Dict[str, float] = None):
+        super().__init__(updater, interval_seconds, source_intervals,
+                         source_jitter)
+        self._stop_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """Запуск задачи планировщика в текущем цикле событий."""
+        if self._task is not None and not self._task.done():
+            logger.warning("Планировщик уже запущен")
+            return self._task
+
+        self._stop_event = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Планировщик запущен")
+        return self._task
+
+    async def wait(self) -> None:
+        """Ожидание завершения задачи планировщика."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self) -> None:
+        """Остановка планировщика; текущее обновление прерывается, если не
+        завершилось за SHUTDOWN_TIMEOUT."""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task),
+                                       SHUTDOWN_TIMEOUT)
+            except TimeoutError:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+        result = self._close_updater()
+        if inspect.isawaitable(result):
+            await result
+        logger.info("Планировщик остановлен")
+
+    async def _run_jobs_async(self, jobs: List[ScheduledJob]) -> bool:
+        """Обновление курсов клиентов, чей тик наступил, без блокировки цикла"""
+        if not inspect.iscoroutinefunction(self.updater.run_update):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._run_jobs, jobs
+            )
+
+        self._log_run_start(jobs)
         try:
-            return self.updater.run_update()
+            success = await self.updater.run_update(
+                force=True, clients=[job.client for job in jobs]
+            )
+            self._log_run_result(success)
+
+            if hasattr(self.updater, 'compact_history'):
+                await self.updater.compact_history()
+            return success
         except Exception as e:
-            logger.error(f"Ошибка при единоразовом обновлении: {e}")
+            logger.error(f"Критическая ошибка в планировщике: {e}")
             return False
 
+    async def _run(self) -> None:
+        """Основной цикл выполнения планировщика."""
+        logger.info("Цикл планировщика начат")
+        self._start_jobs()
+
+        while not self._stop_event.is_set():
+            due = self._due_jobs()
+            if due:
+                await self._run_jobs_async(due)
+                self._advance_jobs(due)
+                continue
+            try:
+                await asyncio.wait_for(self._stop_event.wait(),
+                                       self._next_timeout())
+            except TimeoutError:
+                pass
+
+        logger.info("Цикл планировщика завершен")
+
     @property
     def is_running(self) -> bool:
         """Проверка, работает ли планировщик."""
-        return self._thread is not None and self._thread.is_alive()
\ No newline at end of file
+        return self._task is not None and not self._task.done()
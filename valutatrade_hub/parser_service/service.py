@@ -0,0 +1,139 @@
+import logging
+import subprocess
+import sys
+import threading
+from typing import Callable, Dict, List, Optional
+
+from valutatrade_hub.core.repositories import get_portfolio_repository
+from valutatrade_hub.infra.constants import RATES_TRANSPORT_JSON
+from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service.api_clients import (
+    AsyncBaseApiClient,
+    AsyncCoinGeckoClient,
+    AsyncExchangeRateApiClient,
+    BaseApiClient,
+    CoinGeckoClient,
+    ExchangeRateApiClient,
+)
+from valutatrade_hub.parser_service.async_http import AsyncHttpSession
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import (
+    SOURCE_COINGECKO,
+    SOURCE_EXCHANGERATE,
+)
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+from valutatrade_hub.parser_service.snapshot import BinarySnapshotWriter
+from valutatrade_hub.parser_service.storage import JsonFileStorage, get_rates_storage
+from valutatrade_hub.parser_service.updater import AsyncRatesUpdater, RatesUpdater
+from valutatrade_hub.parser_service.valuation import PortfolioValuationJob
+
+logger = logging.getLogger(__name__)
+
+
+def create_api_clients(source: str = None) -> List[BaseApiClient]:
+    """Создание API клиентов; source ограничивает опрос одним источником"""
+    clients = []
+
+    if source in (None, SOURCE_COINGECKO):
+        clients.append(CoinGeckoClient(parser_config.CRYPTO_ID_MAP))
+
+    if source in (None, SOURCE_EXCHANGERATE):
+        if parser_config.EXCHANGERATE_API_KEY:
+            clients.append(ExchangeRateApiClient(parser_config.EXCHANGERATE_API_KEY))
+        else:
+            logger.warning("EXCHANGERATE_API_KEY не задан, ExchangeRate пропущен")
+
+    return clients
+
+
+def create_async_api_clients(session: AsyncHttpSession,
+                             source: str = None) -> List[AsyncBaseApiClient]:
+    """Асинхронные API клиенты с общей HTTP сессией"""
+    clients = []
+
+    if source in (None, SOURCE_COINGECKO):
+        clients.append(AsyncCoinGeckoClient(parser_config.CRYPTO_ID_MAP, session))
+
+    if source in (None, SOURCE_EXCHANGERATE):
+        if parser_config.EXCHANGERATE_API_KEY:
+            clients.append(AsyncExchangeRateApiClient(
+                parser_config.EXCHANGERATE_API_KEY, session
+            ))
+        else:
+            logger.warning("EXCHANGERATE_API_KEY не задан, ExchangeRate пропущен")
+
+    return clients
+
+
+def create_post_update_stages() -> List[Callable[[RatesMatrix], object]]:
+    """Этапы после обновления согласно настройкам: снимок и переоценка"""
+    post_update_stages = []
+    if settings.get("rates_transport") != RATES_TRANSPORT_JSON:
+        post_update_stages.append(BinarySnapshotWriter().publish)
+
+    if settings.get("batch_valuation"):
+        valuation_job = PortfolioValuationJob(
+            get_portfolio_repository().iter_all,
+            JsonFileStorage(parser_config.VALUATIONS_FILE_PATH),
+            (parser_config.BASE_FIAT_CURRENCY, settings.get("valuation_currency"))
+        )
+        post_update_stages.append(valuation_job.run)
+    return post_update_stages
+
+
+def create_updater(source: str = None) -> RatesUpdater:
+    """Сборка RatesUpdater с клиентами, хранилищем и этапами после обновления"""
+    return RatesUpdater(create_api_clients(source), get_rates_storage(),
+                        create_post_update_stages(),
+                        change_epsilon=settings.get("rates_change_epsilon"),
+                        pair_epsilons=settings.get("rates_change_epsilon_pairs"))
+
+
+def create_async_updater(source: str = None) -> AsyncRatesUpdater:
+    """Сборка AsyncRatesUpdater для демона парсера"""
+    session = AsyncHttpSession()
+    return AsyncRatesUpdater(
+        create_async_api_clients(session, source), get_rates_storage(),
+        create_post_update_stages(),
+        change_epsilon=settings.get("rates_change_epsilon"),
+        pair_epsilons=settings.get("rates_change_epsilon_pairs"),
+        session=session
+    )
+
+
+_updaters: Dict[Optional[str], RatesUpdater] = {}
+_updaters_lock = threading.Lock()
+
+
+def get_updater(source: str = None) -> RatesUpdater:
+    """Общий для процесса RatesUpdater: клиенты и пул соединений переиспользуются"""
+    with _updaters_lock:
+        if source not in _updaters:
+            _updaters[source] = create_updater(source)
+        return _updaters[source]
+
+
+def run_update(source: str = None, force: bool = False) -> bool:
+    """Обновление курсов в текущем процессе без запуска интерпретатора.
+
+    force - опросить источники, даже если их курсы еще свежие.
+    """
+    return get_updater(source).run_update(force)
+
+
+def run_update_subprocess(source: str = None,
+                          force: bool = False) -> subprocess.CompletedProcess:
+    """Обновление курсов в отдельном процессе интерпретатора (режим изоляции)"""
+    cmd = [sys.executable, '-m', 'valutatrade_hub.parser_service.main', 'update']
+    if source:
+        cmd.extend(['--source', source])
+    if force:
+        cmd.append('--force')
+    return subprocess.run(cmd, capture_output=True, text=True)
+
+
+def run_configured_update(source: str = None) -> bool:
+    """Обновление курсов в процессе или в подпроцессе согласно настройкам"""
+    if settings.get("rates_update_isolation"):
+        return run_update_subprocess(source).returncode == 0
+    return run_update(source)
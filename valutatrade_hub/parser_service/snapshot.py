@@ -0,0 +1,393 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Optional, Tuple
+
+from valutatrade_hub.core.exceptions import StorageError
+from valutatrade_hub.infra.file_lock import file_lock
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import (
+    RATES_FILE_MODE,
+    SNAPSHOT_CODE_SIZE,
+    SNAPSHOT_MAGIC,
+    SNAPSHOT_READ_RETRIES,
+    SNAPSHOT_RETIRED,
+    SNAPSHOT_SHM_PREFIX,
+    SNAPSHOT_VERSION,
+)
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+
+logger = logging.getLogger(__name__)
+
+# magic, версия формата, число валют, поколение, время обновления и момент
+# устаревания самой старой пары (epoch); порядок байтов платформы, как у
+# memoryview читателей
+_HEADER = struct.Struct("=4sHHQdd")
+_GENERATION_OFFSET = 8
+_TIMESTAMP_OFFSET = 16
+
+
+def _layout_size(count: int) -> int:
+    """Размер снимка: заголовок, коды валют, матрица count×count float64"""
+    return _HEADER.size + count * SNAPSHOT_CODE_SIZE + count * count * 8
+
+
+def _empty_layout(currencies: Tuple[str, ...]) -> bytes:
+    """Снимок нулевого поколения: заголовок, коды валют, матрица из NaN"""
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(currencies),
+                          0, 0.0, 0.0)
+    codes = b"".join(code.encode('ascii').ljust(SNAPSHOT_CODE_SIZE, b"\0")
+                     for code in currencies)
+    return header + codes + array('d', [math.nan]).tobytes() * len(currencies) ** 2
+
+
+def shared_memory_name(file_path: str = None) -> str:
+    """Имя блока общей памяти, уникальное для каталога данных"""
+    path = os.path.abspath(file_path or parser_config.RATES_BINARY_FILE_PATH)
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    return f"{SNAPSHOT_SHM_PREFIX}{digest}"
+
+
+def _attach_shared_memory(name: str) -> Optional[shared_memory.SharedMemory]:
+    """Подключение к блоку без владения им; None, если демон не запущен"""
+    try:
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name, track=False)
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return None
+    # До 3.13 resource_tracker удалил бы чужой блок при выходе читателя
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class BinarySnapshotWriter:
+    """Публикация матрицы кросс-курсов в бинарный файл фиксированной структуры.
+
+    Файл отображается в память один раз и обновляется на месте по
+    протоколу seqlock: поколение становится нечетным на время записи и
+    снова четным после нее. При смене реестра валют создается новый
+    файл, а старый помечается как выведенный из обращения. Писателей
+    может быть несколько (демон и обновление в процессе приложения),
+    поэтому публикация выполняется под межпроцессной блокировкой flock.
+    """
+
+    def __init__(self, file_path: str = None):
+        self.file_path = Path(file_path or parser_config.RATES_BINARY_FILE_PATH)
+        self._mm = None
+        self._currencies: Tuple[str, ...] = ()
+
+    def publish(self, matrix: RatesMatrix, timestamp: float = None) -> int:
+        """Запись матрицы курсов; возвращает новое поколение"""
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            with file_lock(self.lock_path):
+                if (self._mm is None or matrix.currencies != self._currencies
+                        or self._generation() == SNAPSHOT_RETIRED):
+                    self._open(matrix.currencies)
+
+                mm = self._mm
+                # Нечетное поколение под блокировкой оставила прерванная
+                # запись: округляем до четного, иначе читатели не смогут
+                # прочитать снимок никогда
+                generation = self._generation()
+                generation += generation % 2
+                struct.pack_into("=Q", mm, _GENERATION_OFFSET, generation + 1)
+                struct.pack_into("=dd", mm, _TIMESTAMP_OFFSET, timestamp,
+                                 matrix.expires_at)
+                values_offset = _HEADER.size + matrix.size * SNAPSHOT_CODE_SIZE
+                values = array('d', matrix.values).tobytes()
+                mm[values_offset:values_offset + len(values)] = values
+                struct.pack_into("=Q", mm, _GENERATION_OFFSET, generation + 2)
+        except (OSError, ValueError) as e:
+            raise StorageError(f"Ошибка записи {self.target}: {e}") from e
+
+        logger.debug(f"Бинарный снимок курсов опубликован: {self.target}")
+        return generation + 2
+
+    @property
+    def target(self) -> str:
+        """Куда публикуется снимок (для сообщений)"""
+        return str(self.file_path)
+
+    @property
+    def lock_path(self) -> Path:
+        """Файл межпроцессной блокировки публикации"""
+        return self.file_path.with_name(f"{self.file_path.name}.lock")
+
+    def _generation(self) -> int:
+        return struct.unpack_from("=Q", self._mm, _GENERATION_OFFSET)[0]
+
+    def close(self) -> None:
+        """Освобождение отображения файла"""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _open(self, currencies: Tuple[str, ...]) -> None:
+        """Открытие файла с нужной структурой или создание нового"""
+        self.close()
+        size = _layout_size(len(currencies))
+        if not self._matches(currencies, size):
+            self._create(currencies, size)
+        with open(self.file_path, 'r+b') as f:
+            self._mm = mmap.mmap(f.fileno(), size)
+        self._currencies = currencies
+
+    def _matches(self, currencies: Tuple[str, ...], size: int) -> bool:
+        try:
+            with open(self.file_path, 'rb') as f:
+                data = f.read(size + 1)
+        except FileNotFoundError:
+            return False
+        if len(data) != size:
+            return False
+        magic, version, count, generation, _, _ = _HEADER.unpack_from(data)
+        return (magic == SNAPSHOT_MAGIC and version == SNAPSHOT_VERSION
+                and generation != SNAPSHOT_RETIRED
+                and _read_codes(data, count) == currencies)
+
+    def _create(self, currencies: Tuple[str, ...], size: int) -> None:
+        """Атомарная замена файла; читатели старого файла переоткроют его"""
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=self.file_path.parent)
+        try:
+            os.fchmod(fd, RATES_FILE_MODE)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_empty_layout(currencies))
+            self._retire_existing()
+            os.replace(temp_name, self.file_path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+    def _retire_existing(self) -> None:
+        try:
+            with open(self.file_path, 'r+b') as f:
+                f.seek(_GENERATION_OFFSET)
+                f.write(struct.pack("=Q", SNAPSHOT_RETIRED))
+        except (FileNotFoundError, ValueError):
+            pass
+
+
+class SharedMemorySnapshotWriter(BinarySnapshotWriter):
+    """Публикация снимка в блок multiprocessing.shared_memory.
+
+    Структура и протокол seqlock те же, что у файла. Блок живет, пока
+    работает демон парсера: close() выводит снимок из обращения и
+    удаляет блок, после чего читатели возвращаются к файлу.
+    """
+
+    def __init__(self, name: str = None):
+        super().__init__()
+        self.name = name or shared_memory_name()
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    @property
+    def target(self) -> str:
+        return f"shm:{self.name}"
+
+    @property
+    def lock_path(self) -> Path:
+        return self.file_path.with_name(f"{self.name}.lock")
+
+    def close(self) -> None:
+        """Вывод снимка из обращения и удаление блока общей памяти"""
+        if self._shm is None:
+            return
+        struct.pack_into("=Q", self._mm, _GENERATION_OFFSET, SNAPSHOT_RETIRED)
+        self._mm = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def _open(self, currencies: Tuple[str, ...]) -> None:
+        """Новый блок под реестр валют; старый выводится из обращения"""
+        self.close()
+        try:
+            stale = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            pass
+        else:
+            # Блок, оставшийся после аварийного завершения демона
+            struct.pack_into("=Q", stale.buf, _GENERATION_OFFSET, SNAPSHOT_RETIRED)
+            stale.close()
+            stale.unlink()
+        layout = _empty_layout(currencies)
+        self._shm = shared_memory.SharedMemory(self.name, create=True,
+                                               size=len(layout))
+        self._shm.buf[:len(layout)] = layout
+        self._mm = self._shm.buf
+        self._currencies = currencies
+
+
+def _read_codes(buffer, count: int) -> Tuple[str, ...]:
+    codes = []
+    for i in range(count):
+        offset = _HEADER.size + i * SNAPSHOT_CODE_SIZE
+        raw = bytes(buffer[offset:offset + SNAPSHOT_CODE_SIZE])
+        codes.append(raw.rstrip(b"\0").decode('ascii'))
+    return tuple(codes)
+
+
+class BinarySnapshotReader:
+    """Чтение бинарного снимка курсов без разбора и копирования файла.
+
+    Поколение и значения читаются прямо из отображенной памяти;
+    согласованность проверяется повторным чтением поколения (seqlock).
+    """
+
+    def __init__(self, file_path: str = None):
+        self.file_path = Path(file_path or parser_config.RATES_BINARY_FILE_PATH)
+        self._mm = None
+        self._generation_view: Optional[memoryview] = None
+        self._timestamp_view: Optional[memoryview] = None
+        self._values: Optional[memoryview] = None
+        self._values_raw: Optional[memoryview] = None
+        self.currencies: Tuple[str, ...] = ()
+        self.index = {}
+        self.size = 0
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Текущее поколение снимка; None, если снимок недоступен"""
+        if not self._ensure_open():
+            return None
+        return self._generation_view[0]
+
+    @property
+    def timestamp(self) -> Optional[float]:
+        """Время последней публикации; None, если снимок недоступен"""
+        if not self._ensure_open():
+            return None
+        return self._timestamp_view[0]
+
+    @property
+    def source(self) -> str:
+        """Откуда читается снимок (для сообщений)"""
+        return str(self.file_path)
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """Курс одной пары без копирования матрицы"""
+        for _ in range(SNAPSHOT_READ_RETRIES):
+            if not self._ensure_open():
+                return None
+            i = self.index.get(from_currency)
+            j = self.index.get(to_currency)
+            if i is None or j is None:
+                return None
+            before = self._generation_view[0]
+            value = self._values[i * self.size + j]
+            if before % 2 == 0 and self._generation_view[0] == before:
+                return None if math.isnan(value) else value
+        return None
+
+    def read(self) -> Optional[Tuple[int, float, RatesMatrix]]:
+        """Согласованная копия: (поколение, время обновления, матрица).
+
+        Момент устаревания снимка передается в matrix.expires_at.
+        """
+        for _ in range(SNAPSHOT_READ_RETRIES):
+            if not self._ensure_open():
+                return None
+            before = self._generation_view[0]
+            if before % 2:
+                continue
+            timestamp, expires_at = self._timestamp_view
+            values = array('d')
+            values.frombytes(self._values_raw)
+            if self._generation_view[0] == before:
+                return before, timestamp, RatesMatrix(self.currencies, values,
+                                                      expires_at)
+        logger.warning(f"Не удалось согласованно прочитать {self.source}")
+        return None
+
+    def close(self) -> None:
+        """Освобождение отображения"""
+        for view in (self._generation_view, self._timestamp_view, self._values,
+                     self._values_raw):
+            if view is not None:
+                view.release()
+        self._generation_view = self._timestamp_view = None
+        self._values = self._values_raw = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _map(self):
+        """Отображение файла снимка; None, если файла нет"""
+        try:
+            with open(self.file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < _HEADER.size:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        except OSError as e:
+            logger.warning(f"Ошибка открытия {self.file_path}: {e}")
+            return None
+
+    def _view(self, mapping) -> memoryview:
+        return memoryview(mapping)
+
+    def _ensure_open(self) -> bool:
+        """Отображение снимка; повторное открытие, если снимок заменен"""
+        if self._mm is not None and self._generation_view[0] != SNAPSHOT_RETIRED:
+            return True
+        self.close()
+        mm = self._map()
+        if mm is None:
+            return False
+
+        view = self._view(mm)
+        magic, version, count, generation, _, _ = _HEADER.unpack_from(view)
+        # Блок общей памяти может быть больше снимка (округление до страниц)
+        if (magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION
+                or generation == SNAPSHOT_RETIRED
+                or len(view) < _layout_size(count)):
+            view.release()
+            mm.close()
+            return False
+
+        self._mm = mm
+        self.currencies = _read_codes(view, count)
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        self.size = count
+        values_offset = _HEADER.size + count * SNAPSHOT_CODE_SIZE
+        self._generation_view = view[_GENERATION_OFFSET:_TIMESTAMP_OFFSET].cast('Q')
+        self._timestamp_view = view[_TIMESTAMP_OFFSET:_HEADER.size].cast('d')
+        self._values_raw = view[values_offset:values_offset + count * count * 8]
+        self._values = self._values_raw.cast('d')
+        view.release()
+        return True
+
+
+class SharedMemorySnapshotReader(BinarySnapshotReader):
+    """Чтение снимка из общей памяти демона парсера без обращения к файлам.
+
+    Блок подключается один раз; если демон не запущен или остановлен,
+    снимок считается недоступным и используется файл.
+    """
+
+    def __init__(self, name: str = None):
+        super().__init__()
+        self.name = name or shared_memory_name()
+
+    @property
+    def source(self) -> str:
+        return f"shm:{self.name}"
+
+    def _map(self) -> Optional[shared_memory.SharedMemory]:
+        return _attach_shared_memory(self.name)
+
+    def _view(self, mapping: shared_memory.SharedMemory) -> memoryview:
+        return memoryview(mapping.buf)
@@ -1,10 +1,28 @@
 import json
 import logging
+import os
+import sqlite3
+import tempfile
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
-from valutatrade_hub.core.exceptions import StorageError
+from valutatrade_hub.core.exceptions import InsufficientFundsError, StorageError
+from valutatrade_hub.infra.constants import STORAGE_BACKEND_SQLITE
+from valutatrade_hub.infra.setting import settings
+from valutatrade_hub.parser_service.config import parser_config
+from valutatrade_hub.parser_service.constants import RATES_FILE_MODE
 
 logger = logging.getLogger(__name__)
 
@@ -22,13 +40,17 @@ class BaseStorage(ABC):
         """Загрузить данные из хранилища"""
         pass
 
+    def get_version(self) -> Optional[Hashable]:
+        """Дешевый признак изменения данных; None - версия неизвестна"""
+        return None
+
 
 class JsonFileStorage(BaseStorage):
     """Реализация хранилища в формате JSON файла"""
     
     def __init__(self, file_path: str):
         self.file_path = Path(file_path)
-        logger.info(f"Инициализировано JSON хранилище: {self.file_path}")
+        logger.debug(f"Инициализировано JSON хранилище: {self.file_path}")
 
     def save(self, data: Dict[str, Any]) -> None:
         """Атомарное сохранение данных через временный файл"""
@@ -36,10 +58,14 @@ class JsonFileStorage(BaseStorage):
         try:
             self.file_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # Создание временного файла
-            temp_path = self.file_path.with_suffix('.tmp')
+            # Уникальный временный файл: обновления курсов в разных
+            # процессах не перезаписывают чужой файл до замены
+            fd, temp_name = tempfile.mkstemp(suffix='.tmp',
+                                             dir=self.file_path.parent)
+            temp_path = Path(temp_name)
+            os.fchmod(fd, RATES_FILE_MODE)
             
-            with open(temp_path, 'w', encoding='utf-8') as f:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
             
             # Атомарная замена
@@ -79,4 +105,490 @@ class JsonFileStorage(BaseStorage):
 
     def exists(self) -> bool:
         """Проверить существование файла хранилища"""
-        return self.file_path.exists()
\ No newline at end of file
+        return self.file_path.exists()
+
+    def get_version(self) -> Optional[Hashable]:
+        """Версия файла по mtime, размеру и inode (замена файла меняет inode)"""
+        try:
+            stat = self.file_path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class SqliteStorage(BaseStorage):
+    """Хранилище в SQLite (WAL): пользователи, портфели, курсы и история.
+
+    Методы save/load работают с текущим снимком курсов в том же формате,
+    что и JsonFileStorage. Пользователи и кошельки читаются индексными
+    запросами и обновляются построчно в транзакциях.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            hashed_password TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            registration_date TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS migrations (
+            name TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS portfolios (
+            user_id INTEGER PRIMARY KEY,
+            journal_seq INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS wallets (
+            user_id INTEGER NOT NULL,
+            currency_code TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (user_id, currency_code)
+        );
+        CREATE TABLE IF NOT EXISTS rates (
+            pair TEXT PRIMARY KEY,
+            rate REAL NOT NULL,
+            updated_at TEXT,
+            source TEXT
+        );
+        CREATE TABLE IF NOT EXISTS rates_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            meta TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS rate_history (
+            timestamp TEXT NOT NULL,
+            pair TEXT NOT NULL,
+            rate REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rate_history_pair_ts
+            ON rate_history (pair, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_rate_history_ts
+            ON rate_history (timestamp);
+        CREATE TABLE IF NOT EXISTS rate_bars (
+            resolution INTEGER NOT NULL,
+            pair TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (resolution, pair, start)
+        );
+        CREATE TABLE IF NOT EXISTS history_watermarks (
+            resolution INTEGER PRIMARY KEY,
+            until_ms INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._local_writes = 0
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self._SCHEMA)
+            self._migrate()
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка открытия {self.db_path}: {e}") from e
+        logger.debug(f"Инициализировано SQLite хранилище: {self.db_path}")
+
+    def _migrate(self) -> None:
+        """Столбцы свежести пар в базах, созданных до их появления"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(rates)")}
+        for column in ("updated_at", "source"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE rates ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _transaction(self, mode: str = "DEFERRED") -> Iterator[sqlite3.Connection]:
+        """Явная транзакция: чтения внутри видят один снимок базы, а
+        IMMEDIATE сразу берет блокировку записи"""
+        with self._lock:
+            try:
+                self._conn.execute(f"BEGIN {mode}")
+                try:
+                    yield self._conn
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+                self._conn.commit()
+            except sqlite3.Error as e:
+                raise StorageError(f"Ошибка запроса к {self.db_path}: {e}") from e
+
+    def _execute(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Выполнение одного запроса в отдельной транзакции"""
+        try:
+            with self._lock, self._conn:
+                return self._conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка запроса к {self.db_path}: {e}") from e
+
+    # --- Снимок курсов (BaseStorage) ---
+
+    def save(self, data: Dict[str, Any]) -> None:
+        """Замена текущего снимка курсов одной транзакцией"""
+        rates = data.get("rates", {})
+        pairs = data.get("pairs", {})
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM rates")
+                self._conn.executemany(
+                    "INSERT INTO rates (pair, rate, updated_at, source) "
+                    "VALUES (?, ?, ?, ?)",
+                    ((pair, rate, pairs.get(pair, {}).get("updated_at"),
+                      pairs.get(pair, {}).get("source"))
+                     for pair, rate in rates.items())
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rates_meta (id, meta) VALUES (1, ?)",
+                    (json.dumps(data.get("meta", {}), ensure_ascii=False),)
+                )
+            self._local_writes += 1
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка сохранения в {self.db_path}: {e}") from e
+
+    def load(self) -> Dict[str, Any]:
+        """Загрузить текущий снимок курсов"""
+        rows = self._execute("SELECT pair, rate, updated_at, source FROM rates")
+        meta_rows = self._execute("SELECT meta FROM rates_meta WHERE id = 1")
+        if not rows and not meta_rows:
+            return {}
+        return {
+            "meta": json.loads(meta_rows[0][0]) if meta_rows else {},
+            "rates": {pair: rate for pair, rate, _, _ in rows},
+            "pairs": {pair: {"updated_at": updated_at, "source": source}
+                      for pair, _, updated_at, source in rows if updated_at}
+        }
+
+    def get_version(self) -> Optional[Hashable]:
+        """Версия базы: data_version меняют чужие соединения, счетчик - свои"""
+        rows = self._execute("PRAGMA data_version")
+        return (rows[0][0], self._local_writes)
+
+    def append_history(self, timestamp: str, rates: Dict[str, float]) -> None:
+        """Добавление записи истории курсов"""
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO rate_history (timestamp, pair, rate) "
+                    "VALUES (?, ?, ?)",
+                    ((timestamp, pair, rate) for pair, rate in rates.items())
+                )
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка сохранения в {self.db_path}: {e}") from e
+
+    def delete_history_before(self, timestamp: str) -> int:
+        """Удаление записей истории старше timestamp; число удаленных строк"""
+        try:
+            with self._lock, self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM rate_history WHERE timestamp < ?", (timestamp,)
+                )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка запроса к {self.db_path}: {e}") from e
+
+    def iter_history(self, since: str = None,
+                     until: str = None) -> Iterator[Dict[str, Any]]:
+        """Записи истории в порядке времени, сгруппированные по timestamp"""
+        rows = self._execute(
+            "SELECT timestamp, pair, rate FROM rate_history "
+            "WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp",
+            (since or "", until or "\uffff")
+        )
+        entry = None
+        for timestamp, pair, rate in rows:
+            if entry is None or entry["timestamp"] != timestamp:
+                if entry is not None:
+                    yield entry
+                entry = {"timestamp": timestamp, "rates": {}}
+            entry["rates"][pair] = rate
+        if entry is not None:
+            yield entry
+
+    def get_history_series(self, pair: str, since: str = None,
+                           until: str = None) -> List[tuple]:
+        """Пары (timestamp, rate) одной валютной пары в порядке времени"""
+        return self._execute(
+            "SELECT timestamp, rate FROM rate_history WHERE pair = ? "
+            "AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp",
+            (pair, since or "", until or "\uffff")
+        )
+
+    def get_history_value_at(self, pair: str, timestamp: str) -> Optional[tuple]:
+        """Последняя пара (timestamp, rate) не позже timestamp"""
+        rows = self._execute(
+            "SELECT timestamp, rate FROM rate_history WHERE pair = ? "
+            "AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1",
+            (pair, timestamp)
+        )
+        return rows[0] if rows else None
+
+    def get_history_start(self) -> Optional[str]:
+        """Время самой ранней записи истории"""
+        rows = self._execute("SELECT MIN(timestamp) FROM rate_history")
+        return rows[0][0]
+
+    # --- OHLC бары истории ---
+
+    def get_bars(self, resolution: int, pair: Optional[str],
+                 since_ms: Optional[int], until_ms: Optional[int]) -> List[tuple]:
+        """Бары (pair, start, open, high, low, close) уровня за интервал"""
+        query = ("SELECT pair, start, open, high, low, close FROM rate_bars "
+                 "WHERE resolution = ? AND start >= ? AND start <= ?")
+        params = [resolution,
+                  since_ms if since_ms is not None else -2 ** 63,
+                  until_ms if until_ms is not None else 2 ** 63 - 1]
+        if pair is not None:
+            query += " AND pair = ?"
+            params.append(pair)
+        return self._execute(query + " ORDER BY pair, start", tuple(params))
+
+    def get_last_bar(self, resolution: int, pair: str,
+                     at_ms: int) -> Optional[tuple]:
+        """Последний бар пары с началом не позже at_ms"""
+        rows = self._execute(
+            "SELECT start, open, high, low, close FROM rate_bars "
+            "WHERE resolution = ? AND pair = ? AND start <= ? "
+            "ORDER BY start DESC LIMIT 1",
+            (resolution, pair, at_ms)
+        )
+        return rows[0] if rows else None
+
+    def save_bars(self, resolution: int, bars: Iterable[tuple]) -> None:
+        """Запись баров (pair, start, open, high, low, close) с заменой"""
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_bars "
+                    "(resolution, pair, start, open, high, low, close) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((resolution, *bar) for bar in bars)
+                )
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка сохранения в {self.db_path}: {e}") from e
+
+    def delete_bars_before(self, resolution: int, until_ms: int) -> None:
+        """Удаление баров уровня с началом раньше until_ms"""
+        self._execute(
+            "DELETE FROM rate_bars WHERE resolution = ? AND start < ?",
+            (resolution, until_ms)
+        )
+
+    def get_history_watermarks(self) -> Dict[int, int]:
+        """Границы сжатия истории по уровням"""
+        return dict(self._execute(
+            "SELECT resolution, until_ms FROM history_watermarks"
+        ))
+
+    def set_history_watermark(self, resolution: int, until_ms: int) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO history_watermarks (resolution, until_ms) "
+            "VALUES (?, ?)",
+            (resolution, until_ms)
+        )
+
+    # --- Пользователи ---
+
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """Поиск пользователя по уникальному индексу имени"""
+        rows = self._execute(
+            "SELECT user_id, username, hashed_password, salt, registration_date "
+            "FROM users WHERE username = ?",
+            (username,)
+        )
+        if not rows:
+            return None
+        keys = ("user_id", "username", "hashed_password", "salt",
+                "registration_date")
+        return dict(zip(keys, rows[0]))
+
+    def add_user(self, user_data: Dict[str, Any]) -> bool:
+        """Добавление пользователя, False если имя уже занято"""
+        try:
+            self._execute(
+                "INSERT INTO users (user_id, username, hashed_password, salt, "
+                "registration_date) VALUES (?, ?, ?, ?, ?)",
+                (user_data["user_id"], user_data["username"],
+                 user_data["hashed_password"], user_data["salt"],
+                 user_data["registration_date"])
+            )
+        except StorageError as e:
+            if isinstance(e.__cause__, sqlite3.IntegrityError):
+                return False
+            raise
+        return True
+
+    def raise_sequence(self, name: str, value: int) -> None:
+        """Поднятие последовательности не ниже value"""
+        self._execute(
+            "INSERT INTO sequences (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = max(value, excluded.value)",
+            (name, value)
+        )
+
+    def is_migrated(self, name: str) -> bool:
+        """Признак завершенного однократного переноса данных"""
+        return bool(self._execute("SELECT 1 FROM migrations WHERE name = ?",
+                                  (name,)))
+
+    def mark_migrated(self, name: str) -> None:
+        self._execute("INSERT OR IGNORE INTO migrations (name) VALUES (?)", (name,))
+
+    def next_sequence_value(self, name: str) -> int:
+        """Атомарное получение следующего значения последовательности"""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO sequences (name, value) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                    (name,)
+                )
+                row = self._conn.execute(
+                    "SELECT value FROM sequences WHERE name = ?", (name,)
+                ).fetchone()
+                return row[0]
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка запроса к {self.db_path}: {e}") from e
+
+    # --- Портфели ---
+
+    def get_portfolio(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Загрузка портфеля одного пользователя по индексу"""
+        # Одна транзакция: сделка не попадает между чтением строк
+        with self._transaction() as conn:
+            portfolio_rows = conn.execute(
+                "SELECT journal_seq FROM portfolios WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            if not portfolio_rows:
+                return None
+            rows = conn.execute(
+                "SELECT currency_code, balance FROM wallets WHERE user_id = ?",
+                (user_id,)
+            ).fetchall()
+        return {
+            "user_id": user_id,
+            "wallets": {
+                code: {"currency_code": code, "balance": balance}
+                for code, balance in rows
+            },
+            "journal_seq": portfolio_rows[0][0]
+        }
+
+    def save_portfolio(self, portfolio_data: Dict[str, Any]) -> None:
+        """Запись портфеля целиком (создание, перенос) одной транзакцией;
+        сделки изменяют кошельки через apply_trade"""
+        user_id = portfolio_data["user_id"]
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO portfolios (user_id, journal_seq) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE "
+                    "SET journal_seq = excluded.journal_seq",
+                    (user_id, portfolio_data.get("journal_seq", 0))
+                )
+                self._conn.executemany(
+                    "INSERT INTO wallets (user_id, currency_code, balance) "
+                    "VALUES (?, ?, ?) ON CONFLICT(user_id, currency_code) "
+                    "DO UPDATE SET balance = excluded.balance",
+                    ((user_id, code, wallet["balance"])
+                     for code, wallet in portfolio_data["wallets"].items())
+                )
+        except sqlite3.Error as e:
+            raise StorageError(f"Ошибка сохранения в {self.db_path}: {e}") from e
+
+    def apply_trade(self, user_id: int, withdrawal: Optional[Tuple[str, float]],
+                    deposits: List[Tuple[str, float]]) -> None:
+        """Сделка как изменение строк кошельков на дельту в одной транзакции.
+
+        Списание выполняется условным UPDATE по балансу, поэтому
+        параллельные сделки не теряют обновлений и не уводят баланс в минус.
+        """
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO portfolios (user_id) VALUES (?)", (user_id,)
+            )
+            if withdrawal is not None:
+                code, amount = withdrawal
+                cursor = conn.execute(
+                    "UPDATE wallets SET balance = balance - ? "
+                    "WHERE user_id = ? AND currency_code = ? AND balance >= ?",
+                    (amount, user_id, code, amount)
+                )
+                if cursor.rowcount == 0:
+                    row = conn.execute(
+                        "SELECT balance FROM wallets "
+                        "WHERE user_id = ? AND currency_code = ?",
+                        (user_id, code)
+                    ).fetchone()
+                    raise InsufficientFundsError(available=row[0] if row else 0.0,
+                                                 required=amount, code=code)
+            conn.executemany(
+                "INSERT INTO wallets (user_id, currency_code, balance) "
+                "VALUES (?, ?, ?) ON CONFLICT(user_id, currency_code) "
+                "DO UPDATE SET balance = balance + excluded.balance",
+                ((user_id, code, amount) for code, amount in deposits)
+            )
+
+    def iter_portfolios(self) -> Iterator[Dict[str, Any]]:
+        """Перебор всех портфелей одним проходом по индексу user_id"""
+        with self._transaction() as conn:
+            portfolio_rows = conn.execute(
+                "SELECT user_id, journal_seq FROM portfolios ORDER BY user_id"
+            ).fetchall()
+            wallet_rows = conn.execute(
+                "SELECT user_id, currency_code, balance FROM wallets "
+                "ORDER BY user_id"
+            ).fetchall()
+        wallets_by_user: Dict[int, Dict[str, Any]] = {}
+        for user_id, code, balance in wallet_rows:
+            wallets_by_user.setdefault(user_id, {})[code] = {
+                "currency_code": code, "balance": balance
+            }
+        for user_id, journal_seq in portfolio_rows:
+            yield {
+                "user_id": user_id,
+                "wallets": wallets_by_user.get(user_id, {}),
+                "journal_seq": journal_seq
+            }
+
+    def close(self) -> None:
+        """Закрытие соединения с базой"""
+        with self._lock:
+            self._conn.close()
+
+
+_sqlite_storages: Dict[str, SqliteStorage] = {}
+
+
+def get_sqlite_storage(db_path: str = None) -> SqliteStorage:
+    """Общий для процесса экземпляр SqliteStorage для указанного файла"""
+    db_path = db_path or settings.get("sqlite_path")
+    if db_path not in _sqlite_storages:
+        _sqlite_storages[db_path] = SqliteStorage(db_path)
+    return _sqlite_storages[db_path]
+
+
+def create_rates_storage() -> BaseStorage:
+    """Хранилище снимка курсов согласно storage_backend из настроек"""
+    if settings.get("storage_backend") == STORAGE_BACKEND_SQLITE:
+        return get_sqlite_storage()
+    return JsonFileStorage(parser_config.RATES_FILE_PATH)
+
+
+_rates_storage: Optional[BaseStorage] = None
+
+
+def get_rates_storage() -> BaseStorage:
+    """Общее для процесса хранилище снимка курсов"""
+    global _rates_storage
+    if _rates_storage is None:
+        _rates_storage = create_rates_storage()
+    return _rates_storage
@@ -1,72 +1,383 @@
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime, timezone
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from valutatrade_hub.core.exceptions import ApiRequestError
-from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.api_clients import (
+    AsyncBaseApiClient,
+    BaseApiClient,
+)
+from valutatrade_hub.parser_service.async_http import AsyncHttpSession
 from valutatrade_hub.parser_service.config import parser_config
-from valutatrade_hub.parser_service.storage import BaseStorage, JsonFileStorage
+from valutatrade_hub.parser_service.constants import (
+    CIRCUIT_HALF_OPEN,
+    MAX_FETCH_WORKERS,
+    RETRY_ATTEMPTS,
+    UPDATE_DEADLINE,
+)
+from valutatrade_hub.parser_service.history import (
+    BaseHistoryStore,
+    get_history_store,
+)
+from valutatrade_hub.parser_service.http_session import close_shared_session
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+from valutatrade_hub.parser_service.resilience import CircuitBreaker, backoff_delay
+from valutatrade_hub.parser_service.storage import BaseStorage
 
 logger = logging.getLogger(__name__)
 
 
+def client_source(client: BaseApiClient) -> str:
+    """Имя источника клиента для метаданных пар"""
+    return client.source or client.__class__.__name__
+
+
+def pair_expires_at(info: Dict[str, str]) -> float:
+    """Момент устаревания пары по времени подтверждения и TTL источника"""
+    try:
+        updated_at = datetime.fromisoformat(info["updated_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+    return updated_at + parser_config.source_ttl_seconds(info.get("source"))
+
+
+def pairs_expire_at(pairs: Dict[str, Dict[str, str]]) -> float:
+    """Момент устаревания самой старой пары; 0 - свежесть неизвестна"""
+    return min((pair_expires_at(info) for info in pairs.values()), default=0.0)
+
+
 class RatesUpdater:
     """Координатор процесса обновления курсов валют."""
     
-    def __init__(self, api_clients: List[BaseApiClient], storage: BaseStorage):
+    def __init__(self, api_clients: List[BaseApiClient], storage: BaseStorage,
+                 post_update_stages: List[Callable[[RatesMatrix], object]] = None,
+                 history_store: BaseHistoryStore = None,
+                 change_epsilon: float = 0.0,
+                 pair_epsilons: Dict[str, float] = None):
         self.api_clients = api_clients
         self.storage = storage
+        self.history_store = history_store or get_history_store()
+        self.post_update_stages = post_update_stages or []
+        self.change_epsilon = change_epsilon
+        self.pair_epsilons = dict(pair_epsilons or {})
+        self.last_matrix: Optional[RatesMatrix] = None
+        self.last_run_stats: Dict[str, dict] = {}
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {
+            client.__class__.__name__: CircuitBreaker(client.__class__.__name__)
+            for client in api_clients
+        }
         logger.info(f"RatesUpdater инициализирован с {len(api_clients)} клиентами")
 
-    def run_update(self) -> bool:
-        """Основной метод выполнения обновления курсов."""
+    def run_update(self, force: bool = False,
+                   clients: List[BaseApiClient] = None) -> bool:
+        """Основной метод выполнения обновления курсов.
+
+        Опрашиваются только источники, у пар которых истек собственный
+        срок свежести (force - все источники); clients ограничивает опрос
+        частью клиентов (например, по расписанию планировщика). Клиенты опрашиваются
+        параллельно в ограниченном пуле потоков с общим дедлайном, в
+        пределах которого неудачные запросы повторяются. Курсы каждого
+        клиента публикуются сразу по получении, поэтому медленный
+        источник не задерживает быстрый.
+
+        Для каждой пары хранятся время последнего подтверждения и
+        источник. Хранилище перезаписывается, только если курсы
+        изменились или подтверждены пары с истекающим сроком; в историю
+        пишутся только изменившиеся пары.
+        """
         logger.info("Запуск обновления курсов валют")
+
+        published_rates, published_pairs = self._load_published()
+        clients = self._select_clients(published_pairs, force, clients)
+        self.last_run_stats = {}
+        if not clients:
+            logger.info("Курсы всех источников свежие, опрос не требуется")
+            return True
         
         all_rates = {}
+        changed_rates = {}
+        republished = False
         successful_clients = 0
-        
-        for i, client in enumerate(self.api_clients):
-            client_name = client.__class__.__name__
-            logger.info(f"Опрос клиента {i+1}/{len(self.api_clients)}: {client_name}")
-            
+        publish_failed = False
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(MAX_FETCH_WORKERS, len(clients))),
+            thread_name_prefix="rates-fetch"
+        )
+        deadline = time.monotonic() + UPDATE_DEADLINE
+        futures = {
+            executor.submit(self._fetch_client, client, deadline): client
+            for client in clients
+        }
+        try:
+            for future in as_completed(futures, timeout=UPDATE_DEADLINE):
+                client = futures[future]
+                rates, stats = future.result()
+                self.last_run_stats[client.__class__.__name__] = stats
+                if rates is None:
+                    continue
+
+                successful_clients += 1
+                all_rates.update(rates)
+                changed = self._merge_rates(published_rates, published_pairs,
+                                            client, rates)
+                if changed is None:
+                    continue
+                republished = True
+                changed_rates.update(changed)
+                if not self._publish(published_rates, published_pairs):
+                    publish_failed = True
+
+        except FuturesTimeoutError:
+            self._record_timeouts(client for future, client in futures.items()
+                                  if not future.done())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if not self._check_results(all_rates, changed_rates, successful_clients,
+                                   len(clients), publish_failed):
+            return False
+        # Снимки публикуются при первом обновлении процесса даже без изменений
+        if not republished and self.last_matrix is not None:
+            return True
+
+        self._complete_update(published_rates, published_pairs, changed_rates)
+        return True
+
+    def compact_history(self) -> int:
+        """Инкрементальное сжатие истории курсов в OHLC бары"""
+        try:
+            return self.history_store.compact()
+        except Exception as e:
+            logger.warning(f"Не удалось сжать историю курсов: {e}")
+            return 0
+
+    def close(self) -> None:
+        """Закрытие клиентов и общего пула HTTP соединений."""
+        for client in self.api_clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии {client.__class__.__name__}: {e}")
+        close_shared_session()
+
+    def _fetch_client(self, client: BaseApiClient,
+                      deadline: float) -> Tuple[Optional[Dict], dict]:
+        """Опрос одного клиента с повторами до дедлайна и замером задержки.
+
+        Повторы идут с экспоненциальной паузой и джиттером; источник с
+        разомкнутым предохранителем не опрашивается, пробный запрос
+        (half-open) не повторяется.
+        """
+        client_name = client.__class__.__name__
+        attempts = self._fetch_attempts(client)
+        if not attempts:
+            return None, {"status": "circuit_open", "latency": 0.0}
+
+        logger.info(f"Опрос клиента {client_name}")
+        started = time.monotonic()
+        rates, error = None, None
+        for attempt in range(1, attempts + 1):
             try:
                 rates = client.fetch_rates()
-                all_rates.update(rates)
-                successful_clients += 1
-                logger.info(f"Клиент {client_name} успешно "
-                            f"предоставил {len(rates)} курсов")
-                
+                break
             except ApiRequestError as e:
-                logger.error(f"Ошибка при опросе {client_name}: {e}")
-                continue
+                logger.error(f"Ошибка при опросе {client_name} "
+                             f"(попытка {attempt}/{attempts}): {e}")
+                error = e
             except Exception as e:
                 logger.error(f"Неожиданная ошибка при опросе {client_name}: {e}")
-                continue
-        
+                error = e
+                break
+
+            delay = self._retry_delay(client, attempt, attempts, deadline)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        return self._fetch_result(client, rates, error, attempt,
+                                  time.monotonic() - started)
+
+    def _fetch_attempts(self, client) -> int:
+        """Число попыток опроса клиента; 0 - источник отключен предохранителем"""
+        client_name = client.__class__.__name__
+        breaker = self.circuit_breakers.setdefault(client_name,
+                                                   CircuitBreaker(client_name))
+        if not breaker.allow_request():
+            logger.info(f"Клиент {client_name} пропущен: источник отключен")
+            return 0
+        return 1 if breaker.state == CIRCUIT_HALF_OPEN else RETRY_ATTEMPTS
+
+    @staticmethod
+    def _retry_delay(client, attempt: int, attempts: int,
+                     deadline: float) -> Optional[float]:
+        """Пауза перед повтором; None, если попытки исчерпаны или повтор
+        с полным таймаутом запроса не успеет до дедлайна"""
+        if attempt == attempts:
+            return None
+        delay = backoff_delay(attempt)
+        timeout = getattr(client, 'timeout', 0)
+        if time.monotonic() + delay + timeout >= deadline:
+            return None
+        return delay
+
+    def _fetch_result(self, client, rates: Optional[Dict[str, float]],
+                      error: Optional[Exception], attempts: int,
+                      latency: float) -> Tuple[Optional[Dict], dict]:
+        """Учет исхода опроса в предохранителе и статистика клиента"""
+        client_name = client.__class__.__name__
+        breaker = self.circuit_breakers[client_name]
+        if rates is None:
+            breaker.record_failure()
+            return None, {"status": "error", "error": str(error),
+                          "attempts": attempts, "latency": latency}
+
+        breaker.record_success()
+        logger.info(f"Клиент {client_name} успешно предоставил {len(rates)} "
+                    f"курсов за {latency:.2f} с")
+        stats = {"status": "ok", "rates_count": len(rates),
+                 "attempts": attempts, "latency": latency}
+        response_cache = getattr(client, 'response_cache', None)
+        if response_cache is not None:
+            stats["cache"] = response_cache.stats()
+        return rates, stats
+
+    def _select_clients(self, pairs: Dict[str, Dict[str, str]], force: bool,
+                        clients: List[BaseApiClient] = None) -> List[BaseApiClient]:
+        """Клиенты для опроса: все (force) или с устаревшими парами"""
+        return [client for client in
+                (self.api_clients if clients is None else clients)
+                if force or self._is_due(client, pairs)]
+
+    def _merge_rates(self, published_rates: Dict[str, float],
+                     published_pairs: Dict[str, Dict[str, str]],
+                     client, rates: Dict[str, float]) -> Optional[Dict[str, float]]:
+        """Слияние курсов клиента с опубликованными.
+
+        Возвращает изменившиеся пары или None, если сохранять нечего.
+        """
+        changed = self._changed_rates(published_rates, rates)
+        lapsed = self._confirm_pairs(published_pairs, client, rates)
+        if not changed and not lapsed:
+            return None
+        published_rates.update(changed)
+        return changed
+
+    def _record_timeouts(self, clients: Iterable[BaseApiClient]) -> None:
+        for client in clients:
+            client_name = client.__class__.__name__
+            self.last_run_stats[client_name] = {
+                "status": "timeout", "latency": UPDATE_DEADLINE
+            }
+            logger.error(f"Клиент {client_name} не ответил "
+                         f"за {UPDATE_DEADLINE} секунд")
+
+    @staticmethod
+    def _check_results(all_rates: Dict[str, float], changed_rates: Dict[str, float],
+                       successful_clients: int, total_clients: int,
+                       publish_failed: bool) -> bool:
+        """Итог опроса: False, если курсов нет или сохранить их не удалось"""
         if not all_rates:
             logger.error("Не удалось получить данные ни от одного клиента")
             return False
-        
+
         logger.info(f"Успешно получено {len(all_rates)} курсов от"
-                    f" {successful_clients}/{len(self.api_clients)} клиентов")
-        
-        # Подготовка и сохранение основных данных
-        result_data = self._prepare_result_data(all_rates)
-        
+                    f" {successful_clients}/{total_clients} клиентов")
+        if publish_failed:
+            return False
+
+        logger.info(f"Изменилось {len(changed_rates)} из {len(all_rates)} курсов")
+        return True
+
+    def _complete_update(self, rates: Dict[str, float],
+                         pairs: Dict[str, Dict[str, str]],
+                         changed_rates: Dict[str, float]) -> None:
+        """Матрица кросс-курсов, дельта истории и этапы после обновления"""
+        # Матрица кросс-курсов строится один раз на обновление
+        self.last_matrix = RatesMatrix.from_rates(rates)
+        self.last_matrix.expires_at = pairs_expire_at(pairs)
+
+        # В историю пишутся только изменившиеся пары (дельта)
+        if changed_rates:
+            self._save_to_history(changed_rates)
+
+        self._run_post_update_stages()
+
+    def _changed_rates(self, published: Dict[str, float],
+                       rates: Dict[str, float]) -> Dict[str, float]:
+        """Пары, курс которых отличается от опубликованного больше чем на
+        относительный epsilon (свой для пары или общий)"""
+        changed = {}
+        for pair, rate in rates.items():
+            previous = published.get(pair)
+            epsilon = self.pair_epsilons.get(pair, self.change_epsilon)
+            if previous is None or abs(rate - previous) > epsilon * abs(previous):
+                changed[pair] = rate
+        return changed
+
+    def _is_due(self, client: BaseApiClient,
+                pairs: Dict[str, Dict[str, str]]) -> bool:
+        """Истек ли срок свежести хотя бы одной пары источника клиента"""
+        source = client_source(client)
+        expires = [pair_expires_at(info) for info in pairs.values()
+                   if info.get("source") == source]
+        return not expires or min(expires) <= time.time()
+
+    @staticmethod
+    def _confirm_pairs(pairs: Dict[str, Dict[str, str]], client: BaseApiClient,
+                       rates: Dict[str, float]) -> bool:
+        """Отметка подтверждения пар клиента; True, если какой-то из них
+        осталось меньше половины срока свежести и подтверждение нужно
+        сохранить (иначе опрос по расписанию чуть раньше срока не
+        продлевал бы сохраненную свежесть)"""
+        now = time.time()
+        updated_at = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        source = client_source(client)
+        margin = parser_config.source_ttl_seconds(source) / 2
+        lapsed = False
+        for pair in rates:
+            info = pairs.get(pair)
+            if info is None or pair_expires_at(info) - now < margin:
+                lapsed = True
+            pairs[pair] = {"updated_at": updated_at, "source": source}
+        return lapsed
+
+    def _load_published(self) -> Tuple[Dict[str, float], Dict[str, Dict[str, str]]]:
+        """Последние опубликованные курсы и свежесть пар, поверх которых
+        сливаются новые"""
+        try:
+            data = self.storage.load() or {}
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать опубликованные курсы: {e}")
+            return {}, {}
+        return dict(data.get("rates", {})), dict(data.get("pairs", {}))
+
+    def _publish(self, rates: Dict[str, float],
+                 pairs: Dict[str, Dict[str, str]]) -> bool:
+        """Сохранение текущего набора курсов в хранилище"""
         try:
-            self.storage.save(result_data)
+            self.storage.save(self._prepare_result_data(rates, pairs))
             logger.info("Данные успешно сохранены в хранилище")
-            
-            # Сохранение в историю
-            self._save_to_history(all_rates)
-            
             return True
-            
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных: {e}")
             return False
+
+    def _run_post_update_stages(self) -> None:
+        """Дополнительные этапы после публикации курсов (например, переоценка)"""
+        for stage in self.post_update_stages:
+            stage_name = getattr(stage, '__qualname__', repr(stage))
+            try:
+                stage(self.last_matrix)
+            except Exception as e:
+                logger.error(f"Ошибка на этапе после обновления {stage_name}: {e}")
         
-    def _prepare_result_data(self, rates: Dict[str, float]) -> Dict:
+    def _prepare_result_data(self, rates: Dict[str, float],
+                             pairs: Dict[str, Dict[str, str]]) -> Dict:
         """Подготовка итогового объекта данных с метаданными."""
         current_time = datetime.now(timezone.utc).isoformat()
         
@@ -76,28 +387,168 @@ class RatesUpdater:
                 "last_refresh": current_time,
                 "rates_count": len(rates)
             },
-            "rates": rates
+            "rates": rates,
+            "pairs": {pair: pairs[pair] for pair in rates if pair in pairs}
         }
         
     def _save_to_history(self, rates: Dict[str, float]) -> None:
-        """Сохранение исторических данных"""
+        """Дозапись записи в историю курсов"""
         try:
-            history_storage = JsonFileStorage(parser_config.HISTORY_FILE_PATH)
-            history_data = history_storage.load() or {"history": []}
-            
-            history_entry = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "rates": rates
-            }
-            
-            history_data["history"].append(history_entry)
-            
-            # Ограничение размера истории (последние 1000 записей)
-            if len(history_data["history"]) > 1000:
-                history_data["history"] = history_data["history"][-1000:]
-            
-            history_storage.save(history_data)
+            self.history_store.append(datetime.now(timezone.utc), rates)
             logger.debug("Исторические данные сохранены")
-            
         except Exception as e:
-            logger.warning(f"Не удалось сохранить исторические данные: {e}")
\ No newline at end of file
+            logger.warning(f"Не удалось сохранить исторические данные: {e}")
+
+
+class AsyncRatesUpdater(RatesUpdater):
+    """Асинхронный вариант RatesUpdater для клиентов AsyncBaseApiClient.
+
+    Клиенты опрашиваются конкурентно задачами asyncio в одном потоке, а
+    чтение и запись хранилища, история и этапы после обновления
+    выполняются в отдельном потоке хранилища, чтобы не блокировать цикл
+    событий. Один процесс обслуживает любое число источников без потока
+    на каждый.
+    """
+
+    def __init__(self, api_clients: List[AsyncBaseApiClient], storage: BaseStorage,
+                 post_update_stages: List[Callable[[RatesMatrix], object]] = None,
+                 history_store: BaseHistoryStore = None,
+                 change_epsilon: float = 0.0,
+                 pair_epsilons: Dict[str, float] = None,
+                 session: AsyncHttpSession = None):
+        super().__init__(api_clients, storage, post_update_stages, history_store,
+                         change_epsilon, pair_epsilons)
+        self.session = session
+        # Один поток: записи в хранилище выполняются по порядку
+        self._storage_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rates-storage"
+        )
+
+    async def run_update(self, force: bool = False,
+                         clients: List[AsyncBaseApiClient] = None) -> bool:
+        """Основной метод выполнения обновления курсов (см. RatesUpdater).
+
+        Опросы, не завершившиеся к общему дедлайну, отменяются.
+        """
+        logger.info("Запуск обновления курсов валют")
+
+        published_rates, published_pairs = await self._in_storage_thread(
+            self._load_published
+        )
+        clients = self._select_clients(published_pairs, force, clients)
+        self.last_run_stats = {}
+        if not clients:
+            logger.info("Курсы всех источников свежие, опрос не требуется")
+            return True
+
+        all_rates = {}
+        changed_rates = {}
+        republished = False
+        successful_clients = 0
+        publish_failed = False
+
+        deadline = time.monotonic() + UPDATE_DEADLINE
+        tasks = {
+            asyncio.create_task(self._fetch_client(client, deadline)): client
+            for client in clients
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    client = tasks[task]
+                    rates, stats = task.result()
+                    self.last_run_stats[client.__class__.__name__] = stats
+                    if rates is None:
+                        continue
+
+                    successful_clients += 1
+                    all_rates.update(rates)
+                    changed = self._merge_rates(published_rates, published_pairs,
+                                                client, rates)
+                    if changed is None:
+                        continue
+                    republished = True
+                    changed_rates.update(changed)
+                    # Копии: следующий клиент дополняет курсы, пока идет запись
+                    if not await self._in_storage_thread(
+                            self._publish, dict(published_rates),
+                            dict(published_pairs)):
+                        publish_failed = True
+        finally:
+            for task in pending:
+                task.cancel()
+            # Отмененный опрос не дойдет до _fetch_result: неудача
+            # учитывается в предохранителе здесь
+            timed_out = [tasks[task] for task in pending]
+            for client in timed_out:
+                self.circuit_breakers[client.__class__.__name__].record_failure()
+            self._record_timeouts(timed_out)
+
+        if not self._check_results(all_rates, changed_rates, successful_clients,
+                                   len(clients), publish_failed):
+            return False
+        if not republished and self.last_matrix is not None:
+            return True
+
+        await self._in_storage_thread(self._complete_update, published_rates,
+                                      published_pairs, changed_rates)
+        return True
+
+    async def compact_history(self) -> int:
+        """Сжатие истории курсов в потоке хранилища"""
+        return await self._in_storage_thread(super().compact_history)
+
+    async def close(self) -> None:
+        """Закрытие клиентов, HTTP сессии и потока хранилища."""
+        for client in self.api_clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии {client.__class__.__name__}: {e}")
+        if self.session is not None:
+            await self.session.close()
+        self._storage_executor.shutdown(wait=True)
+
+    async def _fetch_client(self, client: AsyncBaseApiClient,
+                            deadline: float) -> Tuple[Optional[Dict], dict]:
+        """Опрос одного клиента с повторами до дедлайна (см. RatesUpdater)."""
+        client_name = client.__class__.__name__
+        attempts = self._fetch_attempts(client)
+        if not attempts:
+            return None, {"status": "circuit_open", "latency": 0.0}
+
+        logger.info(f"Опрос клиента {client_name}")
+        started = time.monotonic()
+        rates, error = None, None
+        for attempt in range(1, attempts + 1):
+            try:
+                rates = await client.fetch_rates()
+                break
+            except ApiRequestError as e:
+                logger.error(f"Ошибка при опросе {client_name} "
+                             f"(попытка {attempt}/{attempts}): {e}")
+                error = e
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при опросе {client_name}: {e}")
+                error = e
+                break
+
+            delay = self._retry_delay(client, attempt, attempts, deadline)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        return self._fetch_result(client, rates, error, attempt,
+                                  time.monotonic() - started)
+
+    async def _in_storage_thread(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._storage_executor, func, *args
+        )
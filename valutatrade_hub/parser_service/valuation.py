@@ -0,0 +1,62 @@
+import logging
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Sequence
+
+from valutatrade_hub.core.models import Portfolio
+from valutatrade_hub.parser_service.rates_matrix import RatesMatrix
+from valutatrade_hub.parser_service.storage import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+
+class PortfolioValuationJob:
+    """Пакетная переоценка всех портфелей после обновления курсов.
+
+    Балансы всех пользователей собираются в матрицу пользователи × валюты
+    (построчно в одном array('d')), которая умножается на вектор курсов
+    каждой базовой валюты. Результат сохраняется целиком в storage.
+    """
+
+    def __init__(self, portfolios_source: Callable[[], Iterable[Portfolio]],
+                 storage: BaseStorage, base_currencies: Sequence[str]):
+        self.portfolios_source = portfolios_source
+        self.storage = storage
+        self.base_currencies = tuple(base_currencies)
+
+    def run(self, matrix: RatesMatrix) -> int:
+        """Переоценка всех портфелей по матрице курсов; число пользователей"""
+        user_ids = []
+        balances = array('d')
+        row = array('d', bytes(8 * matrix.size))
+        for portfolio in self.portfolios_source():
+            user_row = array('d', row)
+            for code, wallet in portfolio.wallets.items():
+                i = matrix.index.get(code)
+                if i is not None:
+                    user_row[i] = wallet.balance
+            balances.extend(user_row)
+            user_ids.append(portfolio.user_id)
+
+        valuations: Dict[str, Dict[str, float]] = {
+            str(user_id): {} for user_id in user_ids
+        }
+        for base_currency in self.base_currencies:
+            column = matrix.column(base_currency)
+            for n, user_id in enumerate(user_ids):
+                start = n * matrix.size
+                user_row = balances[start:start + matrix.size]
+                valuations[str(user_id)][base_currency] = matrix.dot(user_row, column)
+
+        self.storage.save({
+            "meta": {
+                "valued_at": datetime.now(timezone.utc).isoformat(),
+                "base_currencies": list(self.base_currencies),
+                "users_count": len(user_ids)
+            },
+            "valuations": valuations
+        })
+        logger.info(f"Переоценено {len(user_ids)} портфелей в "
+                    f"{', '.join(self.base_currencies)}")
+        return len(user_ids)
+